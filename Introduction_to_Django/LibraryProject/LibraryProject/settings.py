@@ -10,11 +10,17 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The repository root holds shared/, the modules every project uses
+REPO_DIR = BASE_DIR.parents[1]
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -37,10 +43,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'shared',
     'bookshelf',  # Added this line
 ]
 
 MIDDLEWARE = [
+    'shared.middleware.RequestMetricsMiddleware',
+    'shared.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +89,13 @@ DATABASES = {
     }
 }
 
+# Read replicas (shared.replicas): list their aliases here, e.g.
+# DATABASES['replica1'] = {...} and DATABASE_REPLICAS = ['replica1']
+DATABASE_ROUTERS = ['shared.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+# Safe requests read from default for this long after the client writes
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -121,3 +137,27 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Request metrics
+# RequestMetricsMiddleware samples REQUEST_METRICS_SAMPLE_RATE of requests
+# (default: all of them with DEBUG, 1% otherwise) and logs one JSON line each.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'request_metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Startup profile (manage.py startup_profile): modules a new worker must not
+# import while it boots; `startup_profile --check` fails when one is
+STARTUP_LAZY_MODULES = ['PIL', 'rest_framework']
@@ -0,0 +1,12 @@
+"""
+Settings for the test suite.
+
+`manage.py test` uses them unless DJANGO_SETTINGS_MODULE says otherwise.
+Other runners need DJANGO_SETTINGS_MODULE=advanced_api_project.test_settings
+(with pytest-django, in pytest.ini).
+"""
+from .settings import *
+
+
+# Fail the test when a view repeats the same query per row (N+1)
+REQUEST_METRICS_N_PLUS_ONE = 'raise'
@@ -6,7 +6,10 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'advanced_api_project.settings')
+    # The test suite has its own settings module; other runners select it
+    # through DJANGO_SETTINGS_MODULE
+    settings_module = 'advanced_api_project.test_settings' if sys.argv[1:2] == ['test'] else 'advanced_api_project.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
@@ -15,6 +15,8 @@ from .forms import PostForm, CommentForm
 
 class PostListView(ListView):
     model = Post
+    # Templates show each post's author and tags
+    queryset = Post.objects.select_related('author').prefetch_related('tags')
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
     ordering = ['-published_date']
@@ -22,6 +24,7 @@ class PostListView(ListView):
 
 class PostDetailView(DetailView):
     model = Post
+    queryset = Post.objects.select_related('author').prefetch_related('tags', 'comments__author')
     template_name = 'blog/post_detail.html'
 
 class PostCreateView(LoginRequiredMixin, CreateView):
@@ -55,7 +58,7 @@ class PostDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 def search_posts(request):
     query = request.GET.get('q', '')
-    posts = Post.objects.all()
+    posts = Post.objects.select_related('author').prefetch_related('tags')
     
     if query:
         posts = posts.filter(
@@ -73,7 +76,11 @@ class PostByTagListView(ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return Post.objects.filter(tags__slug=self.kwargs.get('tag_slug'))
+        return (
+            Post.objects.filter(tags__slug=self.kwargs.get('tag_slug'))
+            .select_related('author')
+            .prefetch_related('tags')
+        )
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
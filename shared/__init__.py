@@ -0,0 +1,13 @@
+"""
+Modules every Django project in this repository uses.
+
+Each project's settings put the repository root on sys.path and list
+'shared' in INSTALLED_APPS, for the management command:
+
+- middleware: RequestMetricsMiddleware, per-request query and timing
+  metrics and the N+1 guard.
+- replicas: ReplicaRouter and ReplicaRoutingMiddleware, read replica routing.
+- renderers: ORJSONRenderer and ORJSONParser, for the DRF projects.
+- fields: LazyImageField.
+- startup: the startup profile behind `manage.py startup_profile`.
+"""
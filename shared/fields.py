@@ -0,0 +1,27 @@
+"""
+Model fields that keep heavy libraries out of startup.
+"""
+from importlib.util import find_spec
+
+from django.db import models
+
+
+class LazyImageField(models.ImageField):
+    """
+    ImageField whose system check looks Pillow up without importing it.
+
+    Django's check imports PIL.Image, so every manage.py command pays for
+    Pillow before doing its work. Pillow is only needed to read an uploaded
+    image, and the field imports it then. Migrations record a plain
+    ImageField: the column and the form field are the same.
+    """
+
+    def _check_image_library_installed(self):
+        if find_spec('PIL') is None:
+            # Reports the missing library
+            return super()._check_image_library_installed()
+        return []
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        return name, 'django.db.models.ImageField', args, kwargs
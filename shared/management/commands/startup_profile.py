@@ -0,0 +1,75 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shared import startup
+
+
+class Command(BaseCommand):
+    help = (
+        'Boot the project in fresh interpreters, the way a new worker starts, '
+        'and report where the time goes: each boot phase, the slowest module '
+        'imports and each app\'s ready().'
+    )
+    # The profiled boots run the checks themselves
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Boots to run; the median one is reported.')
+        parser.add_argument('--top', type=int, default=15, help='Modules to list by cumulative and by self time.')
+        parser.add_argument('--json', action='store_true', help='Print the whole profile as one JSON object.')
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Fail when boot imports one of STARTUP_LAZY_MODULES.',
+        )
+        parser.add_argument('--budget', type=float, help='Fail when boot takes longer than this many ms.')
+
+    def handle(self, *args, **options):
+        try:
+            profile = startup.profile(settings.SETTINGS_MODULE, settings.BASE_DIR, repeat=max(options['repeat'], 1))
+        except subprocess.CalledProcessError as exc:
+            raise CommandError(f'The profiled boot failed:\n{exc.stderr.strip()}')
+        lazy = startup.imported_lazy_modules(profile['modules'], getattr(settings, 'STARTUP_LAZY_MODULES', ()))
+
+        if options['json']:
+            self.stdout.write(json.dumps({**profile, 'imported_lazy_modules': lazy}))
+        else:
+            self.report(profile, lazy, options['top'])
+
+        if options['check'] and lazy:
+            raise CommandError(f'Boot imported lazy modules: {", ".join(sorted(lazy))}')
+        if options['budget'] is not None and profile['boot_ms'] > options['budget']:
+            raise CommandError(f'Boot took {profile["boot_ms"]:.1f} ms, over the {options["budget"]:.1f} ms budget')
+
+    def report(self, profile, lazy, top):
+        phases = profile['phases']
+        runs = profile['runs']
+        self.stdout.write(
+            f'Boot: {profile["boot_ms"]:.1f} ms '
+            f'(setup {phases["setup"]:.1f}, wsgi {phases["wsgi"]:.1f}, urls {phases["urls"]:.1f}), '
+            f'then checks {phases["checks"]:.1f} ms; median of {len(runs["boot_ms"])} boots, '
+            f'{runs["wall_ms"]:.0f} ms wall with interpreter start'
+        )
+        if profile['dont_write_bytecode']:
+            self.stdout.write(self.style.WARNING(
+                'PYTHONDONTWRITEBYTECODE is set: import times include compiling the modules that have no .pyc.'
+            ))
+        modules = profile['modules']
+        for key, title in (('cumulative_ms', 'cumulative'), ('self_ms', 'self')):
+            self.stdout.write(f'\nSlowest imports by {title} time:')
+            for name in sorted(modules, key=lambda name: -modules[name][key])[:top]:
+                timing = modules[name]
+                self.stdout.write(
+                    f'  {timing["cumulative_ms"]:8.2f} cumulative {timing["self_ms"]:7.2f} self  '
+                    f'{name}  <- {timing["imported_by"]}'
+                )
+        self.stdout.write('\nSelf time by package:')
+        for package, total in list(startup.by_package(modules).items())[:top]:
+            self.stdout.write(f'  {total:8.2f}  {package}')
+        self.stdout.write('\nAppConfig.ready():')
+        for label, elapsed in sorted(profile['apps'].items(), key=lambda item: -item[1]):
+            self.stdout.write(f'  {elapsed:8.2f}  {label}')
+        for name, importer in lazy.items():
+            self.stdout.write(self.style.WARNING(f'\nLazy module {name} imported at boot by {importer}'))
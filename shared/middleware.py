@@ -0,0 +1,337 @@
+"""
+Per-request query and timing instrumentation.
+
+RequestMetricsMiddleware records, for a sample of requests, the number of SQL
+queries, total SQL time, repeated query shapes (the usual sign of an N+1),
+time spent in DRF serializers and time spent rendering the response. The
+numbers are returned in a ``Server-Timing`` header and logged as one JSON line
+on the ``request_metrics`` logger. It runs in sync or async mode, whichever
+the rest of the stack uses, so async views stay on the event loop.
+
+It doubles as an N+1 guard for every view: repeated query shapes are either
+logged with the call stack that issued them ("report") or raised as
+NPlusOneError so the test fails ("raise"). New views are guarded without
+being listed anywhere. A view that repeats a query on purpose opts out with
+the @n_plus_one_exempt decorator, or `n_plus_one_exempt = True` on its class.
+
+Settings:
+    REQUEST_METRICS_SAMPLE_RATE  fraction of requests to instrument
+                                 (default 1.0 with DEBUG, else 0.01)
+    REQUEST_METRICS_DUPLICATE_THRESHOLD  executions of one query shape that
+                                 count as a duplicate (default 2)
+    REQUEST_METRICS_N_PLUS_ONE   None (default), "report" or "raise"; "raise"
+                                 instruments every request regardless of sampling
+    REQUEST_METRICS_N_PLUS_ONE_ALLOWLIST  view names, or regexes searched in
+                                 the query shape, that are never reported
+"""
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger('request_metrics')
+
+# Metrics of the request being handled; None when the request is not sampled.
+current_metrics = contextvars.ContextVar('current_metrics', default=None)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(AssertionError):
+    """
+    A guarded view ran the same query shape repeatedly within one request.
+    """
+
+
+def fingerprint(sql):
+    """
+    Reduce a query to its shape: literals and IN-list lengths are dropped,
+    so `WHERE id = 1` and `WHERE id = 2` fingerprint the same.
+    """
+    sql = _LITERALS.sub('?', sql)
+    sql = _IN_LISTS.sub('IN (...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """
+    Counters collected while one request is handled.
+    """
+
+    def __init__(self, stack_threshold=None):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.shapes = Counter()
+        self.stacks = {}
+        self.stack_threshold = stack_threshold
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.guarded = False
+        self.sampled = False
+        self._serializer_depth = 0
+
+    def record_query(self, sql, duration, alias=DEFAULT_DB_ALIAS):
+        self.query_count += 1
+        self.sql_time += duration
+        shape = fingerprint(sql)
+        # The same query on each database shard is a fan-out, not a repeat
+        if alias != DEFAULT_DB_ALIAS:
+            shape = f'[{alias}] {shape}'
+        self.shapes[shape] += 1
+        # Keep the stack of the first repeat; that is where the loop lives.
+        if self.shapes[shape] == self.stack_threshold:
+            self.stacks[shape] = project_stack()
+
+    def duplicates(self, threshold=2):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.2f};desc="{self.query_count} queries"',
+            f'serialize;dur={self.serializer_time * 1000:.2f}',
+            f'render;dur={self.render_time * 1000:.2f}',
+            f'total;dur={self.total_time * 1000:.2f}',
+        ])
+
+
+def _is_project_frame(frame):
+    return (
+        frame.filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    )
+
+
+def project_stack():
+    """
+    The current call stack: frames from this project's code, followed by the
+    library frames below the innermost of them (e.g. the serializer field that
+    lazily loaded a relation), without the database layer itself.
+    """
+    frames = traceback.extract_stack()[:-3]
+    project = [index for index, frame in enumerate(frames) if _is_project_frame(frame)]
+    innermost = project[-1] if project else -1
+    return [frames[index] for index in project] + [
+        frame for frame in frames[innermost + 1:]
+        if '/django/db/' not in frame.filename and frame.filename != __file__
+    ]
+
+
+def n_plus_one_exempt(view):
+    """
+    Exempt a view function, a view class or a viewset action from the N+1
+    guard.
+    """
+    view.n_plus_one_exempt = True
+    return view
+
+
+def is_exempt(view_func, request):
+    """
+    Whether the view handling `request` is exempt from the N+1 guard: the
+    view function, its class, or the viewset action it dispatches to.
+    """
+    if getattr(view_func, 'n_plus_one_exempt', False):
+        return True
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    if getattr(view_class, 'n_plus_one_exempt', False):
+        return True
+    action = (getattr(view_func, 'actions', None) or {}).get(request.method.lower())
+    return getattr(getattr(view_class, action or '', None), 'n_plus_one_exempt', False)
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started, context['connection'].alias)
+
+
+def _timed_serializer_data(data_property):
+    """
+    Wrap a serializer's `data` property so the outermost evaluation is timed.
+    Nested serializers run inside their parent and are not counted twice.
+    """
+    def data(serializer):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return data_property.fget(serializer)
+        metrics._serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data_property.fget(serializer)
+        finally:
+            metrics._serializer_depth -= 1
+            if not metrics._serializer_depth:
+                metrics.serializer_time += time.perf_counter() - started
+    data._request_metrics = True
+    return property(data)
+
+
+def instrument_serializers():
+    """
+    Time DRF serializers. A no-op when DRF is not in INSTALLED_APPS or already
+    patched.
+    """
+    # DRF, with the yaml and pygments it imports, would slow down the boot of
+    # projects that do not use it
+    if not apps.is_installed('rest_framework'):
+        return
+    from rest_framework import serializers
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__['data']
+        if not getattr(prop.fget, '_request_metrics', False):
+            cls.data = _timed_serializer_data(prop)
+
+
+class RequestMetricsMiddleware:
+    """
+    Instrument a sample of requests. Unsampled requests pay one random() call.
+    Place it first in MIDDLEWARE so the whole stack is measured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0 if settings.DEBUG else 0.01)
+        self.duplicate_threshold = getattr(settings, 'REQUEST_METRICS_DUPLICATE_THRESHOLD', 2)
+        self.n_plus_one = getattr(settings, 'REQUEST_METRICS_N_PLUS_ONE', None)
+        allowlist = getattr(settings, 'REQUEST_METRICS_N_PLUS_ONE_ALLOWLIST', ())
+        self.allowed_views = set(allowlist)
+        self.allowed_queries = [re.compile(pattern) for pattern in allowlist]
+        instrument_serializers()
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics, token = self.start()
+        if metrics is None:
+            return self.get_response(request)
+        try:
+            with self.instrument_connections():
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = self.start()
+        if metrics is None:
+            return await self.get_response(request)
+        try:
+            # The async ORM runs queries in the request's sync thread, on that
+            # thread's connections, so the wrappers are installed there
+            stack = await sync_to_async(self.instrument_connections)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(stack.close)()
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    def start(self):
+        """
+        Decide whether to instrument the request: (metrics, context token),
+        or (None, None).
+        """
+        sampled = random.random() < self.sample_rate
+        # The guard in raise mode checks every request, but only sampled ones are reported
+        if not sampled and self.n_plus_one != 'raise':
+            return None, None
+        metrics = RequestMetrics(self.duplicate_threshold if self.n_plus_one else None)
+        metrics.sampled = sampled
+        return metrics, current_metrics.set(metrics)
+
+    def instrument_connections(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(_record_query))
+        return stack
+
+    def finish(self, request, response, metrics):
+        request.metrics = metrics
+        if metrics.sampled:
+            response['Server-Timing'] = metrics.server_timing()
+            self.log(request, response, metrics)
+        if metrics.guarded:
+            self.check_n_plus_one(request, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None and self.n_plus_one:
+            metrics.guarded = request.resolver_match.view_name not in self.allowed_views and not is_exempt(view_func, request)
+        return None
+
+    def check_n_plus_one(self, request, metrics):
+        violations = [
+            (shape, count) for shape, count in metrics.duplicates(self.duplicate_threshold)
+            if not any(pattern.search(shape) for pattern in self.allowed_queries)
+        ]
+        if not violations:
+            return
+
+        report = [f'{request.method} {request.path} ({request.resolver_match.view_name}) repeated queries:']
+        for shape, count in violations:
+            report.append(f'\n{count}x {shape}')
+            report.extend(line.rstrip() for line in traceback.format_list(metrics.stacks.get(shape, [])))
+        message = '\n'.join(report)
+        if self.n_plus_one == 'raise':
+            raise NPlusOneError(message)
+        logger.warning(message)
+
+    def process_template_response(self, request, response):
+        # Template and DRF responses are rendered right after this hook.
+        metrics = current_metrics.get()
+        if metrics is not None:
+            render_started = time.perf_counter()
+
+            def record_render(rendered):
+                metrics.render_time += time.perf_counter() - render_started
+            response.add_post_render_callback(record_render)
+        return response
+
+    def log(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(metrics.total_time * 1000, 2),
+            'queries': metrics.query_count,
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            'serialize_ms': round(metrics.serializer_time * 1000, 2),
+            'render_ms': round(metrics.render_time * 1000, 2),
+            'duplicates': [
+                {'sql': shape, 'count': count}
+                for shape, count in metrics.duplicates(self.duplicate_threshold)[:5]
+            ],
+        }))
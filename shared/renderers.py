@@ -0,0 +1,82 @@
+"""
+orjson-backed JSON renderer and parser for DRF.
+
+ORJSONRenderer encodes datetimes, dates, times and UUIDs natively and hands
+everything else orjson does not know (Decimal, lazy translation strings,
+querysets, ...) to DRF's JSONEncoder. Serializer output renders byte for byte
+like JSONRenderer's; the one difference is that datetime objects placed
+directly in a response keep their microseconds, where JSONEncoder keeps
+milliseconds.
+It falls back to JSONRenderer for output orjson cannot produce: indented
+JSON other than the browsable API's, non-compact separators and ASCII-only
+output (UNICODE_JSON = False).
+
+orjson is optional. Without it both classes behave exactly like DRF's
+JSONRenderer and JSONParser, so the settings below are safe to keep:
+
+    REST_FRAMEWORK = {
+        'DEFAULT_RENDERER_CLASSES': [
+            'shared.renderers.ORJSONRenderer',
+            'rest_framework.renderers.BrowsableAPIRenderer',
+        ],
+        'DEFAULT_PARSER_CLASSES': [
+            'shared.renderers.ORJSONParser',
+            'rest_framework.parsers.FormParser',
+            'rest_framework.parsers.MultiPartParser',
+        ],
+    }
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser, get_encoding
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Renders JSON with orjson when it is installed.
+    """
+
+    def __init__(self):
+        self.encoder = self.encoder_class()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the stdlib encoder handles
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, so the output is a strict JavaScript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    """
+    Parses JSON request bodies with orjson when it is installed.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        encoding = get_encoding(parser_context or {})
+        body = stream.read()
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            body = body.decode(encoding).encode()
+        try:
+            # orjson rejects NaN and Infinity, like the strict stdlib parser
+            return orjson.loads(body)
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,226 @@
+"""
+Read replica routing.
+
+ReplicaRoutingMiddleware decides, once per request, where that request reads
+from; ReplicaRouter applies the decision to every query:
+
+- GET, HEAD and OPTIONS requests read from one of DATABASE_REPLICAS, picked
+  at random per request so all of its reads see the same snapshot.
+- Other requests, and anything outside a request (management commands,
+  shell, background jobs), use `default` for reads and writes.
+- Once a request writes, its later reads go to `default` too.
+- After a client writes, its safe requests keep reading from `default` for
+  REPLICA_PIN_SECONDS, long enough for the replicas to catch up. The pin is
+  kept in the Django cache so every process sees it, under the client's
+  Authorization header or session cookie and the id of the user the request
+  authenticated as. Not under its IP: every client behind the same proxy or
+  NAT would be pinned with it. Before authentication only the credentials
+  are known, so a view that issues new ones (login, registration) pins them
+  too with `pin_credentials()`. Once a safe request's user is resolved, their
+  pin is checked too, so a user who wrote from one client reads their writes
+  from another.
+
+`use_primary()` forces reads to `default` for code that must not see replica
+lag. With DATABASE_REPLICAS empty, everything goes to `default`.
+
+Settings:
+    DATABASE_ROUTERS     ['shared.replicas.ReplicaRouter']
+    DATABASE_REPLICAS    aliases in DATABASES that replicate `default`
+    REPLICA_PIN_SECONDS  read-your-writes window after a write (default 5)
+"""
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import LazyObject, empty
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Routing state of the request being handled; None means "use default".
+current_route = contextvars.ContextVar('current_route', default=None)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+class Route:
+    """
+    Where the current request reads from, and whether it has written.
+    Given the request, reads move to `default` once its user is resolved
+    and turns out to be pinned. `credentials` are pinned along with the
+    client's own when the request's pins are written.
+    """
+
+    def __init__(self, replica=None, request=None):
+        self.replica = replica
+        self.wrote = False
+        self.request = request
+        self.user_checked = False
+        self.credentials = []
+
+    @property
+    def read_alias(self):
+        if self.wrote:
+            return None
+        if self.replica is not None and self.request is not None and not self.user_checked:
+            user_id = resolved_user_id(self.request)
+            if user_id is not None:
+                self.user_checked = True
+                if cache.get(user_pin_key(user_id)):
+                    self.replica = None
+        return self.replica
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from `default` inside the block, e.g. right after an external write.
+    """
+    token = current_route.set(None)
+    try:
+        yield
+    finally:
+        current_route.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = current_route.get()
+        return route.read_alias if route is not None else None
+
+    def db_for_write(self, model, **hints):
+        route = current_route.get()
+        if route is not None:
+            # Read your own writes for the rest of the request
+            route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as default
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+def pin_key(ident):
+    return 'replicas:pin:' + hashlib.sha256(ident.encode()).hexdigest()[:32]
+
+
+def pin_credentials(credentials):
+    """
+    Pin `credentials`, an Authorization header value such as the token a
+    login just issued, along with the current request's own pins, so the
+    client's next requests with them read its writes.
+    """
+    route = current_route.get()
+    if route is not None:
+        route.credentials.append(credentials)
+
+
+def client_pin_keys(request):
+    """
+    The pin keys of the client sending `request` that are known before
+    authentication: its Authorization header or session cookie.
+    """
+    keys = []
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if credentials:
+        keys.append(pin_key(credentials))
+    return keys
+
+
+def user_pin_key(user_id):
+    return f'replicas:pin:user:{user_id}'
+
+
+def resolved_user_id(request):
+    """
+    The id of the user `request` is authenticated as, or None while that is
+    not known yet. Never runs authentication itself: AuthenticationMiddleware's
+    lazy user counts only once something evaluated it, and DRF sets the
+    user when it authenticates.
+    """
+    user = request.__dict__.get('user')
+    if isinstance(user, LazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def written_pin_keys(request, route):
+    keys = client_pin_keys(request) + [pin_key(credentials) for credentials in route.credentials]
+    user_id = resolved_user_id(request)
+    if user_id is not None:
+        keys.append(user_pin_key(user_id))
+    return dict.fromkeys(keys, True)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route each request's reads (see the module docstring). Safe requests pay
+    one cache read for the client's read-your-writes pins, and one more for
+    their user's once it is resolved.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        replicas = replica_aliases()
+        if not replicas:
+            return self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        keys = client_pin_keys(request)
+        pinned = safe and bool(keys) and any(cache.get_many(keys).values())
+        route = Route(random.choice(replicas) if safe and not pinned else None, request)
+        token = current_route.set(route)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_route.reset(token)
+
+        pins = written_pin_keys(request, route) if not safe or route.wrote else None
+        if pins:
+            cache.set_many(pins, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+        return response
+
+    async def __acall__(self, request):
+        replicas = replica_aliases()
+        if not replicas:
+            return await self.get_response(request)
+
+        safe = request.method in SAFE_METHODS
+        keys = client_pin_keys(request)
+        pinned = safe and bool(keys) and any((await cache.aget_many(keys)).values())
+        route = Route(random.choice(replicas) if safe and not pinned else None, request)
+        # The async ORM's sync threads inherit the route with the context
+        token = current_route.set(route)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_route.reset(token)
+
+        pins = written_pin_keys(request, route) if not safe or route.wrote else None
+        if pins:
+            await cache.aset_many(pins, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+        return response
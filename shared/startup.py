@@ -0,0 +1,247 @@
+"""
+Startup profile: where a new worker's boot time goes.
+
+`manage.py startup_profile` boots the project in a fresh interpreter, the
+way the autoscaler starts a worker, and reports:
+
+- The time of each boot phase:
+  - setup: django.setup(), which covers settings, app and model imports and
+    AppConfig.ready().
+  - wsgi: the WSGI application, which loads the middleware.
+  - urls: the URLconf, with the views and serializers it imports. A worker
+    loads it on its first request.
+  - checks: the system checks, which manage.py commands run before their
+    work.
+- Each module's import time. Self time excludes the modules it imported
+  itself; cumulative time includes them. Also the module or phase that
+  imported it.
+- Each app's ready() time, and the self time of each top-level package.
+
+Imports are timed by a meta path finder that wraps each module's loader. It
+sees modules imported with importlib.import_module too, which Django uses
+for apps, models and URLconfs and which `python -X importtime` misses.
+
+STARTUP_LAZY_MODULES lists modules that boot must not import, such as
+Pillow, which only image uploads need. `startup_profile --check` fails when
+one of them is imported anyway, and `--budget` fails when boot is slower
+than a given time. Both are meant for CI.
+
+Run `python -m shared.startup` from a project directory, with the
+repository root on PYTHONPATH, to print one boot's profile as JSON.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+
+PHASES = ('setup', 'wsgi', 'urls', 'checks')
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+class TimedLoader:
+    """
+    Delegates to `loader`, timing its exec_module().
+    """
+
+    def __init__(self, timer, loader, name):
+        self.timer = timer
+        self.loader = loader
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.timer.exec_module(self.loader, self.name, module)
+
+
+class ImportTimer:
+    """
+    Meta path finder timing every module imported while it is installed.
+    `modules` maps each name, in import order, to {'self_ms',
+    'cumulative_ms', 'imported_by'}.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.phase = None
+        # [module name, seconds spent importing its own imports]
+        self.stack = []
+
+    def install(self):
+        sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            # Namespace packages and built-ins without exec_module are not timed
+            if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                spec.loader = TimedLoader(self, spec.loader, name)
+            return spec
+        return None
+
+    def exec_module(self, loader, name, module):
+        importer = self.stack[-1][0] if self.stack else self.phase
+        self.stack.append([name, 0.0])
+        started = time.perf_counter()
+        try:
+            loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - started
+            _, children = self.stack.pop()
+            if self.stack:
+                self.stack[-1][1] += cumulative
+            self.modules[name] = {
+                'self_ms': ms(cumulative - children),
+                'cumulative_ms': ms(cumulative),
+                'imported_by': importer,
+            }
+
+
+def time_ready(timings):
+    """
+    Make every AppConfig created from now on record its ready() time in
+    `timings`, by app label.
+    """
+    from django.apps import AppConfig
+
+    create = AppConfig.create.__func__
+
+    def timed_create(cls, entry):
+        config = create(cls, entry)
+        ready = config.ready
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                ready()
+            finally:
+                timings[config.label] = ms(time.perf_counter() - started)
+        config.ready = timed
+        return config
+
+    AppConfig.create = classmethod(timed_create)
+
+
+def boot():
+    """
+    Boot the project in this interpreter, phase by phase, and profile it.
+    Call it in a fresh interpreter: modules already imported are not timed.
+    """
+    timer = ImportTimer()
+    timer.install()
+    phases, apps = {}, {}
+
+    def run(phase, func):
+        timer.phase = phase
+        started = time.perf_counter()
+        func()
+        phases[phase] = ms(time.perf_counter() - started)
+
+    def setup():
+        import django
+
+        time_ready(apps)
+        django.setup()
+
+    def wsgi():
+        from django.core.wsgi import get_wsgi_application
+
+        get_wsgi_application()
+
+    def urls():
+        from django.urls import get_resolver
+
+        get_resolver().url_patterns
+
+    def checks():
+        from django.core import checks
+
+        checks.run_checks()
+
+    try:
+        for phase, func in zip(PHASES, (setup, wsgi, urls, checks)):
+            run(phase, func)
+    finally:
+        timer.uninstall()
+    return {
+        'phases': phases,
+        'apps': apps,
+        'modules': timer.modules,
+        'boot_ms': round(sum(phases[phase] for phase in PHASES if phase != 'checks'), 2),
+        # Modules without a cached .pyc are then compiled on every boot
+        'dont_write_bytecode': sys.dont_write_bytecode,
+    }
+
+
+def profile(settings_module, project_dir, repeat=1):
+    """
+    Boot the project in `project_dir`, the directory holding manage.py,
+    `repeat` times, each in a new interpreter, and return the profile of the
+    median run by boot_ms. 'wall_ms' adds the interpreter's own start and
+    exit to each run's time.
+    """
+    # The repository root, so this package is importable before the settings
+    paths = [str(Path(__file__).resolve().parent.parent), os.environ.get('PYTHONPATH')]
+    env = {
+        **os.environ,
+        'DJANGO_SETTINGS_MODULE': settings_module,
+        'PYTHONPATH': os.pathsep.join(path for path in paths if path),
+    }
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-m', __name__],
+            capture_output=True, text=True, check=True, env=env, cwd=project_dir,
+        )
+        run = json.loads(result.stdout.splitlines()[-1])
+        run['wall_ms'] = ms(time.perf_counter() - started)
+        runs.append(run)
+    runs.sort(key=lambda run: run['boot_ms'])
+    median = runs[len(runs) // 2]
+    median['runs'] = {
+        'boot_ms': [run['boot_ms'] for run in runs],
+        'wall_ms': statistics.median(run['wall_ms'] for run in runs),
+    }
+    return median
+
+
+def by_package(modules):
+    """
+    {top-level package: self ms of its modules}, slowest first.
+    """
+    totals = {}
+    for name, timing in modules.items():
+        package = name.partition('.')[0]
+        totals[package] = totals.get(package, 0) + timing['self_ms']
+    return {package: round(total, 2) for package, total in sorted(totals.items(), key=lambda item: -item[1])}
+
+
+def imported_lazy_modules(modules, names):
+    """
+    {name: the module or phase that imported it} for those of `names` that
+    were imported. Importing a submodule imports its package too.
+    """
+    return {name: modules[name]['imported_by'] for name in names if name in modules}
+
+
+if __name__ == '__main__':
+    print(json.dumps(boot()))
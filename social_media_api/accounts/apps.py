@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from django.db.models.signals import post_save
+
+        from . import search
+
+        # Keeps the in-memory username index in step with user saves
+        post_save.connect(search.user_saved, sender=self.get_model('CustomUser'), dispatch_uid='accounts.search')
@@ -0,0 +1,98 @@
+"""
+Streaming export of everything a user has created or received.
+
+The export is NDJSON: one JSON object per line, `{"type": ..., "data": {...}}`,
+starting with the user's profile and followed by the users they follow and
+their posts, comments, likes and notifications. Each table is read in keyset
+chunks (`WHERE id > last ORDER BY id LIMIT chunk_size`) and each chunk is
+iterated with `.iterator()`, so memory use does not grow with the size of the
+history and no chunk gets slower as the export advances.
+"""
+import zlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from notifications.models import Notification
+from posts import sharding
+from posts.models import Comment, Like, Post
+from shared.renderers import ORJSONRenderer
+
+
+User = get_user_model()
+
+
+def chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 1000)
+
+
+def sections(user):
+    """
+    (type, queryset, fields) for every kind of row in the export. The
+    user's comments and likes are on the shards of the posts they are on,
+    so each shard is one section (see posts.sharding).
+    """
+    follows = User.followers.through.objects.filter(to_customuser=user)
+    return [
+        # Users this user follows
+        ('follow', follows.annotate(user_id=F('from_customuser')), ['id', 'user_id']),
+        ('post', sharding.using(Post.objects.filter(author=user), sharding.author_shard(user.pk)),
+         ['id', 'title', 'content', 'created_at', 'updated_at']),
+        *sharding.fan_out(lambda alias: (
+            'comment', sharding.using(Comment.objects.filter(author=user), alias),
+            ['id', 'post_id', 'parent_id', 'content', 'created_at', 'updated_at'],
+        )),
+        *sharding.fan_out(lambda alias: (
+            'like', sharding.using(Like.objects.filter(user=user), alias),
+            ['id', 'post_id', 'created_at'],
+        )),
+        ('notification', Notification.objects.filter(recipient=user),
+         ['id', 'actor_id', 'verb', 'target_content_type__model', 'target_object_id', 'read', 'timestamp']),
+    ]
+
+
+def keyset_rows(queryset, fields, size):
+    """
+    Rows of `queryset` as dicts of `fields`, in id order, `size` per query.
+    """
+    last = 0
+    while True:
+        chunk = queryset.filter(pk__gt=last).order_by('pk').values(*fields)[:size]
+        count = 0
+        for row in chunk.iterator(chunk_size=size):
+            count += 1
+            last = row['id']
+            yield row
+        if count < size:
+            return
+
+
+def export_lines(user, size=None):
+    """
+    The export as a stream of encoded NDJSON lines.
+    """
+    size = size or chunk_size()
+    renderer = ORJSONRenderer()
+    yield renderer.render({'type': 'user', 'data': {
+        'id': user.pk,
+        'username': user.username,
+        'email': user.email,
+        'bio': user.bio,
+        'date_joined': user.date_joined,
+    }}) + b'\n'
+    for kind, queryset, fields in sections(user):
+        for row in keyset_rows(queryset, fields, size):
+            yield renderer.render({'type': kind, 'data': row}) + b'\n'
+
+
+def gzip_stream(lines, level=6):
+    """
+    Compress a stream of bytes as one gzip member, yielding output as it fills.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for line in lines:
+        compressed = compressor.compress(line)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,85 @@
+import random
+import string
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from accounts.search import UsernameIndex, load_rows
+from posts.management.commands.load_social import percentile
+
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'sen', 'to', 'vi', 'an', 'el', 'jo', 'dan', 'mar', 'li', 'ne', 'sa', 'ur']
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the in-memory username typeahead index: build time, memory '
+        'and prefix lookup latency percentiles, on synthetic users or the users '
+        'in the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help='Synthetic users to index.')
+        parser.add_argument('--queries', type=int, default=100_000, help='Prefix lookups to time.')
+        parser.add_argument('--limit', type=int, default=10, help='Results per lookup.')
+        parser.add_argument('--from-db', action='store_true', help='Index the users in the database instead.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        if options['from_db']:
+            rows = list(load_rows())
+        else:
+            rows = [
+                (pk, self.username(rng, pk), int(rng.paretovariate(1.2)) - 1)
+                for pk in range(1, options['users'] + 1)
+            ]
+
+        index = UsernameIndex()
+        started = time.perf_counter()
+        index.build(rows)
+        build_time = time.perf_counter() - started
+        # Tracing slows the build down, so memory is measured on a second one
+        tracemalloc.start()
+        UsernameIndex().build(rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f'{len(index)} users indexed in {build_time:.2f}s, '
+            f'{peak / 1024 / 1024:.0f} MiB peak while building, '
+            f'{len(index.tops)} prefixes with precomputed results'
+        )
+
+        # Typeahead traffic: mostly short prefixes of real usernames
+        usernames = [username for _, username, _ in rows]
+        prefixes = [
+            rng.choice(usernames)[:rng.choices([1, 2, 3, 4, 6], weights=[2, 4, 4, 3, 2])[0]]
+            for _ in range(options['queries'])
+        ]
+        seen = set()
+        cold, warm = [], []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            index.search(prefix, options['limit'])
+            elapsed = (time.perf_counter() - started) * 1000
+            (warm if prefix in seen else cold).append(elapsed)
+            seen.add(prefix)
+
+        self.stdout.write(f'{"lookups":<14}{"count":>8}{"p50 ms":>9}{"p99 ms":>9}{"max ms":>9}')
+        # "first of prefix" is the cold case: no lookup before it had the same
+        # prefix, so nothing it returns was computed by an earlier request
+        for label, timings in (('first of prefix', cold), ('repeated', warm), ('all', cold + warm)):
+            if not timings:
+                continue
+            timings.sort()
+            self.stdout.write(
+                f'{label:<14}{len(timings):>8}{percentile(timings, 50):>9.3f}'
+                f'{percentile(timings, 99):>9.3f}{timings[-1]:>9.3f}'
+            )
+
+    def username(self, rng, pk):
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3)))
+        if rng.random() < 0.5:
+            name += rng.choice(['_', '.', '']) + ''.join(rng.choices(string.digits, k=rng.randint(1, 4)))
+        return f'{name}{pk}' if rng.random() < 0.3 else name
@@ -1,10 +1,90 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.utils import timezone
+
+from shared.fields import LazyImageField
+
+
+class ActiveUserManager(UserManager):
+    """
+    Hides soft-deleted users; they stay in the table until the reaper removes them.
+    """
+    use_in_migrations = False
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
-    profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    profile_picture = LazyImageField(upload_to='profile_pictures/', blank=True, null=True)
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveUserManager()
+    all_objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Reaper work queue
+            models.Index(
+                fields=['deleted_at'],
+                name='user_deleted_idx',
+                condition=models.Q(deleted_at__isnull=False),
+            ),
+        ]
+
+    def __str__(self):
+        return self.username
+
+    def soft_delete(self):
+        """
+        Deactivate the account and hide it and its posts in a few statements.
+        Everything else the user owns is removed in batches by the reaper
+        (manage.py reap_deleted).
+        """
+        from rest_framework.authtoken.models import Token
+        from posts import sharding
+        from posts.models import Post
+
+        now = timezone.now()
+        alias = sharding.author_shard(self.pk)
+        with sharding.atomic(alias):
+            self.deleted_at = now
+            self.is_active = False
+            # Free the username for new registrations
+            self.username = f'deleted_{self.pk}_{self.username}'[:150]
+            self.save(update_fields=['deleted_at', 'is_active', 'username'])
+            Token.objects.filter(user=self).delete()
+            sharding.using(Post.objects, alias).filter(author=self).update(deleted_at=now)
+
+
+class Block(models.Model):
+    """
+    `user` blocked or muted `target`. Muting hides the target's posts from
+    the user's feed and their activity from the user's notifications.
+    Blocking does that too, removes the follows between the two users, and
+    stops either of them from commenting on or liking the other's posts.
+    Cached per user by accounts.blocks.
+    """
+    BLOCK = 'block'
+    MUTE = 'mute'
+    KINDS = [(BLOCK, 'Block'), (MUTE, 'Mute')]
+
+    # Served by the (user, target) and (target, user) indexes below
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='blocks', db_index=False)
+    target = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='blocked_by', db_index=False)
+    kind = models.CharField(max_length=5, choices=KINDS)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # One relation per pair; blocking a muted user turns the mute into a block
+            models.UniqueConstraint(fields=['user', 'target'], name='block_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['target', 'user'], name='block_target_idx'),
+        ]
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return f'{self.user} {self.kind}s {self.target}'
@@ -0,0 +1,298 @@
+"""
+Username typeahead served from memory.
+
+Every process keeps the usernames of active users in one sorted list of
+(normalized username, user id). The usernames starting with a prefix are one
+contiguous slice of it, found with two binary searches, so a lookup does not
+touch the database and costs O(log n) plus the ranking of the slice. Results
+are ranked by follower count, then username.
+
+A short prefix such as "a" can match tens of thousands of users, and ranking
+a slice that long takes milliseconds. So when the index is built, the TOP_K
+best ranked users of every prefix matching more than TOP_MIN_MATCHES users
+are computed up front; no lookup ranks more than about TOP_MIN_MATCHES
+entries, including the first one for a prefix. Adding, renaming or removing a
+user updates the precomputed results of that username's prefixes in place.
+
+The first search loads the index. After that it is kept up to date:
+- Each save of a user in this process is applied to it (see `user_saved`):
+  registrations, renames and deactivations.
+- Every REFRESH_SECONDS a search also picks up users registered through
+  other processes, with one indexed `pk > last seen` query.
+- Every REBUILD_SECONDS it is rebuilt from scratch, in a background thread
+  (see `start_rebuild`). That refreshes the follower counts and applies
+  renames made in other processes. The old index keeps serving searches until
+  the new one is swapped in, so no request waits for a rebuild; only the very
+  first search in a process waits for the initial load.
+
+Settings (USER_SEARCH dict): REFRESH_SECONDS, REBUILD_SECONDS.
+"""
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Count
+
+
+DEFAULTS = {
+    'REFRESH_SECONDS': 5,
+    'REBUILD_SECONDS': 300,
+}
+
+# Prefixes matching more users than this have their top results precomputed
+TOP_MIN_MATCHES = 256
+# Results kept per precomputed prefix: the largest limit the endpoint allows
+TOP_K = 50
+# Sorts after every character a normalized username can contain
+PREFIX_END = '\U0010ffff'
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'USER_SEARCH', {})}
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text).casefold()
+
+
+class UsernameIndex:
+    """
+    Sorted (normalized username, id) pairs, with each user's username and
+    follower count. All access goes through one lock; a lookup holds it for
+    microseconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.refreshed_at = None
+        self.rebuilding = False
+        self.clear()
+
+    def reset(self):
+        """
+        Empty the index; the next search loads it again.
+        """
+        with self.lock:
+            self.clear()
+            self.loaded_at = self.refreshed_at = None
+
+    def clear(self):
+        self.entries = []
+        self.users = {}
+        self.max_pk = 0
+        self.tops = {}
+
+    def build(self, rows):
+        """
+        Replace the contents with `rows` of (id, username, follower count).
+        Everything is computed before the lock is taken, so searches keep
+        using the old contents meanwhile.
+        """
+        users = {pk: (username, followers) for pk, username, followers in rows}
+        entries = sorted((normalize(username), pk) for pk, (username, _) in users.items())
+        tops = top_results(entries, users)
+        with self.lock:
+            self.entries = entries
+            self.users = users
+            self.max_pk = max(users, default=0)
+            self.tops = tops
+            self.loaded_at = self.refreshed_at = time.monotonic()
+
+    def add(self, pk, username, followers=0):
+        with self.lock:
+            self._remove(pk)
+            key = normalize(username)
+            insort(self.entries, (key, pk))
+            self.users[pk] = (username, followers)
+            self.max_pk = max(self.max_pk, pk)
+            match = (pk, username, followers)
+            for top in self._tops_of(key):
+                insort(top, match, key=rank)
+                del top[TOP_K:]
+
+    def remove(self, pk):
+        with self.lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        user = self.users.pop(pk, None)
+        if user is None:
+            return
+        key = normalize(user[0])
+        position = bisect_left(self.entries, (key, pk))
+        if position < len(self.entries) and self.entries[position] == (key, pk):
+            del self.entries[position]
+        for top in self._tops_of(key):
+            top[:] = [match for match in top if match[0] != pk]
+
+    def _tops_of(self, key):
+        """
+        The precomputed results of the prefixes of `key`, shortest first.
+        Prefixes of a prefix without them have none either.
+        """
+        for end in range(1, len(key) + 1):
+            top = self.tops.get(key[:end])
+            if top is None:
+                return
+            yield top
+
+    def search(self, prefix, limit):
+        """
+        [(id, username, follower count)] of the `limit` most followed users
+        whose username starts with `prefix`.
+        """
+        prefix = normalize(prefix)
+        with self.lock:
+            top = self.tops.get(prefix)
+            if top is not None and len(top) >= limit:
+                return top[:limit]
+            low = bisect_left(self.entries, (prefix,))
+            high = bisect_left(self.entries, (prefix + PREFIX_END,), low)
+            users = self.users
+            if high - low <= limit:
+                matches = [(pk, *users[pk]) for _, pk in self.entries[low:high]]
+                return sorted(matches, key=rank)
+            if top is None:
+                return rank_slice(self.entries[low:high], users, limit)
+            # Removals left fewer than `limit` precomputed results: rank the
+            # slice once more and keep the result
+            top[:] = rank_slice(self.entries[low:high], users, TOP_K)
+            return top[:limit]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def rank(match):
+    pk, username, followers = match
+    return -followers, username, pk
+
+
+def rank_slice(entries, users, limit):
+    ranked = heapq.nsmallest(limit, ((-users[pk][1], users[pk][0], pk) for _, pk in entries))
+    return [(pk, username, -followers) for followers, username, pk in ranked]
+
+
+def top_results(entries, users):
+    """
+    {prefix: its TOP_K best ranked (id, username, follower count)} for every
+    prefix of the sorted `entries` that matches more than TOP_MIN_MATCHES users.
+
+    Each such prefix's slice is split by the next character with binary
+    searches. Parts that match that many users too are handled the same way;
+    the rest are ranked directly, so every user is ranked once, and a prefix's
+    results are the best of its parts' results.
+    """
+    tops = {}
+
+    def best(parent, low, high):
+        candidates = []
+        light = position = low
+        while position < high:
+            key = entries[position][0]
+            if len(key) == len(parent):
+                position += 1
+                continue
+            prefix = key[:len(parent) + 1]
+            end = bisect_left(entries, (prefix + PREFIX_END,), position, high)
+            if end - position > TOP_MIN_MATCHES:
+                candidates += rank_slice(entries[light:position], users, TOP_K)
+                candidates += best(prefix, position, end)
+                light = end
+            position = end
+        candidates += rank_slice(entries[light:high], users, TOP_K)
+        top = heapq.nsmallest(TOP_K, candidates, key=rank)
+        if parent:
+            tops[parent] = top
+        return top
+
+    if len(entries) > TOP_MIN_MATCHES:
+        best('', 0, len(entries))
+    return tops
+
+
+def load_rows(min_pk=0):
+    """
+    (id, username, follower count) of active users with ids above `min_pk`.
+    """
+    User = get_user_model()
+    return (
+        User.objects.filter(pk__gt=min_pk, is_active=True)
+        .annotate(followers_count=Count('followers'))
+        .values_list('pk', 'username', 'followers_count')
+        .order_by()
+        .iterator(chunk_size=10000)
+    )
+
+
+index = UsernameIndex()
+
+
+def ensure_fresh():
+    """
+    Load the index on first use, then refresh or rebuild it when due (see
+    the module docstring).
+    """
+    config = options()
+    now = time.monotonic()
+    if index.loaded_at is None:
+        # Nothing to serve yet: the first search waits for the load
+        index.build(load_rows())
+    elif now - index.loaded_at >= config['REBUILD_SECONDS']:
+        start_rebuild()
+    elif now - index.refreshed_at >= config['REFRESH_SECONDS']:
+        index.refreshed_at = now
+        for pk, username, followers in load_rows(index.max_pk):
+            index.add(pk, username, followers)
+
+
+def rebuild():
+    """
+    Rebuild the index from the database.
+    """
+    index.build(load_rows())
+
+
+def start_rebuild():
+    """
+    Rebuild the index in a background thread, unless one already is.
+    """
+    with index.lock:
+        if index.rebuilding:
+            return
+        index.rebuilding = True
+    threading.Thread(target=rebuild_in_background, name='user-search-rebuild', daemon=True).start()
+
+
+def rebuild_in_background():
+    try:
+        rebuild()
+    finally:
+        index.rebuilding = False
+        # The thread's own connections, opened by the load
+        connections.close_all()
+
+
+def search(prefix, limit=10):
+    ensure_fresh()
+    return index.search(prefix, limit)
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    post_save receiver: keep this process's index in step with user saves.
+    """
+    if index.loaded_at is None:
+        return
+    if instance.deleted_at is not None or not instance.is_active:
+        index.remove(instance.pk)
+        return
+    current = index.users.get(instance.pk)
+    if current is None or current[0] != instance.username:
+        index.add(instance.pk, instance.username, current[1] if current else 0)
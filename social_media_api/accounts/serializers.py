@@ -2,6 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
 
+from .models import Block
+
 User = get_user_model()
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -39,4 +41,12 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return obj.followers.count()
 
     def get_following_count(self, obj):
-        return obj.following.count()
\ No newline at end of file
+        return obj.following.count()
+
+class BlockSerializer(serializers.ModelSerializer):
+    user_id = serializers.ReadOnlyField(source='target.id')
+    username = serializers.ReadOnlyField(source='target.username')
+
+    class Meta:
+        model = Block
+        fields = ['user_id', 'username', 'kind', 'created_at']
@@ -1,3 +1,298 @@
-from django.test import TestCase
+import gzip
+import json
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from notifications.models import Notification
+from posts import tagging
+from posts.models import Comment, Like, Post
+
+from . import blocks, search
+from .export import export_lines
+from .models import Block, CustomUser
+
+
+class ExportTestCase(APITestCase):
+    """
+    Tests for the streaming NDJSON export at /api/export/.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        self.other = CustomUser.objects.create_user(username='other', password='testpass123')
+        self.user.following.add(self.other)
+        self.posts = [Post.objects.create(author=self.user, title=f'Post {i}', content='content') for i in range(5)]
+        other_post = Post.objects.create(author=self.other, title='Other', content='content')
+        Comment.objects.create(post=other_post, author=self.user, content='Nice')
+        Like.objects.create(post=other_post, user=self.user)
+        Notification.objects.create(recipient=self.user, actor=self.other, verb='liked your post', target=self.posts[0])
+        self.client.force_authenticate(self.user)
+
+    def read(self, response):
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_streams_every_section(self):
+        response = self.client.get('/api/export/')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = self.read(response)
+        self.assertEqual([row['type'] for row in rows], (
+            ['user', 'follow'] + ['post'] * 5 + ['comment', 'like', 'notification']
+        ))
+        self.assertEqual(rows[0]['data']['username'], 'user')
+        self.assertEqual(rows[1]['data']['user_id'], self.other.pk)
+        self.assertEqual([row['data']['id'] for row in rows[2:7]], [post.pk for post in self.posts])
+        self.assertEqual(rows[-1]['data']['target_content_type__model'], 'post')
+
+    def test_export_is_gzipped_when_accepted(self):
+        response = self.client.get('/api/export/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 10)
+
+    def test_posts_are_read_in_keyset_chunks(self):
+        """
+        Every section costs one query per chunk, plus one to find it is done
+        when its last chunk is full.
+        """
+        lines = export_lines(self.user, size=2)
+        # follows 1, posts 3 (2 + 2 + 1), comments 1, likes 1, notifications 1
+        with self.assertNumQueries(7):
+            self.assertEqual(len(list(lines)), 10)
+
+    def test_memory_stays_flat(self):
+        Post.objects.bulk_create(
+            Post(author=self.user, title=f'Bulk {i}', content='x' * 500) for i in range(2000)
+        )
+        tracemalloc.start()
+        count = 0
+        for line in export_lines(self.user, size=100):
+            count += 1
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.assertEqual(count, 2010)
+        # The 2,000 posts alone are over 1 MB; the export never holds more than a chunk
+        self.assertLess(peak, 600 * 1024)
+
+
+class UserSearchTestCase(APITestCase):
+    """
+    Tests for the username typeahead at /api/users/search/.
+    """
+
+    def setUp(self):
+        search.index.reset()
+        self.user = CustomUser.objects.create_user(username='viewer', password='testpass123')
+        self.anna = CustomUser.objects.create_user(username='Anna', password='testpass123')
+        self.annika = CustomUser.objects.create_user(username='annika', password='testpass123')
+        self.andrew = CustomUser.objects.create_user(username='andrew', password='testpass123')
+        self.bob = CustomUser.objects.create_user(username='bob', password='testpass123')
+        for follower in (self.user, self.bob):
+            follower.following.add(self.annika)
+        self.bob.following.add(self.anna)
+        self.client.force_authenticate(self.user)
+
+    def usernames(self, q, **params):
+        response = self.client.get('/api/users/search/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [user['username'] for user in response.data]
+
+    def test_prefix_matches_rank_by_followers(self):
+        self.assertEqual(self.usernames('AN'), ['annika', 'Anna', 'andrew'])
+        self.assertEqual(self.usernames('ann'), ['annika', 'Anna'])
+        self.assertEqual(self.usernames('@an', limit=1), ['annika'])
+        self.assertEqual(self.usernames('zed'), [])
+        response = self.client.get('/api/users/search/', {'q': 'annik'})
+        self.assertEqual(response.data, [{'id': self.annika.pk, 'username': 'annika', 'followers_count': 2}])
+
+    def test_empty_query_returns_nothing(self):
+        self.assertEqual(self.usernames(' '), [])
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/users/search/', {'q': 'an'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_warm_search_does_not_query(self):
+        self.usernames('an')
+        with self.assertNumQueries(0):
+            self.assertEqual(search.search('and'), [(self.andrew.pk, 'andrew', 0)])
+
+    def test_new_and_deleted_users_are_applied_without_reload(self):
+        self.usernames('an')
+        loaded_at = search.index.loaded_at
+        newcomer = CustomUser.objects.create_user(username='anton', password='testpass123')
+        self.assertIn('anton', self.usernames('ant'))
+
+        newcomer.soft_delete()
+        self.assertEqual(self.usernames('ant'), [])
+        self.assertEqual(search.index.loaded_at, loaded_at)
+
+    def test_popular_prefixes_are_precomputed_and_kept_current(self):
+        index = search.UsernameIndex()
+        index.build([(pk, f'user{pk}', pk) for pk in range(1, search.TOP_MIN_MATCHES + 10)])
+        top = index.search('us', 3)
+        self.assertEqual(index.tops['us'][:3], top)
+        self.assertNotIn('user1', index.tops)
+
+        index.add(1000, 'user_star', 10000)
+        self.assertEqual(index.search('us', 3), [(1000, 'user_star', 10000)] + top[:2])
+        index.remove(1000)
+        self.assertEqual(index.search('us', 3), top)
+        # Removing every precomputed result ranks the slice again
+        for pk, _, _ in index.search('us', search.TOP_K):
+            index.remove(pk)
+        remaining = search.TOP_MIN_MATCHES + 9 - search.TOP_K
+        self.assertEqual(index.search('u', 1), [(remaining, f'user{remaining}', remaining)])
+        self.assertEqual(len(index.tops['u']), search.TOP_K)
+
+    @override_settings(USER_SEARCH={'REBUILD_SECONDS': 0})
+    def test_rebuilds_run_in_the_background(self):
+        self.usernames('an')
+        CustomUser.objects.filter(pk=self.andrew.pk).update(username='andy')
+        with mock.patch.object(search.threading, 'Thread') as thread, self.assertNumQueries(0):
+            self.assertEqual(search.search('andr'), [(self.andrew.pk, 'andrew', 0)])
+        thread.return_value.start.assert_called_once()
+        self.assertTrue(search.index.rebuilding)
+        search.index.rebuilding = False
+
+        search.rebuild()
+        self.assertEqual(search.index.search('andr', 10), [])
+        self.assertEqual(search.index.search('and', 10), [(self.andrew.pk, 'andy', 0)])
+
+    @override_settings(USER_SEARCH={'REFRESH_SECONDS': 0})
+    def test_users_created_elsewhere_are_picked_up(self):
+        self.usernames('an')
+        # As if registered through another process: no post_save here
+        CustomUser.objects.bulk_create([CustomUser(username='angela')])
+        self.assertIn('angela', self.usernames('ang'))
+
+
+class BlockTestCase(APITestCase):
+    """
+    Tests for blocking and muting, and the cached lists in accounts.blocks.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        self.other = CustomUser.objects.create_user(username='other', password='testpass123')
+        self.user.following.add(self.other)
+        self.other.following.add(self.user)
+        self.post = Post.objects.create(author=self.other, title='Other', content='content')
+        self.own_post = Post.objects.create(author=self.user, title='Mine', content='content')
+        self.client.force_authenticate(self.user)
+
+    def feed_titles(self):
+        return [post['title'] for post in self.client.get('/api/feed/').data['results']]
+
+    def test_mute_hides_posts_comments_and_notifications(self):
+        Comment.objects.create(post=self.own_post, author=self.other, content='Hi')
+        Notification.objects.create(recipient=self.user, actor=self.other, verb='liked your post', target=self.own_post)
+        self.assertEqual(self.feed_titles(), ['Other'])
+
+        response = self.client.post(f'/api/mute/{self.other.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.feed_titles(), [])
+        self.assertEqual(self.client.get('/notifications/').data['count'], 0)
+        self.assertEqual(self.client.get(f'/api/posts/{self.own_post.pk}/comments/').data['count'], 0)
+        # Muting keeps the follow, and the muted user can still interact
+        self.assertTrue(self.user.following.filter(pk=self.other.pk).exists())
+        self.assertFalse(blocks.is_blocked(self.user.pk, self.other.pk))
+
+        response = self.client.post(f'/api/unmute/{self.other.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.feed_titles(), ['Other'])
+        self.assertEqual(self.client.get('/notifications/').data['count'], 1)
+
+    def test_hidden_authors_comments_are_left_out_of_posts(self):
+        friend = CustomUser.objects.create_user(username='friend', password='testpass123')
+        self.user.following.add(friend)
+        post = Post.objects.create(author=friend, title='Friend #news', content='content #news')
+        tagging.index_posts([post], created=True)
+        Comment.objects.create(post=post, author=friend, content='Visible')
+        Comment.objects.create(post=post, author=self.other, content='Hidden')
+        blocks.block(self.user, self.other, Block.MUTE)
+
+        def comments(data):
+            return [comment['content'] for comment in data['comments']]
+
+        feed = self.client.get('/api/feed/').data['results']
+        self.assertEqual([comments(post) for post in feed], [['Visible']])
+        self.assertEqual(comments(self.client.get(f'/api/posts/{post.pk}/').data), ['Visible'])
+        listed = {item['id']: item for item in self.client.get('/api/posts/').data['results']}
+        self.assertEqual(comments(listed[post.pk]), ['Visible'])
+        self.assertEqual(listed[post.pk]['comments_count'], 1)
+        timeline = self.client.get('/api/tags/news/').data['results']
+        self.assertEqual(comments(timeline[0]), ['Visible'])
+        response = self.client.get('/api/comments/')
+        self.assertEqual([comment['content'] for comment in response.data['results']], ['Visible'])
+
+    def test_block_ends_follows_and_interactions(self):
+        response = self.client.post(f'/api/block/{self.other.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(self.user.following.exists())
+        self.assertFalse(self.user.followers.exists())
+
+        # Neither side can like, comment on or follow the other
+        self.assertEqual(self.client.post(f'/api/posts/{self.post.pk}/like/').status_code, 403)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.post(f'/api/posts/{self.own_post.pk}/like/').status_code, 403)
+        response = self.client.post('/api/comments/', {'post': self.own_post.pk, 'content': 'Hi'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('post', response.data)
+        self.assertEqual(self.client.post(f'/api/follow/{self.user.pk}/').status_code, 403)
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(f'/api/unmute/{self.other.pk}/').status_code, 400)
+        self.assertEqual(self.client.post(f'/api/unblock/{self.other.pk}/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/posts/{self.post.pk}/like/').status_code, 201)
+
+    def test_block_replaces_mute(self):
+        blocks.block(self.user, self.other, Block.MUTE)
+        blocks.block(self.user, self.other, Block.BLOCK)
+        blocks.block(self.user, self.other, Block.MUTE)
+
+        self.assertEqual(list(Block.objects.values_list('kind', flat=True)), [Block.BLOCK])
+        response = self.client.get('/api/blocks/')
+        self.assertEqual(
+            [(row['user_id'], row['kind']) for row in response.data],
+            [(self.other.pk, Block.BLOCK)],
+        )
+
+    def test_lists_are_cached_until_changed(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(blocks.is_blocked(self.user.pk, self.other.pk))
+        with self.assertNumQueries(0):
+            self.assertFalse(blocks.is_blocked(self.user.pk, self.other.pk))
+
+        blocks.block(self.user, self.other)
+        self.assertTrue(blocks.is_blocked(self.other.pk, self.user.pk))
+        self.assertIn(self.other.pk, blocks.hidden_ids(self.user.pk))
+        self.assertNotIn(self.user.pk, blocks.hidden_ids(self.other.pk))
+
+    def test_muted_authors_do_not_notify_mentions(self):
+        third = CustomUser.objects.create_user(username='third', password='testpass123')
+        blocks.block(third, self.other, Block.MUTE)
+        self.client.force_authenticate(self.other)
+        self.client.post('/api/posts/', {'title': 'Hello', 'content': 'Hi @user and @third'})
+
+        self.assertEqual(
+            list(Notification.objects.filter(verb='mentioned you').values_list('recipient__username', flat=True)),
+            ['user'],
+        )
+
+    def test_id_set(self):
+        ids = blocks.IdSet([5, 3, 9, 3])
+        self.assertEqual(list(ids), [3, 5, 9])
+        self.assertIn(9, ids)
+        self.assertNotIn(4, ids)
+        self.assertNotIn(10, ids)
+        self.assertEqual(list(ids | blocks.IdSet([4])), [3, 4, 5, 9])
@@ -1,5 +1,18 @@
 from django.urls import path
-from .views import UserRegistrationView, UserLoginView, UserProfileView, FollowUserView, UnfollowUserView
+from .views import (
+    BlockListView,
+    BlockUserView,
+    ExportView,
+    FollowUserView,
+    MuteUserView,
+    UnblockUserView,
+    UnfollowUserView,
+    UnmuteUserView,
+    UserLoginView,
+    UserProfileView,
+    UserRegistrationView,
+    UserSearchView,
+)
 
 
 urlpatterns = [
@@ -8,4 +21,11 @@ urlpatterns = [
     path('profile/', UserProfileView.as_view(), name='profile'),
     path('follow/<int:user_id>/', FollowUserView.as_view(), name='follow-user'),
     path('unfollow/<int:user_id>/', UnfollowUserView.as_view(), name='unfollow-user'),
+    path('block/<int:user_id>/', BlockUserView.as_view(), name='block-user'),
+    path('unblock/<int:user_id>/', UnblockUserView.as_view(), name='unblock-user'),
+    path('mute/<int:user_id>/', MuteUserView.as_view(), name='mute-user'),
+    path('unmute/<int:user_id>/', UnmuteUserView.as_view(), name='unmute-user'),
+    path('blocks/', BlockListView.as_view(), name='block-list'),
+    path('users/search/', UserSearchView.as_view(), name='user-search'),
+    path('export/', ExportView.as_view(), name='export'),
 ]
\ No newline at end of file
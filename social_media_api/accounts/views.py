@@ -1,13 +1,23 @@
 # Third-party imports
 from django.contrib.auth import authenticate, get_user_model
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from rest_framework import generics, permissions, status
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from outbox import events
+from posts import feed_cache
+from shared import replicas
+from social_media_api.throttling import TokenBucketThrottle
+
 # Local app imports
-from .models import CustomUser
+from . import blocks, search
+from .export import export_lines, gzip_stream
+from .models import Block, CustomUser
 from .serializers import (
+    BlockSerializer,
     UserLoginSerializer,
     UserProfileSerializer,
     UserRegistrationSerializer,
@@ -26,6 +36,8 @@ class UserRegistrationView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         token = Token.objects.get(user=user)
+        # The new token reads what the registration wrote
+        replicas.pin_credentials(f'Token {token.key}')
         return Response({
             'user': UserRegistrationSerializer(user).data,
             'token': token.key
@@ -33,6 +45,8 @@ class UserRegistrationView(generics.CreateAPIView):
 
 class UserLoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
 
     def post(self, request):
         serializer = UserLoginSerializer(data=request.data)
@@ -43,13 +57,14 @@ class UserLoginView(APIView):
         user = authenticate(username=username, password=password)
         if user:
             token, created = Token.objects.get_or_create(user=user)
+            replicas.pin_credentials(f'Token {token.key}')
             return Response({
                 'token': token.key,
                 'user': UserProfileSerializer(user).data
             }, status=status.HTTP_200_OK)
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-class UserProfileView(generics.RetrieveUpdateAPIView):
+class UserProfileView(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -57,19 +72,32 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+    def perform_destroy(self, instance):
+        # Deactivates the account at once; owned rows are removed by the reaper
+        instance.soft_delete()
+
 
 
 class FollowUserView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     queryset = CustomUser.objects.all()
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'follow'
 
     def post(self, request, user_id):
         try:
             user_to_follow = CustomUser.objects.get(id=user_id)
             if user_to_follow == request.user:
                 return Response({'error': 'You cannot follow yourself'}, status=status.HTTP_400_BAD_REQUEST)
+            if blocks.is_blocked(request.user.pk, user_to_follow.pk):
+                return Response({'error': 'You cannot follow this user'}, status=status.HTTP_403_FORBIDDEN)
             
-            request.user.following.add(user_to_follow)
+            # Only a new follow notifies the followed user
+            if not request.user.following.filter(pk=user_to_follow.pk).exists():
+                with transaction.atomic():
+                    request.user.following.add(user_to_follow)
+                    events.publish('user.followed', {'user_id': user_to_follow.pk, 'follower_id': request.user.pk})
+            feed_cache.invalidate([request.user.pk])
             return Response({'message': f'You are now following {user_to_follow.username}'}, status=status.HTTP_200_OK)
         except CustomUser.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -82,6 +110,104 @@ class UnfollowUserView(generics.GenericAPIView):
         try:
             user_to_unfollow = CustomUser.objects.get(id=user_id)
             request.user.following.remove(user_to_unfollow)
+            feed_cache.invalidate([request.user.pk])
             return Response({'message': f'You have unfollowed {user_to_unfollow.username}'}, status=status.HTTP_200_OK)
         except CustomUser.DoesNotExist:
-            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+class BlockUserView(generics.GenericAPIView):
+    """
+    Block a user; MuteUserView mutes one. See accounts.models.Block.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = CustomUser.objects.all()
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'follow'
+    kind = Block.BLOCK
+    done = 'blocked'
+
+    def post(self, request, user_id):
+        try:
+            target = CustomUser.objects.get(id=user_id)
+            if target == request.user:
+                return Response({'error': f'You cannot {self.kind} yourself'}, status=status.HTTP_400_BAD_REQUEST)
+            blocks.block(request.user, target, self.kind)
+            return Response({'message': f'You {self.done} {target.username}'}, status=status.HTTP_200_OK)
+        except CustomUser.DoesNotExist:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+class MuteUserView(BlockUserView):
+    kind = Block.MUTE
+    done = 'muted'
+
+class UnblockUserView(generics.GenericAPIView):
+    """
+    Unblock a user; UnmuteUserView unmutes one.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    queryset = CustomUser.objects.all()
+    kind = Block.BLOCK
+    done = 'blocked'
+
+    def post(self, request, user_id):
+        try:
+            target = CustomUser.objects.get(id=user_id)
+            if not blocks.unblock(request.user, target, self.kind):
+                return Response({'error': f'You have not {self.done} this user'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'message': f'You un{self.done} {target.username}'}, status=status.HTTP_200_OK)
+        except CustomUser.DoesNotExist:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+class UnmuteUserView(UnblockUserView):
+    kind = Block.MUTE
+    done = 'muted'
+
+class BlockListView(generics.ListAPIView):
+    """
+    The users the current user blocked or muted, most recent first.
+    """
+    serializer_class = BlockSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return Block.objects.filter(user=self.request.user).select_related('target').order_by('-created_at')
+
+class UserSearchView(APIView):
+    """
+    Username typeahead: users whose username starts with `q`, most
+    followed first. Served from the in-memory index in accounts.search.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    max_limit = 50
+
+    def get(self, request):
+        prefix = request.query_params.get('q', '').strip().lstrip('@')
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), self.max_limit)
+        except ValueError:
+            limit = 10
+        if not prefix:
+            return Response([])
+        return Response([
+            {'id': pk, 'username': username, 'followers_count': followers}
+            for pk, username, followers in search.search(prefix, limit)
+        ])
+
+class ExportView(APIView):
+    """
+    Streams the current user's data as NDJSON (see accounts.export), gzipped
+    on the fly when the client accepts gzip.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        lines = export_lines(request.user)
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = StreamingHttpResponse(gzip_stream(lines), content_type='application/x-ndjson')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['Vary'] = 'Accept-Encoding'
+        response['Content-Disposition'] = f'attachment; filename="export-{request.user.username}.ndjson"'
+        return response
+
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        'Count posts, likes, comments and follows created since the last run '
+        'into the daily analytics rollups. Safe to interrupt and rerun.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Source rows per transaction (default: ANALYTICS["BATCH_SIZE"]).')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop each source after this many batches.')
+        parser.add_argument('--sources', default=','.join(rollups.SOURCES),
+                            help='Comma-separated subset of: ' + ', '.join(rollups.SOURCES))
+
+    def handle(self, *args, **options):
+        sources = [name.strip() for name in options['sources'].split(',') if name.strip()]
+        unknown = set(sources) - set(rollups.SOURCES)
+        if unknown:
+            raise CommandError(f'Unknown sources: {", ".join(sorted(unknown))}')
+
+        results = rollups.run(sources, options['batch_size'], options['max_batches'])
+        for name, result in results.items():
+            rate = result['rows'] / result['elapsed_s'] if result['elapsed_s'] else 0
+            self.stdout.write(
+                f'{name}: {result["rows"]} rows in {result["batches"]} batches, '
+                f'{result["elapsed_s"]}s ({rate:.0f} rows/s)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Counted {sum(r["rows"] for r in results.values())} rows'))
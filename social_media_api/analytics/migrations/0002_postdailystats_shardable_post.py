@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('posts', '0010_database_shards'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='postdailystats',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='posts.post'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_postdailystats_shardable_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='watermark',
+            name='last_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db import models
+
+
+class AuthorDailyStats(models.Model):
+    """
+    One author's activity on one day: posts written, and likes, comments
+    and followers received. Maintained by analytics.rollups.
+    """
+    # Served by the (author, day) unique index
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_stats', db_index=False)
+    day = models.DateField()
+    posts = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+    new_followers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'day'], name='author_day_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.author_id} on {self.day}'
+
+
+class PostDailyStats(models.Model):
+    """
+    Likes and comments one post received on one day. Maintained by
+    analytics.rollups.
+    """
+    # Served by the (post, day) unique index. No database constraint: the
+    # post may live on another database shard (see posts.sharding)
+    post = models.ForeignKey(
+        'posts.Post', on_delete=models.CASCADE, related_name='daily_stats', db_index=False, db_constraint=False,
+    )
+    day = models.DateField()
+    likes = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'day'], name='post_day_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id} on {self.day}'
+
+
+class Watermark(models.Model):
+    """
+    The last row of a source table already counted: its id and, for tables
+    with a timestamp, its timestamp (see analytics.rollups.pending_keys).
+    """
+    source = models.CharField(max_length=50, unique=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.source} up to {self.last_id}'
@@ -0,0 +1,240 @@
+"""
+Daily rollups of posts, likes, comments and follows, per author and per post.
+
+Answering "likes per day for my posts" from the Like and Comment tables
+would aggregate all of them on every request. Instead an incremental job
+adds each new row once to AuthorDailyStats (author, day) and PostDailyStats
+(post, day), and the analytics endpoints read a range of days from those.
+
+Each source table has a Watermark, the last row already counted. A batch
+takes the next BATCH_SIZE rows after it and counts them per author or post
+and day, with one GROUP BY over those rows. It adds the counts to the
+rollups and moves the watermark in the same transaction. An interrupted run
+loses only the batch in progress, which rolls back and is counted by the
+next run. Every batch costs the same few queries, so a run takes time
+linear in the rows it counts.
+
+Rows are taken in id order while ids follow creation order. Rows do not
+commit in order, though: id 11 can be visible before id 10 is. Rows
+younger than SETTLE_SECONDS are left for the next run, so a late commit
+below the watermark is skipped only when it commits more than
+SETTLE_SECONDS after its timestamp. The follow table has no timestamp, so a
+follow is counted on the day the job reads it, without the delay.
+
+With database shards (see posts.sharding), posts, likes and comments are
+counted shard by shard, each shard with its own watermark, `<source>@<alias>`
+(plain `<source>` for default). Their ids come from blocks reserved per
+process, so a row can get a lower id than one created before it. Sharded
+rows are therefore taken in (timestamp, id) order, and the watermark keeps
+both (see pending_keys). rebalance_shards copies rows with their ids and
+timestamps, so a row moved past its new shard's watermark is counted a
+second time.
+
+Rollups count activity when it happens. Unliking, deleting a comment or
+unfollowing does not decrement them.
+
+Settings (ANALYTICS dict): BATCH_SIZE, SETTLE_SECONDS, MAX_DAYS (the longest
+range the endpoints return).
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from posts import sharding
+from posts.models import Comment, Like, Post
+
+from .models import AuthorDailyStats, PostDailyStats, Watermark
+
+
+DEFAULTS = {
+    'BATCH_SIZE': 5000,
+    'SETTLE_SECONDS': 60,
+    'MAX_DAYS': 365,
+}
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'ANALYTICS', {})}
+
+
+class Source:
+    """
+    A table counted into the rollups: `field` of the author's row (and the
+    post's row, when `post` is set) goes up by one per row, on the day of
+    its `timestamp`.
+    """
+
+    def __init__(self, get_queryset, field, author, post=None, timestamp='created_at'):
+        self.get_queryset = get_queryset
+        self.field = field
+        self.author = author
+        self.post = post
+        self.timestamp = timestamp
+
+
+SOURCES = {
+    'post': Source(lambda: Post.all_objects.all(), 'posts', author='author_id'),
+    'like': Source(lambda: Like.objects.all(), 'likes', author='post__author_id', post='post_id'),
+    'comment': Source(lambda: Comment.objects.all(), 'comments', author='post__author_id', post='post_id'),
+    # Rows (user, follower): the user gains a follower
+    'follow': Source(
+        lambda: get_user_model().followers.through.objects.all(), 'new_followers',
+        author='from_customuser_id', timestamp=None,
+    ),
+}
+
+
+def add_counts(model, key, field, deltas):
+    """
+    Add `deltas`, {(key id, day): count}, to `field` of `model`'s rows,
+    creating the missing ones.
+    """
+    if not deltas:
+        return
+    rows = model.objects.select_for_update().filter(
+        **{f'{key}_id__in': {key_id for key_id, _ in deltas}},
+        day__in={day for _, day in deltas},
+    )
+    existing = {(getattr(row, f'{key}_id'), row.day): row for row in rows}
+    updated = []
+    for pair, count in deltas.items():
+        if pair in existing:
+            row = existing[pair]
+            setattr(row, field, getattr(row, field) + count)
+            updated.append(row)
+    model.objects.bulk_update(updated, [field])
+    # A concurrent batch creating the same row fails this one, which is retried
+    model.objects.bulk_create([
+        model(**{f'{key}_id': key_id}, day=day, **{field: count})
+        for (key_id, day), count in deltas.items() if (key_id, day) not in existing
+    ])
+
+
+def source_aliases(name):
+    """
+    The database shards holding source `name`, or [None] (the database the
+    routers pick) when it is not sharded.
+    """
+    if sharding.is_sharded(SOURCES[name].get_queryset().model):
+        return sharding.each_shard()
+    return [None]
+
+
+def ids_follow_creation(model):
+    """
+    Whether new rows of `model` get ascending ids. Sharded rows take theirs
+    from blocks reserved per process (posts.sharding.IdAllocator).
+    """
+    return not (sharding.enabled() and sharding.is_sharded(model))
+
+
+def pending_keys(queryset, mark, timestamp, batch_size, settled, fields=()):
+    """
+    [(id, timestamp, *fields)] of the next `batch_size` rows of `queryset`
+    after the Watermark `mark`, leaving out rows younger than `settled`. In
+    id order while the ids of the model follow creation order, else in
+    (timestamp, id) order.
+    """
+    if ids_follow_creation(queryset.model):
+        keys = []
+        pending = queryset.filter(pk__gt=mark.last_id).order_by('pk')
+        for key in pending.values_list('pk', timestamp, *fields)[:batch_size]:
+            if key[1] >= settled:
+                break
+            keys.append(key)
+        return keys
+
+    pending = queryset.filter(**{f'{timestamp}__lt': settled}).order_by(timestamp, 'pk')
+    if mark.last_created_at is None:
+        # Counted by id before sharding; the ids reserved since are higher
+        pending = pending.filter(pk__gt=mark.last_id)
+    else:
+        pending = pending.filter(
+            Q(**{f'{timestamp}__gt': mark.last_created_at})
+            | Q(**{timestamp: mark.last_created_at, 'pk__gt': mark.last_id})
+        )
+    return list(pending.values_list('pk', timestamp, *fields)[:batch_size])
+
+
+def run_batch(name, batch_size=None, alias=None):
+    """
+    Count the next batch of source `name`, on database shard `alias`, into
+    the rollups. Returns the number of rows counted, 0 once caught up.
+    """
+    source = SOURCES[name]
+    batch_size = batch_size or options()['BATCH_SIZE']
+    queryset = sharding.using(source.get_queryset(), alias)
+    watermark = name if alias in (None, DEFAULT_DB_ALIAS) else f'{name}@{alias}'
+    with transaction.atomic():
+        Watermark.objects.get_or_create(source=watermark)
+        # Concurrent runs take turns per source
+        mark = Watermark.objects.select_for_update().get(source=watermark)
+        if source.timestamp:
+            settled = timezone.now() - timedelta(seconds=options()['SETTLE_SECONDS'])
+            rows = pending_keys(queryset, mark, source.timestamp, batch_size, settled)
+            ids = [row[0] for row in rows]
+        else:
+            rows = None
+            ids = list(queryset.filter(pk__gt=mark.last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return 0
+
+        if ids_follow_creation(queryset.model):
+            batch = queryset.filter(pk__gt=mark.last_id, pk__lte=ids[-1]).order_by()
+        else:
+            batch = queryset.filter(pk__in=ids).order_by()
+        keys = {'author_key': F(source.author)}
+        if source.post:
+            keys['post_key'] = F(source.post)
+        if source.timestamp:
+            keys['day'] = TruncDate(source.timestamp)
+        today = timezone.now().date()
+        by_author, by_post = Counter(), Counter()
+        for row in batch.values(**keys).annotate(count=Count('pk')):
+            day = row.get('day', today)
+            by_author[row['author_key'], day] += row['count']
+            if source.post:
+                by_post[row['post_key'], day] += row['count']
+        add_counts(AuthorDailyStats, 'author', source.field, by_author)
+        add_counts(PostDailyStats, 'post', source.field, by_post)
+
+        if rows:
+            mark.last_id, mark.last_created_at = rows[-1][:2]
+        else:
+            mark.last_id = ids[-1]
+        mark.save(update_fields=['last_id', 'last_created_at', 'updated_at'])
+    return len(ids)
+
+
+def run(sources=None, batch_size=None, max_batches=None):
+    """
+    Count every source's new rows, batch after batch, until caught up or
+    `max_batches` per source and shard. Returns {source: {'rows', 'batches',
+    'elapsed_s'}}.
+    """
+    results = {}
+    for name in sources or SOURCES:
+        started = time.perf_counter()
+        rows = batches = 0
+        for alias in source_aliases(name):
+            shard_batches = 0
+            while max_batches is None or shard_batches < max_batches:
+                try:
+                    counted = run_batch(name, batch_size, alias)
+                except IntegrityError:
+                    # Lost a race to create a rollup row; the batch rolled back
+                    counted = run_batch(name, batch_size, alias)
+                if not counted:
+                    break
+                rows += counted
+                shard_batches += 1
+            batches += shard_batches
+        results[name] = {'rows': rows, 'batches': batches, 'elapsed_s': round(time.perf_counter() - started, 3)}
+    return results
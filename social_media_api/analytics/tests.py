@@ -0,0 +1,174 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from posts import sharding, trending
+from posts.models import Comment, Like, Post
+
+from . import rollups
+from .models import AuthorDailyStats, PostDailyStats, Watermark
+
+
+@override_settings(ANALYTICS={'SETTLE_SECONDS': 0})
+class RollupTestCase(APITestCase):
+    """
+    Tests for the incremental daily rollups and the /api/analytics/ endpoints.
+    """
+
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.fans = [CustomUser.objects.create_user(username=f'fan{i}', password='testpass123') for i in range(3)]
+        self.today = timezone.now().date()
+        self.post = self.create_post(days_ago=2)
+        # Two days ago: 3 likes and 1 comment; yesterday: 1 comment
+        for fan in self.fans:
+            self.like(fan, self.post, days_ago=2)
+        self.comment(self.fans[0], self.post, days_ago=2)
+        self.comment(self.fans[1], self.post, days_ago=1)
+        self.author.followers.add(*self.fans[:2])
+        self.client.force_authenticate(self.author)
+
+    def ago(self, days):
+        return timezone.now() - timedelta(days=days)
+
+    def create_post(self, days_ago):
+        post = Post.objects.create(author=self.author, title='Post', content='content')
+        Post.objects.filter(pk=post.pk).update(created_at=self.ago(days_ago))
+        return post
+
+    def like(self, user, post, days_ago):
+        like = Like.objects.create(user=user, post=post)
+        Like.objects.filter(pk=like.pk).update(created_at=self.ago(days_ago))
+
+    def comment(self, user, post, days_ago):
+        comment = Comment.objects.create(author=user, post=post, content='Nice')
+        Comment.objects.filter(pk=comment.pk).update(created_at=self.ago(days_ago))
+
+    def test_counts_per_author_and_post_and_day(self):
+        results = rollups.run()
+        self.assertEqual({name: result['rows'] for name, result in results.items()},
+                         {'post': 1, 'like': 3, 'comment': 2, 'follow': 2})
+
+        response = self.client.get('/api/analytics/', {'days': 3})
+        self.assertEqual(response.data['totals'], {'posts': 1, 'likes': 3, 'comments': 2, 'new_followers': 2})
+        self.assertEqual(
+            [(day['day'], day['likes'], day['comments'], day['new_followers']) for day in response.data['days']],
+            [
+                (self.today - timedelta(days=2), 3, 1, 0),
+                (self.today - timedelta(days=1), 0, 1, 0),
+                # Follows are counted on the day the job reads them
+                (self.today, 0, 0, 2),
+            ],
+        )
+
+        response = self.client.get(f'/api/analytics/posts/{self.post.pk}/', {'days': 2})
+        self.assertEqual(response.data['totals'], {'likes': 0, 'comments': 1})
+        self.assertEqual(len(response.data['days']), 2)
+
+    def test_runs_are_incremental(self):
+        rollups.run()
+        self.assertEqual(rollups.run()['like']['rows'], 0)
+
+        self.like(self.author, self.post, days_ago=2)
+        self.assertEqual(rollups.run()['like']['rows'], 1)
+        stats = PostDailyStats.objects.get(post=self.post, day=self.today - timedelta(days=2))
+        self.assertEqual((stats.likes, stats.comments), (4, 1))
+
+    def test_batches_cost_the_same_queries(self):
+        """
+        Watermark, ids and counts, then per rollup table a read, an update
+        of the existing rows and an insert of the new ones, whatever the
+        number of rows in the batch.
+        """
+        for _ in range(4):
+            self.like(self.fans[0], self.create_post(days_ago=2), days_ago=2)
+        rollups.run_batch('like', batch_size=1)
+        # Only updates
+        with self.assertNumQueries(11):
+            self.assertEqual(rollups.run_batch('like', batch_size=1), 1)
+        # Updates and inserts of post rows
+        with self.assertNumQueries(12):
+            self.assertEqual(rollups.run_batch('like', batch_size=5), 5)
+
+    def test_interrupted_batch_is_rolled_back_and_redone(self):
+        add_counts = rollups.add_counts
+
+        def fail_on_posts(model, *args):
+            if model is PostDailyStats:
+                raise RuntimeError('killed')
+            add_counts(model, *args)
+
+        with mock.patch.object(rollups, 'add_counts', fail_on_posts):
+            with self.assertRaises(RuntimeError):
+                rollups.run_batch('like')
+        self.assertFalse(AuthorDailyStats.objects.exists())
+        self.assertFalse(Watermark.objects.filter(source='like', last_id__gt=0).exists())
+
+        rollups.run()
+        self.assertEqual(AuthorDailyStats.objects.get(author=self.author, day=self.today - timedelta(days=2)).likes, 3)
+
+    @override_settings(ANALYTICS={'SETTLE_SECONDS': 3600})
+    def test_recent_rows_wait_to_settle(self):
+        Like.objects.create(user=self.author, post=self.post)
+        self.assertEqual(rollups.run()['like']['rows'], 3)
+        self.assertEqual(Watermark.objects.get(source='like').last_id, Like.objects.order_by('pk')[2].pk)
+
+    def test_post_analytics_are_private(self):
+        other = self.fans[0]
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/analytics/posts/{self.post.pk}/').status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/analytics/').status_code, 401)
+
+    def test_days_are_bounded(self):
+        self.assertEqual(len(self.client.get('/api/analytics/').data['days']), 30)
+        self.assertEqual(len(self.client.get('/api/analytics/', {'days': 10000}).data['days']), 365)
+        self.assertEqual(len(self.client.get('/api/analytics/', {'days': 'x'}).data['days']), 30)
+
+
+@override_settings(
+    DATABASE_SHARDS=['default', 'shard1', 'shard2'],
+    ANALYTICS={'SETTLE_SECONDS': 0}, TRENDING={'SETTLE_SECONDS': 0},
+)
+class ShardedRollupTestCase(APITestCase):
+    """
+    Tests for the rollup and trending watermarks of sharded rows, whose ids
+    come from blocks reserved per process.
+    """
+    databases = {'default', 'shard1', 'shard2'}
+
+    def setUp(self):
+        sharding.allocator.reset()
+        self.addCleanup(sharding.allocator.reset)
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.fans = [CustomUser.objects.create_user(username=f'fan{i}', password='testpass123') for i in range(3)]
+        # A second process with its own block of ids
+        self.other = sharding.IdAllocator()
+
+    def create_post(self, allocator):
+        post = Post(pk=allocator.take(Post)[0], author=self.author, title='Post', content='content')
+        post.save()
+        return post
+
+    def test_lower_ids_created_later_are_counted(self):
+        first = self.create_post(sharding.allocator)
+        second = self.create_post(self.other)
+        Like(pk=self.other.take(Like)[0], post=first, user=self.fans[0]).save()
+        self.assertGreater(second.pk, first.pk + 1)
+        rollups.run()
+        trending.update()
+
+        # Created after the run, below the ids counted by it
+        third = self.create_post(sharding.allocator)
+        self.assertLess(third.pk, second.pk)
+        Like(pk=sharding.allocator.take(Like)[0], post=third, user=self.fans[1]).save()
+        self.assertEqual(rollups.run()['post']['rows'], 1)
+        self.assertEqual(rollups.run()['post']['rows'], 0)
+        self.assertEqual(trending.update()['like']['rows'], 1)
+
+        self.assertEqual(AuthorDailyStats.objects.get(author=self.author).posts, 3)
+        self.assertEqual(AuthorDailyStats.objects.get(author=self.author).likes, 2)
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import author_analytics, post_analytics
+
+urlpatterns = [
+    path('', author_analytics, name='analytics'),
+    path('posts/<int:pk>/', post_analytics, name='post-analytics'),
+]
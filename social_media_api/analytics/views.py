@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from rest_framework import generics
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.utils import timezone
+
+from posts import sharding
+from posts.models import Post
+
+from . import rollups
+from .models import AuthorDailyStats, PostDailyStats
+
+AUTHOR_FIELDS = ['posts', 'likes', 'comments', 'new_followers']
+POST_FIELDS = ['likes', 'comments']
+
+def requested_days(request):
+    """
+    (first day, last day) of the `days` days up to today (default 30, at
+    most MAX_DAYS).
+    """
+    try:
+        days = int(request.query_params.get('days', 30))
+    except ValueError:
+        days = 30
+    days = max(1, min(days, rollups.options()['MAX_DAYS']))
+    end = timezone.now().date()
+    return end - timedelta(days=days - 1), end
+
+def daily_series(queryset, fields, start, end):
+    """
+    Every day from `start` to `end` with its counts (0 on days without a
+    rollup row), and the totals. One range scan of the rollup's
+    (key, day) index.
+    """
+    rows = {row['day']: row for row in queryset.filter(day__gte=start, day__lte=end).values('day', *fields)}
+    days = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        row = rows.get(day, {})
+        days.append({'day': day, **{field: row.get(field, 0) for field in fields}})
+    totals = {field: sum(day[field] for day in days) for field in fields}
+    return {'start': start, 'end': end, 'totals': totals, 'days': days}
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def author_analytics(request):
+    """
+    Posts written, and likes, comments and followers received by the
+    current user per day, oldest first. Counts lag by up to one rollup run
+    (see analytics.rollups).
+    """
+    start, end = requested_days(request)
+    stats = AuthorDailyStats.objects.filter(author=request.user)
+    return Response(daily_series(stats, AUTHOR_FIELDS, start, end))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def post_analytics(request, pk):
+    """
+    Likes and comments per day of one of the current user's posts.
+    """
+    posts = sharding.using(Post.objects.only('pk'), sharding.author_shard(request.user.pk))
+    post = generics.get_object_or_404(posts, pk=pk, author=request.user)
+    start, end = requested_days(request)
+    stats = PostDailyStats.objects.filter(post=post)
+    return Response({'post': post.pk, **daily_series(stats, POST_FIELDS, start, end)})
@@ -0,0 +1,40 @@
+"""
+Outbox handlers that turn domain events into notifications.
+"""
+from django.contrib.contenttypes.models import ContentType
+
+from outbox import events
+from posts.models import Post
+
+from .models import Notification
+
+
+@events.handler('post.liked')
+def notify_likes(liked):
+    """
+    Tell authors their post was liked, but not when they liked it themselves.
+    """
+    post_type = ContentType.objects.get_for_model(Post)
+    Notification.objects.bulk_create([
+        Notification(
+            recipient_id=event.payload['author_id'],
+            actor_id=event.payload['user_id'],
+            verb='liked your post',
+            target_content_type=post_type,
+            target_object_id=event.payload['post_id'],
+        )
+        for event in liked
+        if event.payload['author_id'] != event.payload['user_id']
+    ])
+
+
+@events.handler('user.followed')
+def notify_follows(followed):
+    Notification.objects.bulk_create([
+        Notification(
+            recipient_id=event.payload['user_id'],
+            actor_id=event.payload['follower_id'],
+            verb='started following you',
+        )
+        for event in followed
+    ])
@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream notification buckets older than NOTIFICATIONS_RETENTION_DAYS to '
+        'gzip-compressed NDJSON files, then drop them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', help='Directory to write <bucket>.ndjson.gz files to.')
+        parser.add_argument('--retention-days', type=int, default=None,
+                            help='Archive buckets older than this (default: NOTIFICATIONS_RETENTION_DAYS).')
+        parser.add_argument('--keep', action='store_true', help='Write the archives but keep the buckets.')
+
+    def handle(self, *args, **options):
+        output_dir = Path(options['output_dir'])
+        if not output_dir.is_dir():
+            raise CommandError(f'{output_dir} is not a directory.')
+
+        for name in partitions.expired_buckets(options['retention_days']):
+            path, rows = partitions.archive_bucket(name, output_dir)
+            self.stdout.write(f'{name}: {rows} rows -> {path}')
+            if not options['keep']:
+                partitions.drop_bucket(name)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Move read notifications older than NOTIFICATIONS_HOT_DAYS out of the hot '
+        'table into monthly buckets, and optionally drop buckets past retention.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Age of read notifications to move (default: NOTIFICATIONS_HOT_DAYS).')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows moved per transaction.')
+        parser.add_argument('--drop-expired', action='store_true',
+                            help='Drop buckets older than NOTIFICATIONS_RETENTION_DAYS without archiving them.')
+
+    def handle(self, *args, **options):
+        try:
+            moved = partitions.compact(options['older_than_days'], options['batch_size'])
+        except NotImplementedError as exc:
+            raise CommandError(str(exc))
+
+        for name, count in sorted(moved.items()):
+            self.stdout.write(f'{name}: moved {count}')
+        self.stdout.write(self.style.SUCCESS(f'Moved {sum(moved.values())} notifications'))
+
+        if options['drop_expired']:
+            for name in partitions.expired_buckets():
+                partitions.drop_bucket(name)
+                self.stdout.write(f'{name}: dropped')
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='target_object_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -8,13 +8,24 @@ class Notification(models.Model):
     actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='actions')
     verb = models.CharField(max_length=255)
     target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
-    target_object_id = models.PositiveIntegerField(null=True, blank=True)
+    # Big enough for the BigAutoField ids of the targets
+    target_object_id = models.PositiveBigIntegerField(null=True, blank=True)
     target = GenericForeignKey('target_content_type', 'target_object_id')
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Notification list of a recipient, newest first
+            models.Index(fields=['recipient', '-timestamp'], name='notif_recipient_ts_idx'),
+            # Unread notifications only; stays small as users read them
+            models.Index(
+                fields=['recipient', '-timestamp'],
+                name='notif_unread_idx',
+                condition=models.Q(read=False),
+            ),
+        ]
 
     def __str__(self):
         return f'{self.actor.username} {self.verb}'
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Monthly time buckets for old notifications.
+
+The notifications table only keeps what the list endpoint needs: unread
+notifications and read ones younger than NOTIFICATIONS_HOT_DAYS. Compaction
+moves older read notifications, in batches, into one bucket per month:
+
+- PostgreSQL: a partition of `notifications_notification_archive`, which is
+  partitioned by range on `timestamp`.
+- SQLite: a rolling shadow table with the same columns.
+
+Buckets are named `notifications_notification_YYYYMM`. Once a bucket is older
+than NOTIFICATIONS_RETENTION_DAYS it is dropped whole, optionally after being
+streamed to a gzip-compressed NDJSON file.
+"""
+import gzip
+import json
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Notification
+
+
+ARCHIVE_TABLE = 'notifications_notification_archive'
+BUCKET_PREFIX = 'notifications_notification_'
+BUCKET_RE = re.compile(rf'^{BUCKET_PREFIX}(\d{{4}})(\d{{2}})$')
+SUPPORTED_VENDORS = ('postgresql', 'sqlite')
+
+
+def hot_days():
+    return getattr(settings, 'NOTIFICATIONS_HOT_DAYS', 30)
+
+
+def retention_days():
+    return getattr(settings, 'NOTIFICATIONS_RETENTION_DAYS', 365)
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def bucket_name(month):
+    return f'{BUCKET_PREFIX}{month.year:04d}{month.month:02d}'
+
+
+def bucket_month(name):
+    match = BUCKET_RE.match(name)
+    return datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)
+
+
+def columns():
+    return [field.column for field in Notification._meta.concrete_fields]
+
+
+def check_vendor():
+    if connection.vendor not in SUPPORTED_VENDORS:
+        raise NotImplementedError(f'Notification buckets are not implemented for {connection.vendor}.')
+
+
+def list_buckets():
+    """
+    Existing bucket tables, oldest first.
+    """
+    with connection.cursor() as cursor:
+        names = connection.introspection.table_names(cursor)
+    return sorted(name for name in names if BUCKET_RE.match(name))
+
+
+def ensure_bucket(month):
+    """
+    Create the bucket for `month` if it does not exist yet.
+    """
+    check_vendor()
+    name = bucket_name(month)
+    table = connection.ops.quote_name(name)
+    hot = connection.ops.quote_name(Notification._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            archive = connection.ops.quote_name(ARCHIVE_TABLE)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {archive} (LIKE {hot} INCLUDING DEFAULTS) '
+                f'PARTITION BY RANGE ("timestamp")'
+            )
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} PARTITION OF {archive} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [month, next_month(month)],
+            )
+        else:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM {hot} WHERE 0')
+        index = connection.ops.quote_name(f'{name}_recipient_ts')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} (recipient_id, "timestamp")')
+    return name
+
+
+def compact(older_than_days=None, batch_size=1000):
+    """
+    Move read notifications older than `older_than_days` out of the hot table
+    into their month's bucket, `batch_size` rows per transaction.
+    Returns the number of rows moved per bucket.
+    """
+    check_vendor()
+    days = hot_days() if older_than_days is None else older_than_days
+    cutoff = timezone.now() - timedelta(days=days)
+    expired = Notification.objects.filter(read=True, timestamp__lt=cutoff).order_by('pk')
+    cols = ', '.join(connection.ops.quote_name(column) for column in columns())
+    hot = connection.ops.quote_name(Notification._meta.db_table)
+    moved = defaultdict(int)
+
+    while True:
+        batch = list(expired.values_list('pk', 'timestamp')[:batch_size])
+        if not batch:
+            return dict(moved)
+        by_month = defaultdict(list)
+        for pk, timestamp in batch:
+            by_month[month_start(timestamp)].append(pk)
+
+        with transaction.atomic():
+            for month, pks in by_month.items():
+                name = ensure_bucket(month)
+                placeholders = ', '.join(['%s'] * len(pks))
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f'INSERT INTO {connection.ops.quote_name(name)} ({cols}) '
+                        f'SELECT {cols} FROM {hot} WHERE id IN ({placeholders})',
+                        pks,
+                    )
+                moved[name] += len(pks)
+            Notification.objects.filter(pk__in=[pk for pk, _ in batch]).delete()
+
+
+def expired_buckets(retention=None):
+    """
+    Buckets whose whole month is older than the retention period.
+    """
+    days = retention_days() if retention is None else retention
+    cutoff = timezone.now() - timedelta(days=days)
+    return [name for name in list_buckets() if next_month(bucket_month(name)) <= cutoff]
+
+
+def drop_bucket(name):
+    if not BUCKET_RE.match(name):
+        raise ValueError(f'{name} is not a notification bucket.')
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {connection.ops.quote_name(name)}')
+
+
+def archive_bucket(name, directory, chunk_size=2000):
+    """
+    Stream a bucket to `<directory>/<name>.ndjson.gz`, one JSON object per
+    row, reading `chunk_size` rows at a time so memory stays flat.
+    Returns (path, rows written).
+    """
+    if not BUCKET_RE.match(name):
+        raise ValueError(f'{name} is not a notification bucket.')
+    cols = columns()
+    path = Path(directory) / f'{name}.ndjson.gz'
+    select = ', '.join(connection.ops.quote_name(column) for column in cols)
+    written = 0
+    # Write to a temporary name so a crash never leaves a truncated archive behind
+    partial = path.with_suffix('.partial')
+    with gzip.open(partial, 'wt', encoding='utf-8') as out, connection.cursor() as cursor:
+        cursor.execute(f'SELECT {select} FROM {connection.ops.quote_name(name)} ORDER BY id')
+        while rows := cursor.fetchmany(chunk_size):
+            for row in rows:
+                out.write(json.dumps(dict(zip(cols, row)), default=str))
+                out.write('\n')
+            written += len(rows)
+    partial.replace(path)
+    return path, written
@@ -1,11 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 
+from posts import sharding
+from posts.models import Comment, Post
+
 from .models import Notification
 
+
+User = get_user_model()
+
+# Fields shown for each kind of target. Only columns of the target row itself,
+# so rendering a summary never triggers another query.
+TARGET_SUMMARIES = {
+    Post: lambda post: {'title': post.title},
+    Comment: lambda comment: {'post': comment.post_id, 'content': comment.content[:100]},
+    User: lambda user: {'username': user.username},
+}
+
+
+def prefetch_targets(notifications):
+    """
+    Load the targets of `notifications` with one IN query per content type.
+    Posts and comments are asked of every database shard (see
+    posts.sharding); prefetch_related('target') would only read default.
+    """
+    field = Notification._meta.get_field('target')
+    sharded = {}
+    for notification in notifications:
+        if notification.target_content_type_id is None or field.is_cached(notification):
+            continue
+        model = ContentType.objects.get_for_id(notification.target_content_type_id).model_class()
+        if sharding.is_sharded(model):
+            sharded.setdefault(model, []).append(notification)
+    for model, group in sharded.items():
+        rows = sharding.in_bulk(model._base_manager.all(), {notification.target_object_id for notification in group})
+        for notification in group:
+            field.set_cached_value(notification, rows.get(notification.target_object_id))
+    # Users and any other type
+    prefetch_related_objects(notifications, 'target')
+
+
+class NotificationListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        notifications = list(data.all() if hasattr(data, 'all') else data)
+        prefetch_targets(notifications)
+        return super().to_representation(notifications)
+
+
 class NotificationSerializer(serializers.ModelSerializer):
     actor = serializers.StringRelatedField(read_only=True)
+    target = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
-        fields = ['id', 'recipient', 'actor', 'verb', 'target_content_type', 'target_object_id', 'timestamp', 'read']
-        read_only_fields = ['id', 'recipient', 'actor', 'verb', 'target_content_type', 'target_object_id', 'timestamp']
\ No newline at end of file
+        fields = ['id', 'recipient', 'actor', 'verb', 'target_content_type', 'target_object_id', 'target', 'timestamp', 'read']
+        read_only_fields = ['id', 'recipient', 'actor', 'verb', 'target_content_type', 'target_object_id', 'timestamp']
+        list_serializer_class = NotificationListSerializer
+
+    def get_target(self, obj):
+        """
+        Compact summary of the target, or None when it is gone. Targets are
+        loaded for the whole list by prefetch_targets().
+        """
+        if obj.target_content_type_id is None:
+            return None
+        target = obj.target
+        if target is None or getattr(target, 'deleted_at', None) is not None:
+            return None
+        # Served from ContentType's in-process cache, not the database
+        content_type = ContentType.objects.get_for_id(obj.target_content_type_id)
+        summary = {'type': f'{content_type.app_label}.{content_type.model}', 'id': target.pk}
+        summarize = TARGET_SUMMARIES.get(type(target))
+        if summarize is not None:
+            summary.update(summarize(target))
+        return summary
\ No newline at end of file
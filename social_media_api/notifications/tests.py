@@ -1,3 +1,117 @@
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from posts.models import Comment, Post
+
+from . import partitions
+from .models import Notification
+
+
+class NotificationListTestCase(APITestCase):
+    """
+    Tests for the notification list and its embedded target summaries.
+    """
+
+    def setUp(self):
+        self.recipient = CustomUser.objects.create_user(username='recipient', password='testpass123')
+        post_type = ContentType.objects.get_for_model(Post)
+        comment_type = ContentType.objects.get_for_model(Comment)
+        for i in range(3):
+            actor = CustomUser.objects.create_user(username=f'actor{i}', password='testpass123')
+            post = Post.objects.create(author=self.recipient, title=f'Post {i}', content='content')
+            comment = Comment.objects.create(post=post, author=actor, content=f'Comment {i}')
+            Notification.objects.create(
+                recipient=self.recipient, actor=actor, verb='liked your post',
+                target_content_type=post_type, target_object_id=post.pk,
+            )
+            Notification.objects.create(
+                recipient=self.recipient, actor=actor, verb='commented on your post',
+                target_content_type=comment_type, target_object_id=comment.pk,
+            )
+        self.client.force_authenticate(self.recipient)
+
+    def test_targets_resolved_in_one_query_per_type(self):
+        """
+        One query for the count, one for the notifications and actors, one
+        per target type.
+        """
+        with self.assertNumQueries(4):
+            response = self.client.get('/notifications/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 6)
+        liked = next(item for item in response.data['results'] if item['verb'] == 'liked your post')
+        self.assertEqual(liked['target']['type'], 'posts.post')
+        self.assertTrue(liked['target']['title'].startswith('Post'))
+        commented = next(item for item in response.data['results'] if item['verb'] == 'commented on your post')
+        self.assertEqual(commented['target']['type'], 'posts.comment')
+        self.assertIn('post', commented['target'])
+
+    def test_missing_or_deleted_target_is_null(self):
+        Post.objects.get(title='Post 0').soft_delete()
+        Comment.objects.filter(content='Comment 1').delete()
+
+        response = self.client.get('/notifications/')
+
+        self.assertEqual(sum(1 for item in response.data['results'] if item['target'] is None), 2)
+
+    def test_target_id_holds_big_ids(self):
+        notification = Notification.objects.create(
+            recipient=self.recipient, actor=self.recipient, verb='test',
+            target_content_type=ContentType.objects.get_for_model(Post), target_object_id=2 ** 40,
+        )
+        notification.refresh_from_db()
+        self.assertEqual(notification.target_object_id, 2 ** 40)
+
+
+class NotificationBucketTestCase(TestCase):
+    """
+    Tests for moving old notifications into monthly buckets and archiving them.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        now = timezone.now()
+        self.old = now - timedelta(days=400)
+        for age, read in [(400, True), (400, True), (60, True), (60, False), (1, True)]:
+            notification = Notification.objects.create(recipient=self.user, actor=self.user, verb='test', read=read)
+            Notification.objects.filter(pk=notification.pk).update(timestamp=now - timedelta(days=age))
+
+    def tearDown(self):
+        for name in partitions.list_buckets():
+            partitions.drop_bucket(name)
+
+    def test_compact_moves_old_read_notifications(self):
+        """
+        Only read notifications past the hot window leave the hot table.
+        """
+        moved = partitions.compact(older_than_days=30, batch_size=1)
+
+        self.assertEqual(sum(moved.values()), 3)
+        self.assertEqual(len(moved), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(Notification.objects.filter(read=True, timestamp__lt=timezone.now() - timedelta(days=30)).exists())
+        self.assertIn(partitions.bucket_name(partitions.month_start(self.old)), partitions.list_buckets())
+
+    def test_archive_streams_expired_buckets_then_drops_them(self):
+        call_command('compact_notifications', older_than_days=30, stdout=StringIO())
+        expired = partitions.bucket_name(partitions.month_start(self.old))
+
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_notifications', directory, retention_days=365, stdout=StringIO())
+            with gzip.open(f'{directory}/{expired}.ndjson.gz', 'rt') as archive:
+                rows = [json.loads(line) for line in archive]
 
-# Create your tests here.
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['verb'], 'test')
+        self.assertEqual(partitions.list_buckets(), [partitions.bucket_name(partitions.month_start(timezone.now() - timedelta(days=60)))])
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import NotificationListView, mark_notification_read
+from .views import NotificationListView, mark_notification_read, notification_list_async
 
 urlpatterns = [
     path('', NotificationListView.as_view(), name='notification-list'),
+    path('async/', notification_list_async, name='notification-list-async'),
     path('<int:pk>/read/', mark_notification_read, name='mark-notification-read'),
 ]
\ No newline at end of file
@@ -1,16 +1,45 @@
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
+from accounts import blocks
+from posts.views import StandardResultsSetPagination
+from social_media_api.async_api import async_api_view, json_response, page_bounds, paginated
+
 from .models import Notification
-from .serializers import NotificationSerializer
+from .serializers import NotificationSerializer, prefetch_targets
+
+def get_notification_queryset(user, hidden=()):
+    notifications = Notification.objects.filter(recipient=user)
+    if hidden:
+        # Users the recipient muted or blocked (accounts.blocks)
+        notifications = notifications.exclude(actor_id__in=list(hidden))
+    # Targets are fetched by NotificationListSerializer, one IN query per content type
+    return notifications.select_related('actor')
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return get_notification_queryset(self.request.user, blocks.hidden_ids(self.request.user.pk))
+
+@async_api_view(['GET'])
+async def notification_list_async(request):
+    """
+    NotificationListView on the async ORM.
+    """
+    pagination = StandardResultsSetPagination()
+    page, size = page_bounds(request, pagination)
+    queryset = get_notification_queryset(request.user, await blocks.ahidden_ids(request.user.pk))
+    count = await queryset.acount()
+    notifications = [notification async for notification in queryset[(page - 1) * size:page * size]]
+    # Loaded here, so serializing does not touch the database
+    await sync_to_async(prefetch_targets)(notifications)
+    results = NotificationSerializer(notifications, many=True).data
+    return json_response(paginated(request, pagination, page, size, count, results))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -0,0 +1,195 @@
+"""
+Transactional outbox for domain events.
+
+A view that changes data and has side effects (notify the post's author,
+mark followers' feeds stale, ...) does not perform them inline. It
+`publish`es an Event in the same transaction as its change: one extra
+INSERT, committed or rolled back with the change itself, so an event exists
+exactly when its change does.
+
+The relay (`manage.py relay_outbox`) drains the outbox in batches, oldest id
+first. Runs of consecutive events with the same topic are passed together to
+each handler registered for the topic, so a consumer catches up with one
+bulk write instead of one per event.
+
+Delivery is recorded per event and handler. Handlers run in the relay's
+transaction, which also deletes the events every handler took and adds each
+handler that succeeded to the `delivered_to` of the events kept for a retry.
+A retry skips those handlers:
+- A handler's database writes commit in the same transaction as the record
+  that it took the event, so they are made once per event and handler, even
+  when another handler of the topic fails. An interrupted relay rolls back
+  both.
+- Other side effects (cache writes) are not rolled back, so they repeat when
+  the relay is interrupted after them. Handlers with such side effects
+  must be idempotent.
+
+When a handler fails on a run of events, it is retried on each event on its
+own, so one bad event does not hold back the others. Events that still fail
+are kept with their error and retried by later relays, up to MAX_ATTEMPTS;
+after that they stay in the table for inspection (`relay_outbox
+--retry-failed` puts them back in line). A failed event is thus delivered
+after events published later.
+
+Events are drained in id order, not by a stored position. An event whose
+transaction commits after a higher id was delivered is still found by the
+next batch.
+
+Handlers are registered with `@handler(topic)` in the modules that own the
+side effects, imported from their AppConfig.ready().
+
+Settings (OUTBOX dict): BATCH_SIZE, MAX_ATTEMPTS.
+"""
+import logging
+from collections import defaultdict
+from itertools import groupby
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Event
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'MAX_ATTEMPTS': 5,
+}
+
+HANDLERS = defaultdict(list)
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'OUTBOX', {})}
+
+
+def handler(topic):
+    """
+    Register the decorated function for `topic`. It is called with a list
+    of Events, oldest first. Side effects outside the database must accept
+    being repeated (see above).
+    """
+    def register(func):
+        HANDLERS[topic].append(func)
+        return func
+    return register
+
+
+def publish(topic, payload):
+    """
+    Add an event to the outbox. Call it inside the transaction of the change
+    the event describes.
+    """
+    return Event.objects.create(topic=topic, payload=payload)
+
+
+def publish_many(topic, payloads):
+    return Event.objects.bulk_create([Event(topic=topic, payload=payload) for payload in payloads])
+
+
+def call(func, events):
+    """
+    Run `func` on `events` in a savepoint. Returns the error, or None.
+    """
+    try:
+        with transaction.atomic():
+            func(events)
+    except Exception as exc:
+        return f'{func.__qualname__}: {type(exc).__name__}: {exc}'
+    return None
+
+
+def handler_name(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def deliver(topic, events):
+    """
+    Pass a run of `topic` events to each of its handlers that has not taken
+    them yet, adding the handler to their `delivered_to` when it succeeds.
+    Returns {event id: error} for the events a handler failed on.
+    """
+    errors = {}
+    for func in HANDLERS.get(topic, ()):
+        name = handler_name(func)
+        pending = [event for event in events if name not in event.delivered_to]
+        if not pending:
+            continue
+        error = call(func, pending)
+        if error is None:
+            delivered = pending
+        elif len(pending) > 1:
+            logger.info('Outbox handler failed on %d events, retrying one by one: %s', len(pending), error)
+            delivered = []
+            for event in pending:
+                event_error = call(func, [event])
+                if event_error is None:
+                    delivered.append(event)
+                else:
+                    errors[event.pk] = event_error
+        else:
+            delivered = []
+            errors[pending[0].pk] = error
+        for event in delivered:
+            event.delivered_to.append(name)
+    for event_id, error in errors.items():
+        logger.error('Outbox event %s (%s) not delivered: %s', event_id, topic, error)
+    return errors
+
+
+def relay_batch(batch_size=None, skip=()):
+    """
+    Deliver the oldest pending events but those in `skip`, at most
+    `batch_size` of them. Returns the ids of the events delivered and of
+    those that failed; both are empty once the outbox is drained.
+    """
+    config = options()
+    with transaction.atomic():
+        # Concurrent relays take different events
+        events = list(
+            Event.objects.select_for_update(skip_locked=True)
+            .filter(attempts__lt=config['MAX_ATTEMPTS'])
+            .exclude(pk__in=skip)
+            .order_by('pk')[:batch_size or config['BATCH_SIZE']]
+        )
+        errors = {}
+        for topic, run in groupby(events, key=lambda event: event.topic):
+            errors.update(deliver(topic, list(run)))
+
+        failed = [event for event in events if event.pk in errors]
+        for event in failed:
+            event.attempts += 1
+            event.last_error = errors[event.pk]
+        # With the handlers that took them, in the transaction of their writes
+        Event.objects.bulk_update(failed, ['attempts', 'last_error', 'delivered_to'])
+        delivered = [event.pk for event in events if event.pk not in errors]
+        Event.objects.filter(pk__in=delivered).delete()
+    return delivered, [event.pk for event in failed]
+
+
+def relay(batch_size=None, max_batches=None):
+    """
+    Deliver pending events batch after batch until the outbox is drained
+    (failed events aside) or `max_batches` ran. Returns
+    {'delivered', 'failed', 'batches'}.
+    """
+    totals = {'delivered': 0, 'failed': 0, 'batches': 0}
+    # Failed events are retried by the next relay, not by the next batch
+    failed_ids = set()
+    while max_batches is None or totals['batches'] < max_batches:
+        delivered, failed = relay_batch(batch_size, skip=failed_ids)
+        if not delivered and not failed:
+            break
+        failed_ids.update(failed)
+        totals['delivered'] += len(delivered)
+        totals['failed'] += len(failed)
+        totals['batches'] += 1
+    return totals
+
+
+def retry_failed():
+    """
+    Give events that used up their attempts another round. Returns how many.
+    """
+    return Event.objects.filter(attempts__gte=options()['MAX_ATTEMPTS']).update(attempts=0)
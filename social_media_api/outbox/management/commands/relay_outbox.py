@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from outbox import events
+from outbox.models import Event
+
+
+class Command(BaseCommand):
+    help = (
+        'Deliver pending outbox events to their handlers in batches, oldest '
+        'first. With --loop, keep polling for new events.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events per transaction (default: OUTBOX["BATCH_SIZE"]).')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches.')
+        parser.add_argument('--loop', action='store_true', help='Keep relaying until interrupted.')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop.')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='First give events that used up their attempts another round.')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            self.stdout.write(f'Retrying {events.retry_failed()} failed events')
+
+        while True:
+            started = time.perf_counter()
+            totals = events.relay(options['batch_size'], options['max_batches'])
+            elapsed = time.perf_counter() - started
+            if totals['batches'] or not options['loop']:
+                rate = totals['delivered'] / elapsed if elapsed else 0
+                self.stdout.write(
+                    f'Delivered {totals["delivered"]} events in {totals["batches"]} batches '
+                    f'({rate:.0f}/s), {totals["failed"]} failed'
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        dead = Event.objects.filter(attempts__gte=events.options()['MAX_ATTEMPTS']).count()
+        if dead:
+            self.stdout.write(self.style.WARNING(f'{dead} events used up their attempts; see --retry-failed'))
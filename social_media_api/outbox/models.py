@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class Event(models.Model):
+    """
+    A domain event waiting to be delivered to its handlers. Written in the
+    transaction of the change it describes, deleted once delivered (see
+    outbox.events).
+    """
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Failed deliveries; events are retried until MAX_ATTEMPTS
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Handlers that already took the event, skipped when it is retried
+    delivered_to = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f'{self.topic} #{self.pk}'
@@ -0,0 +1,158 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from notifications.models import Notification
+from posts import feed_cache
+from posts.models import Post
+
+from . import events
+from .models import Event
+
+
+class OutboxTestCase(APITestCase):
+    """
+    Tests for publishing domain events and relaying them to their handlers.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.reader = CustomUser.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Post', content='content')
+        self.calls = []
+
+    def register(self, topic, func):
+        events.handler(topic)(func)
+        self.addCleanup(events.HANDLERS[topic].remove, func)
+
+    def record(self, batch):
+        self.calls.append([event.payload['n'] for event in batch])
+
+    def test_event_rolls_back_with_its_change(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Post.objects.create(author=self.author, title='Lost', content='content')
+                events.publish('post.created', {'author_id': self.author.pk, 'post_ids': []})
+                raise ValueError
+        self.assertFalse(Event.objects.exists())
+
+    def test_runs_of_a_topic_are_delivered_together_in_order(self):
+        self.register('test.a', self.record)
+        self.register('test.b', self.record)
+        events.publish_many('test.a', [{'n': 1}, {'n': 2}])
+        events.publish('test.b', {'n': 3})
+        events.publish_many('test.a', [{'n': 4}, {'n': 5}, {'n': 6}])
+
+        totals = events.relay(batch_size=4)
+
+        self.assertEqual(totals, {'delivered': 6, 'failed': 0, 'batches': 2})
+        self.assertEqual(self.calls, [[1, 2], [3], [4], [5, 6]])
+        self.assertFalse(Event.objects.exists())
+
+    @override_settings(OUTBOX={'MAX_ATTEMPTS': 2})
+    def test_failing_event_does_not_hold_back_the_others(self):
+        def handle(batch):
+            if any(event.payload['n'] == 2 for event in batch):
+                raise ValueError('bad event')
+            self.record(batch)
+        self.register('test.a', handle)
+        events.publish_many('test.a', [{'n': 1}, {'n': 2}, {'n': 3}])
+
+        self.assertEqual(events.relay(), {'delivered': 2, 'failed': 1, 'batches': 1})
+        self.assertEqual(self.calls, [[1], [3]])
+        failed = Event.objects.get()
+        self.assertEqual((failed.payload, failed.attempts), ({'n': 2}, 1))
+        self.assertIn('ValueError: bad event', failed.last_error)
+
+        # Retried by the next relay until it used up its attempts
+        self.assertEqual(events.relay()['failed'], 1)
+        self.assertEqual(events.relay(), {'delivered': 0, 'failed': 0, 'batches': 0})
+        self.assertEqual(Event.objects.get().attempts, 2)
+
+        self.assertEqual(events.retry_failed(), 1)
+        self.assertEqual(Event.objects.get().attempts, 0)
+
+    def test_failing_handler_does_not_rerun_the_others(self):
+        broken = [True]
+
+        def handle(batch):
+            if broken[0]:
+                raise ValueError('handler down')
+            self.calls.append(['second'])
+        self.register('test.a', self.record)
+        self.register('test.a', handle)
+        events.publish('test.a', {'n': 1})
+
+        self.assertEqual(events.relay()['failed'], 1)
+        self.assertEqual(events.relay()['failed'], 1)
+        self.assertEqual(Event.objects.get().delivered_to, [events.handler_name(self.record)])
+        broken[0] = False
+        self.assertEqual(events.relay()['delivered'], 1)
+
+        # The first handler ran on the first relay only
+        self.assertEqual(self.calls, [[1], ['second']])
+        self.assertFalse(Event.objects.exists())
+
+    def test_failing_handler_does_not_duplicate_notifications(self):
+        def fail(batch):
+            raise ValueError('handler down')
+        self.register('post.liked', fail)
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+
+        events.relay()
+        events.relay()
+
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(Event.objects.get().attempts, 2)
+
+    def test_like_notifies_through_the_outbox(self):
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.client.force_authenticate(self.author)
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.assertFalse(Notification.objects.exists())
+
+        events.relay()
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.actor), (self.author, self.reader))
+        self.assertEqual((notification.verb, notification.target), ('liked your post', self.post))
+
+    def test_follow_notifies_once(self):
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/follow/{self.author.pk}/')
+        self.client.post(f'/api/follow/{self.author.pk}/')
+
+        events.relay()
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.recipient, notification.actor), (self.author, self.reader))
+        self.assertEqual(notification.verb, 'started following you')
+
+    def test_new_posts_mark_followers_feeds_stale(self):
+        self.author.followers.add(self.reader)
+        self.client.force_authenticate(self.author)
+        self.client.post('/api/posts/bulk/', [{'title': 'Post', 'content': 'content'}] * 3, format='json')
+        self.assertIsNone(cache.get(feed_cache.stale_key(self.reader.pk)))
+
+        # One query for the followers of every author in the run, in a relay
+        # of two batches (the second finds the outbox empty) and a savepoint
+        # per handler call
+        with self.assertNumQueries(10):
+            events.relay()
+        self.assertIsNotNone(cache.get(feed_cache.stale_key(self.reader.pk)))
+
+    def test_command(self):
+        self.register('test.a', self.record)
+        events.publish_many('test.a', [{'n': 1}, {'n': 2}])
+        out = StringIO()
+        call_command('relay_outbox', '--batch-size', '1', stdout=out)
+        self.assertIn('Delivered 2 events in 2 batches', out.getvalue())
+        self.assertEqual(self.calls, [[1], [2]])
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
+
+    def ready(self):
+        from django.db.models.signals import pre_save
+
+        # Registers the outbox handlers
+        from . import handlers, sharding
+
+        # Ids of sharded rows come from one sequence across the shards
+        for name in ('Post', 'Comment', 'Like'):
+            pre_save.connect(sharding.assign_id, sender=self.get_model(name), dispatch_uid=f'posts.sharding.{name}')
@@ -0,0 +1,167 @@
+"""
+Sharded counters for hot posts.
+
+A post's counters (e.g. `likes_count`) normally live on the post row and are
+updated with `UPDATE ... SET likes_count = likes_count + 1`. When thousands of
+likes per minute hit one post, every one of those updates waits for the same
+row lock.
+
+Once a post's write rate crosses PROMOTE_WRITES_PER_MINUTE it is promoted: N
+PostCounterShard rows are created per counter and `Post.counter_shards` is set
+to N. From then on each write updates one shard chosen at random, so
+concurrent writers rarely touch the same row. A counter's value is the column
+plus the sum of its shards; the sum is cached for CACHE_SECONDS.
+
+The write rate is measured per process, in fixed one-minute windows, so the
+threshold applies to each process separately.
+
+The post row is written on its author's database shard (see posts.sharding);
+PostCounterShard rows stay on default.
+
+Settings (SHARDED_COUNTERS dict): SHARDS, PROMOTE_WRITES_PER_MINUTE,
+CACHE_SECONDS.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+
+from . import sharding
+
+DEFAULTS = {
+    'SHARDS': 16,
+    'PROMOTE_WRITES_PER_MINUTE': 600,
+    'CACHE_SECONDS': 2,
+}
+
+WINDOW_SECONDS = 60
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'SHARDED_COUNTERS', {})}
+
+
+def cache_key(post_id, field):
+    return f'posts:counter:{post_id}:{field}'
+
+
+class WriteRate:
+    """
+    Writes per post in the current one-minute window, for this process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.window = None
+            self.counts = {}
+
+    def hit(self, post_id, now=None):
+        """
+        Count one write and return the post's writes in the current window.
+        """
+        window = int((now or time.monotonic()) // WINDOW_SECONDS)
+        with self.lock:
+            if window != self.window:
+                self.window, self.counts = window, {}
+            self.counts[post_id] = self.counts.get(post_id, 0) + 1
+            return self.counts[post_id]
+
+
+write_rate = WriteRate()
+
+
+def promote(post, shards=None):
+    """
+    Switch `post` to sharded counters. Safe to call from several processes;
+    the first one wins and the others keep its shard count.
+    """
+    from .models import Post, PostCounterShard
+
+    shards = shards or options()['SHARDS']
+    fields = [field.name for field in Post._meta.concrete_fields if field.name.endswith('_count')]
+    alias = sharding.shard_of(post)
+    with sharding.atomic(alias):
+        # The row lock taken here serialises concurrent promotions
+        if sharding.using(Post.all_objects, alias).filter(pk=post.pk, counter_shards=0).update(counter_shards=shards):
+            PostCounterShard.objects.bulk_create(
+                [PostCounterShard(post_id=post.pk, field=field, shard=shard)
+                 for field in fields for shard in range(shards)],
+                ignore_conflicts=True,
+            )
+    post.refresh_from_db(using=alias, fields=['counter_shards'])
+    return post.counter_shards
+
+
+def increment(post, field, delta=1):
+    """
+    Add `delta` to one of the post's counters. Promotes the post to sharded
+    counters once it is written to often enough.
+    """
+    from .models import Post, PostCounterShard
+
+    if not post.counter_shards and delta > 0:
+        if write_rate.hit(post.pk) >= options()['PROMOTE_WRITES_PER_MINUTE']:
+            promote(post)
+
+    if post.counter_shards:
+        updated = PostCounterShard.objects.filter(
+            post_id=post.pk, field=field, shard=random.randrange(post.counter_shards),
+        ).update(value=F('value') + delta)
+        if updated:
+            return
+    # Unsharded, or a shard has not been created yet: the column is always valid
+    sharding.using(Post.all_objects, sharding.shard_of(post)).filter(pk=post.pk).update(**{field: F(field) + delta})
+
+
+def shard_totals(posts, field):
+    """
+    {post_id: sum of shards} for the sharded posts among `posts`, from the
+    cache where possible and with one query for the rest.
+    """
+    from .models import PostCounterShard
+
+    sharded = [post.pk for post in posts if post.counter_shards]
+    if not sharded:
+        return {}
+    keys = {cache_key(post_id, field): post_id for post_id in sharded}
+    totals = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [post_id for post_id in sharded if post_id not in totals]
+    if missing:
+        rows = (
+            PostCounterShard.objects.filter(post_id__in=missing, field=field)
+            .values('post_id').annotate(total=Sum('value')).order_by()
+        )
+        fetched = {post_id: 0 for post_id in missing}
+        fetched.update({row['post_id']: row['total'] for row in rows})
+        cache.set_many({cache_key(post_id, field): total for post_id, total in fetched.items()},
+                       options()['CACHE_SECONDS'])
+        totals.update(fetched)
+    return totals
+
+
+def preload(posts, field):
+    """
+    Store each post's full counter value on it as `_<field>`, so serializing
+    a page of posts costs at most one query. Returns the posts.
+    """
+    totals = shard_totals(posts, field)
+    for post in posts:
+        setattr(post, f'_{field}', getattr(post, field) + totals.get(post.pk, 0))
+    return posts
+
+
+def value(post, field):
+    """
+    The current value of one of the post's counters.
+    """
+    preloaded = getattr(post, f'_{field}', None)
+    if preloaded is not None:
+        return preloaded
+    return getattr(preload([post], field)[0], f'_{field}')
@@ -0,0 +1,186 @@
+"""
+Per-user feed page cache with stale-while-revalidate and single-flight.
+
+Each feed page is cached under the user and the page's URL, together with the
+time it was computed. A page is fresh for TTL seconds, then stale for another
+STALE_TTL seconds. Within that time one request recomputes it, and the others
+keep serving the stale copy instead of recomputing it too.
+
+Recomputing is single-flight: the request that wins `cache.add` on the page's
+lock key computes it. The others serve the stale copy if there is one, or
+poll for up to WAIT seconds for the winner's result. A request still without
+a page after that computes it itself, so a crashed winner delays requests but
+does not fail them. The lock expires after LOCK_TIMEOUT seconds.
+
+A new post marks the feeds of the author's followers stale when the outbox
+relay delivers its 'post.created' event (see posts.handlers): one query for
+the follower ids, and one `set_many` of a per-user timestamp, which is checked
+against the time each page was computed. Following or unfollowing someone
+marks the follower's own feed stale.
+
+Each lookup counts as a hit, a miss or a stale hit; the counts are kept in
+the cache so every process adds to the same totals (see `feed_cache_stats`).
+The cache must be shared (Redis, Memcached) for single-flight to span
+processes.
+
+Settings (FEED_CACHE dict): TTL, STALE_TTL, LOCK_TIMEOUT, WAIT.
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+DEFAULTS = {
+    'TTL': 10,
+    'STALE_TTL': 60,
+    'LOCK_TIMEOUT': 10,
+    'WAIT': 2,
+}
+
+OUTCOMES = ('hit', 'miss', 'stale')
+
+POLL_SECONDS = 0.05
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'FEED_CACHE', {})}
+
+
+def page_key(user, url):
+    return f'feed:page:{user.pk}:' + hashlib.sha256(url.encode()).hexdigest()[:32]
+
+
+def stale_key(user_id):
+    return f'feed:stale:{user_id}'
+
+
+def stats_key(outcome):
+    return f'feed:stats:{outcome}'
+
+
+def invalidate(user_ids):
+    """
+    Mark every cached feed page of `user_ids` stale.
+    """
+    now = time.time()
+    timeout = options()['TTL'] + options()['STALE_TTL']
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), 1000):
+        cache.set_many({stale_key(user_id): now for user_id in user_ids[start:start + 1000]}, timeout)
+
+
+def stats():
+    """
+    {outcome: lookups} across every process sharing the cache.
+    """
+    counts = cache.get_many([stats_key(outcome) for outcome in OUTCOMES])
+    return {outcome: counts.get(stats_key(outcome), 0) for outcome in OUTCOMES}
+
+
+def reset_stats():
+    cache.delete_many([stats_key(outcome) for outcome in OUTCOMES])
+
+
+def count(outcome):
+    try:
+        cache.incr(stats_key(outcome))
+    except ValueError:
+        cache.add(stats_key(outcome), 1, None)
+
+
+def is_fresh(entry, invalidated_at, now):
+    return entry['computed_at'] > (invalidated_at or 0) and now - entry['computed_at'] < options()['TTL']
+
+
+def store(key, value, computed_at):
+    config = options()
+    cache.set(key, {'value': value, 'computed_at': computed_at}, config['TTL'] + config['STALE_TTL'])
+
+
+def get_or_compute(key, user, compute):
+    """
+    (page, outcome) for the page cached under `key`, calling `compute()`
+    when it has to be recomputed.
+    """
+    entries = cache.get_many([key, stale_key(user.pk)])
+    entry, invalidated_at = entries.get(key), entries.get(stale_key(user.pk))
+    now = time.time()
+    if entry is not None and is_fresh(entry, invalidated_at, now):
+        count('hit')
+        return entry['value'], 'hit'
+
+    lock, token = f'{key}:lock', uuid.uuid4().hex
+    if cache.add(lock, token, options()['LOCK_TIMEOUT']):
+        try:
+            value = compute()
+            store(key, value, now)
+        finally:
+            if cache.get(lock) == token:
+                cache.delete(lock)
+        count('miss')
+        return value, 'miss'
+
+    if entry is not None:
+        count('stale')
+        return entry['value'], 'stale'
+
+    deadline = time.monotonic() + options()['WAIT']
+    while time.monotonic() < deadline:
+        time.sleep(POLL_SECONDS)
+        entry = cache.get(key)
+        if entry is not None:
+            count('hit')
+            return entry['value'], 'hit'
+    value = compute()
+    count('miss')
+    return value, 'miss'
+
+
+async def aget_or_compute(key, user, compute):
+    """
+    get_or_compute() for async views; `compute` is a coroutine function.
+    """
+    entries = await cache.aget_many([key, stale_key(user.pk)])
+    entry, invalidated_at = entries.get(key), entries.get(stale_key(user.pk))
+    now = time.time()
+    if entry is not None and is_fresh(entry, invalidated_at, now):
+        await acount('hit')
+        return entry['value'], 'hit'
+
+    lock, token = f'{key}:lock', uuid.uuid4().hex
+    if await cache.aadd(lock, token, options()['LOCK_TIMEOUT']):
+        try:
+            value = await compute()
+            config = options()
+            await cache.aset(key, {'value': value, 'computed_at': now}, config['TTL'] + config['STALE_TTL'])
+        finally:
+            if await cache.aget(lock) == token:
+                await cache.adelete(lock)
+        await acount('miss')
+        return value, 'miss'
+
+    if entry is not None:
+        await acount('stale')
+        return entry['value'], 'stale'
+
+    deadline = time.monotonic() + options()['WAIT']
+    while time.monotonic() < deadline:
+        await asyncio.sleep(POLL_SECONDS)
+        entry = await cache.aget(key)
+        if entry is not None:
+            await acount('hit')
+            return entry['value'], 'hit'
+    value = await compute()
+    await acount('miss')
+    return value, 'miss'
+
+
+async def acount(outcome):
+    try:
+        await cache.aincr(stats_key(outcome))
+    except ValueError:
+        await cache.aadd(stats_key(outcome), 1, None)
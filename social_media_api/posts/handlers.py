@@ -0,0 +1,20 @@
+"""
+Outbox handlers for posts.
+"""
+from django.contrib.auth import get_user_model
+
+from outbox import events
+
+from . import feed_cache
+
+
+@events.handler('post.created')
+def invalidate_follower_feeds(created):
+    """
+    Mark the feeds of the new posts' authors' followers stale, with one
+    query for the followers of every author in the run. Idempotent.
+    """
+    through = get_user_model().followers.through
+    author_ids = {event.payload['author_id'] for event in created}
+    followers = through.objects.filter(from_customuser_id__in=author_ids).values_list('to_customuser_id', flat=True)
+    feed_cache.invalidate(set(followers.iterator()))
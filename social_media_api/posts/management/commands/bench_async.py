@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import tracemalloc
+
+from asgiref.sync import sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+
+from posts import sharding
+from posts.management.commands.load_social import Command as LoadSocialCommand, percentile
+from posts.models import Post
+
+
+PATHS = {
+    'sync': {
+        'feed': '/api/feed/',
+        'notifications': '/notifications/',
+        'like': '/api/posts/{}/like/',
+        'unlike': '/api/posts/{}/unlike/',
+    },
+    'async': {
+        'feed': '/api/async/feed/',
+        'notifications': '/notifications/async/',
+        'like': '/api/async/posts/{}/like/',
+        'unlike': '/api/async/posts/{}/unlike/',
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the same request mix through the sync and the async feed, like '
+        'and notification views under ASGI, at the same concurrency, and '
+        'report requests/sec, latency, threads and memory per connection.'
+    )
+
+    endpoints = ('feed', 'notifications', 'like')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per variant.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Requests in flight at once.')
+        parser.add_argument('--users', type=int, default=100, help='Distinct authenticated users to sample.')
+        parser.add_argument(
+            '--endpoints', default=','.join(self.endpoints),
+            help='Comma-separated subset of: ' + ', '.join(self.endpoints),
+        )
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the request mix.')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(self.endpoints)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+
+        tokens = list(Token.objects.values_list('key', flat=True)[:options['users']])
+        post_ids = [
+            pk for alias in sharding.each_shard()
+            for pk in sharding.using(Post.objects, alias).values_list('pk', flat=True)[:10000]
+        ]
+        if not tokens or not post_ids:
+            raise CommandError('No users or posts to drive; run "manage.py seed_social" first.')
+
+        # One mix for both variants. Each like is followed by an unlike of
+        # the same post on the same connection, so the second variant starts
+        # from the state the first one started from.
+        rng = random.Random(options['seed'])
+        mix = []
+        for _ in range(options['requests']):
+            name = rng.choice(endpoints)
+            token = rng.choice(tokens)
+            if name == 'like':
+                post_id = rng.choice(post_ids)
+                mix.append([('like', 'POST', post_id, token), ('unlike', 'POST', post_id, token)])
+            else:
+                mix.append([(name, 'GET', None, token)])
+        total = sum(len(sequence) for sequence in mix)
+
+        self.stdout.write(f'{total} requests per variant, concurrency {options["concurrency"]}')
+        self.stdout.write(
+            f'{"variant":<9}{"req/s":>9}{"p50 ms":>9}{"p99 ms":>9}{"errors":>8}'
+            f'{"threads":>9}{"KiB/conn":>10}'
+        )
+        # Throttling would reject most of the likes
+        with override_settings(THROTTLE_BUCKETS={}):
+            for variant in ('sync', 'async'):
+                requests = [
+                    [(method, PATHS[variant][name].format(post_id), token) for name, method, post_id, token in sequence]
+                    for sequence in mix
+                ]
+                latencies, errors, elapsed, threads = asyncio.run(self.run(requests, options['concurrency']))
+                # A second pass measures memory; tracemalloc slows everything down
+                tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+                asyncio.run(self.run(requests, options['concurrency']))
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                tracemalloc.stop()
+
+                latencies.sort()
+                self.stdout.write(
+                    f'{variant:<9}{total / elapsed:>9.1f}'
+                    f'{percentile(latencies, 50) * 1000:>9.2f}{percentile(latencies, 99) * 1000:>9.2f}'
+                    f'{errors:>8}{threads:>9}{peak / 1024 / options["concurrency"]:>10.1f}'
+                )
+
+    async def run(self, requests, concurrency):
+        """
+        (latencies, errors, elapsed seconds, peak thread count) for one pass
+        over `requests`, a list of request sequences.
+        """
+        application = get_asgi_application()
+        # After setup, which configures logging: 400s for posts that were
+        # already liked are expected and not worth a log line each
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        call = LoadSocialCommand.call
+        queue = asyncio.Queue()
+        for sequence in requests:
+            queue.put_nowait(sequence)
+        latencies = []
+        errors = 0
+        peak_threads = threading.active_count()
+        running = True
+
+        async def sample_threads():
+            nonlocal peak_threads
+            while running:
+                peak_threads = max(peak_threads, threading.active_count())
+                await asyncio.sleep(0.005)
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                for method, path, token in queue.get_nowait():
+                    started = time.perf_counter()
+                    status = await call(self, application, method, path, token)
+                    latencies.append(time.perf_counter() - started)
+                    if status is None or status >= 500:
+                        errors += 1
+
+        sampler = asyncio.create_task(sample_threads())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        running = False
+        await sampler
+        await sync_to_async(connections.close_all)()
+        return latencies, errors, elapsed, peak_threads
@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test import override_settings
+
+from posts import counters
+from posts.management.commands.load_social import percentile
+from posts.models import Post
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark like counter contention on one hot post: a thread pool '
+        'increments the counter on the post row, then on sharded counters, '
+        'and reports throughput, latency and lock errors for each.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent writer threads.')
+        parser.add_argument('--writes', type=int, default=2000, help='Increments per mode.')
+        parser.add_argument('--shards', type=int, default=counters.DEFAULTS['SHARDS'], help='Shards per counter.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite locks the whole database on write; sharding only helps on '
+                'databases with row locks such as PostgreSQL.'
+            ))
+
+        user, _ = User.all_objects.get_or_create(username='bench_counters')
+        post = Post.all_objects.create(author=user, title='bench_counters', content='')
+        try:
+            for label, shards in (('row', 0), (f'{options["shards"]} shards', options['shards'])):
+                if shards:
+                    counters.promote(post, shards)
+                self.run(label, post, options['workers'], options['writes'])
+            self.stdout.write(f'final value: {counters.value(Post.all_objects.get(pk=post.pk), "likes_count")}')
+        finally:
+            Post.all_objects.filter(pk=post.pk).delete()
+            User.all_objects.filter(pk=user.pk).delete()
+
+    def run(self, label, post, workers, writes):
+        def worker(count):
+            latencies, errors = [], 0
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    try:
+                        counters.increment(post, 'likes_count')
+                    except OperationalError:
+                        errors += 1
+                        continue
+                    latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                # Each pool thread opened its own connection
+                connection.close()
+            return latencies, errors
+
+        shares = [writes // workers + (index < writes % workers) for index in range(workers)]
+        # Keep promotion out of the unsharded run
+        with override_settings(SHARDED_COUNTERS={'PROMOTE_WRITES_PER_MINUTE': float('inf')}):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(worker, shares))
+            elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for result, _ in results for latency in result)
+        errors = sum(errors for _, errors in results)
+        self.stdout.write(
+            f'{label}: {len(latencies) / elapsed:.0f} writes/s, '
+            f'p50 {percentile(latencies, 50):.2f} ms, p99 {percentile(latencies, 99):.2f} ms, '
+            f'{errors} lock errors'
+        )
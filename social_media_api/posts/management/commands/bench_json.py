@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from shared.renderers import ORJSONRenderer, orjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark JSON rendering of post pages: encode time, peak memory and '
+        'output size with DRF\'s JSONRenderer and with ORJSONRenderer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help='Posts per payload.')
+        parser.add_argument('--comments', type=int, default=3, help='Nested comments per post.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed renders per renderer.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed.')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError('orjson is not installed; ORJSONRenderer would fall back to JSONRenderer.')
+
+        rng = random.Random(options['seed'])
+        payloads = {
+            # What the post list serializes to: datetimes already ISO strings
+            'serialized': self.make_payload(rng, options['items'], options['comments'], native=False),
+            # Unserialized values: datetime and Decimal objects
+            'native': self.make_payload(rng, options['items'], options['comments'], native=True),
+        }
+        renderers = {'JSONRenderer': JSONRenderer(), 'ORJSONRenderer': ORJSONRenderer()}
+
+        for name, payload in payloads.items():
+            outputs = {}
+            for label, renderer in renderers.items():
+                outputs[label] = renderer.render(payload)
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    renderer.render(payload)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+                tracemalloc.start()
+                renderer.render(payload)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+                self.stdout.write(
+                    f'{name:<10} {label:<15} median {statistics.median(timings):7.2f} ms, '
+                    f'min {min(timings):7.2f} ms, peak {peak / 1024:8.0f} KiB, '
+                    f'{len(outputs[label]) / 1024:.0f} KiB out'
+                )
+            if name == 'serialized' and outputs['JSONRenderer'] != outputs['ORJSONRenderer']:
+                self.stdout.write(self.style.WARNING('  outputs differ'))
+
+    def make_payload(self, rng, items, comments, native):
+        now = timezone.now()
+
+        def moment(offset):
+            value = now - timedelta(seconds=offset)
+            return value if native else value.isoformat().replace('+00:00', 'Z')
+
+        results = []
+        for pk in range(1, items + 1):
+            author_id = rng.randrange(1, 10000)
+            results.append({
+                'id': pk,
+                'author': f'user_{author_id}',
+                'author_id': author_id,
+                'title': f'Post {pk} about something élève',
+                'content': ' '.join(rng.choice(['lorem', 'ipsum', 'dolor', 'sit', 'amet']) for _ in range(60)),
+                'created_at': moment(pk * 60),
+                'updated_at': moment(pk * 30),
+                'comments': [
+                    {
+                        'id': pk * 100 + index,
+                        'post': pk,
+                        'parent': None,
+                        'depth': 0,
+                        'author': f'user_{index}',
+                        'author_id': index,
+                        'content': 'Nice post!',
+                        'created_at': moment(pk * 10 + index),
+                        'updated_at': moment(pk * 10 + index),
+                    }
+                    for index in range(comments)
+                ],
+                'comments_count': comments,
+                'likes_count': rng.randrange(0, 5000),
+                **({'trending_score': Decimal(rng.randrange(0, 10 ** 6)) / 1000} if native else {}),
+            })
+        return {'count': items, 'next': None, 'previous': None, 'results': results}
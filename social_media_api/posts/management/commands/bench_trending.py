@@ -0,0 +1,75 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.management.commands.load_social import percentile
+from posts.management.commands.seed_social import zipf_weights
+from posts.trending import DEFAULTS, TrendingTracker
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark trending score maintenance: cost per like/comment event, '
+        'read latency of the top K, and the cost of storing scores in the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100000, help='Distinct posts receiving events.')
+        parser.add_argument('--events', type=int, default=200000, help='Like and comment events to record.')
+        parser.add_argument('--size', type=int, default=DEFAULTS['SIZE'], help='Top K size.')
+        parser.add_argument('--reads', type=int, default=2000, help='Top K reads to time.')
+        parser.add_argument('--store', action='store_true',
+                            help='Also time storing the scores in PostScore (rolled back; needs the posts to exist).')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        tracker = TrendingTracker(
+            half_life_hours=DEFAULTS['HALF_LIFE_HOURS'],
+            like_weight=DEFAULTS['LIKE_WEIGHT'],
+            comment_weight=DEFAULTS['COMMENT_WEIGHT'],
+            size=options['size'],
+            reload_seconds=float('inf'),
+        )
+        # Reads must not hit the database
+        tracker.loaded_at = time.monotonic()
+
+        post_ids = list(range(1, options['posts'] + 1))
+        targets = rng.choices(post_ids, cum_weights=zipf_weights(len(post_ids), 1.1), k=options['events'])
+        kinds = rng.choices(['like', 'comment'], weights=[4, 1], k=options['events'])
+        start = timezone.now() - timedelta(hours=48)
+        step = timedelta(hours=48) / max(options['events'], 1)
+        moments = [start + step * i for i in range(options['events'])]
+
+        started = time.perf_counter()
+        scores = tracker.scores(zip(targets, kinds, moments))
+        elapsed = time.perf_counter() - started
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        tracker.top = ranked[:options['size']]
+        self.stdout.write(
+            f'score: {options["events"]} events in {elapsed:.3f}s '
+            f'({elapsed / options["events"] * 1e6:.2f} us/event)'
+        )
+
+        latencies = []
+        for _ in range(options['reads']):
+            read_started = time.perf_counter()
+            tracker.ranking()
+            latencies.append((time.perf_counter() - read_started) * 1e6)
+        latencies.sort()
+        self.stdout.write(
+            f'ranking (K={options["size"]}): p50 {percentile(latencies, 50):.1f} us, '
+            f'p99 {percentile(latencies, 99):.1f} us'
+        )
+
+        if options['store']:
+            with transaction.atomic():
+                store_started = time.perf_counter()
+                tracker.store(scores)
+                elapsed = time.perf_counter() - store_started
+                transaction.set_rollback(True)
+            self.stdout.write(f'store: {len(scores)} posts in {elapsed * 1000:.1f} ms')
@@ -0,0 +1,139 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+
+from notifications.models import Notification
+from posts import sharding
+from posts.models import PATH_WIDTH, Comment, Like, Mention, Post, PostTag, Tag, subtree_range
+from posts.views import (
+    CommentViewSet, LikePagination, PostViewSet, StandardResultsSetPagination, TimelinePagination, get_feed_queryset,
+)
+
+
+User = get_user_model()
+
+# Plan lines that mean "read the whole table" for each backend.
+SEQ_SCAN_PATTERNS = {
+    # SQLite: "SCAN posts_post" without "USING [COVERING] INDEX"
+    'sqlite': re.compile(r'\bSCAN (?!.*\bUSING\b)\S+'),
+    'postgresql': re.compile(r'\bSeq Scan on\b'),
+    # MySQL: access type ALL in the tabular plan
+    'mysql': re.compile(r'\sALL\s'),
+}
+
+# Plan lines that mean "sort the matching rows after reading them".
+SORT_PATTERNS = {
+    'sqlite': re.compile(r'\bUSE TEMP B-TREE FOR ORDER BY\b'),
+    'postgresql': re.compile(r'(^|->)\s*(Incremental )?Sort\b'),
+    'mysql': re.compile(r'\bUsing filesort\b'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Run EXPLAIN on the queryset behind each hot endpoint and fail if a plan '
+        'falls back to a sequential scan or a sort. Run it against a database '
+        'seeded to benchmark scale so the planner sees realistic table sizes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Refresh planner statistics (ANALYZE) before explaining.',
+        )
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Print every plan, not only the failing ones.',
+        )
+
+    def get_checks(self):
+        """
+        (name, queryset, allow_sort) for every endpoint we care about; the
+        post, comment and like ones on each database shard, named
+        `<name> @<alias>`. Querysets are sliced to one page, like the
+        paginated views do.
+        """
+        user = User.objects.order_by('pk').first() or User(pk=1)
+        page = StandardResultsSetPagination.page_size
+        checks = []
+        for alias in sharding.each_shard():
+            suffix = f' @{alias}' if alias else ''
+            checks.extend(
+                (name + suffix, queryset, allow_sort)
+                for name, queryset, allow_sort in self.get_shard_checks(user, page, alias)
+            )
+
+        notifications = Notification.objects.filter(recipient=user)
+        tag = Tag.objects.order_by('pk').first() or Tag(pk=1)
+        timeline = TimelinePagination.ordering
+        return checks + [
+            ('notifications', notifications[:page], False),
+            ('unread notifications', notifications.filter(read=False)[:page], False),
+            ('tag timeline', PostTag.objects.filter(tag=tag).order_by(*timeline).values('post_id', 'created_at')[:page], False),
+            ('mentions', Mention.objects.filter(user=user).order_by(*timeline).values('post_id', 'created_at')[:page], False),
+        ]
+
+    def get_shard_checks(self, user, page, alias):
+        """
+        The checks of the post, comment and like endpoints on database shard
+        `alias`, written as the views query a shard.
+        """
+        post = sharding.using(Post.objects, alias).order_by('pk').first() or Post(pk=1)
+        comments = sharding.using(Comment.objects.filter(post=post), alias)
+        thread = comments.filter(parent__isnull=True).first() or Comment(path=str(1).zfill(PATH_WIDTH))
+        likes = sharding.using(Like.objects.filter(post=post), alias).order_by(*LikePagination.ordering)
+        if alias is None:
+            feed = get_feed_queryset(user)
+            following = Q(user__followers=user)
+        else:
+            # The follow table is not on the shards
+            following_ids = list(user.following.values_list('pk', flat=True)) if user.pk else []
+            feed = Post.objects.using(alias).filter(author_id__in=following_ids).order_by('-created_at', '-pk')
+            following = Q(user_id__in=following_ids)
+        return [
+            # The feed merges several per-author index ranges, so a bounded
+            # top-N sort of the page is expected; a table scan is not.
+            ('feed', feed[:page], True),
+            ('posts', sharding.using(PostViewSet.queryset.all(), alias)[:page], False),
+            ('post comments', comments[:page], False),
+            ('comments', sharding.using(CommentViewSet.queryset.all(), alias)[:page], False),
+            ('comment threads', comments.filter(parent__isnull=True).order_by('-created_at')[:page], False),
+            ('comment subtree', comments.filter(**subtree_range(thread.path)).order_by('path')[:page], False),
+            ('post likes', likes[:page], False),
+            ('post likes, following first', likes.filter(following)[:page], False),
+        ]
+
+    def handle(self, *args, **options):
+        aliases = {alias or DEFAULT_DB_ALIAS for alias in sharding.each_shard()} | {DEFAULT_DB_ALIAS}
+        for alias in sorted(aliases):
+            vendor = connections[alias].vendor
+            if vendor not in SEQ_SCAN_PATTERNS:
+                raise CommandError(f'Plan checks are not implemented for the {vendor} backend.')
+            if options['analyze']:
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('ANALYZE')
+
+        failures = []
+        for name, queryset, allow_sort in self.get_checks():
+            plan = queryset.explain()
+            vendor = connections[queryset.db].vendor
+            problems = []
+            if SEQ_SCAN_PATTERNS[vendor].search(plan):
+                problems.append('sequential scan')
+            if not allow_sort and any(SORT_PATTERNS[vendor].search(line) for line in plan.splitlines()):
+                problems.append('sort')
+
+            if problems:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: {", ".join(problems)}'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: ok'))
+                if options['verbose_plans']:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'Inefficient plans for: {", ".join(failures)}')
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts.feed_cache import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the number of feed page lookups served fresh from the cache '
+        '(hit), recomputed (miss) and served stale while another request '
+        'recomputed the page (stale), as counted in the shared cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print one JSON object, for monitoring agents.')
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        counts = stats()
+        if options['json']:
+            self.stdout.write(json.dumps(counts))
+        else:
+            total = sum(counts.values())
+            for outcome, count in counts.items():
+                share = f' ({count / total:.1%})' if total else ''
+                self.stdout.write(f'{outcome}: {count}{share}')
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import sharding
+from posts.models import Mention, Post, PostTag
+from posts.tagging import index_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the hashtag and mention indexes of existing posts, in batches '
+        'of posts read by primary key. Nobody is notified of the mentions found.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts indexed per transaction.')
+
+    def handle(self, *args, **options):
+        posts = 0
+        for alias in sharding.each_shard():
+            last = 0
+            while True:
+                batch = list(
+                    sharding.using(Post.objects, alias).filter(pk__gt=last).order_by('pk')
+                    .only('author', 'content', 'created_at')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                index_posts(batch, notify=False)
+                last = batch[-1].pk
+                posts += len(batch)
+        self.stdout.write(
+            f'{posts} posts indexed: {PostTag.objects.count()} hashtag rows, '
+            f'{Mention.objects.count()} mention rows'
+        )
@@ -0,0 +1,178 @@
+import asyncio
+import contextvars
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.authtoken.models import Token
+
+from posts import sharding
+from posts.models import Post
+
+
+# Queries issued on behalf of the request being driven. asgiref copies the
+# context into the thread that runs sync views, so each request sees its own.
+current_query_count = contextvars.ContextVar('current_query_count', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = current_query_count.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive feed, posts, like and notifications requests through the ASGI '
+        'application in-process and report latency percentiles and queries per request.'
+    )
+
+    endpoints = ('feed', 'posts', 'like', 'notifications')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Total requests to send.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight at once.')
+        parser.add_argument('--users', type=int, default=100, help='Distinct authenticated users to sample.')
+        parser.add_argument(
+            '--endpoints', default=','.join(self.endpoints),
+            help='Comma-separated subset of: ' + ', '.join(self.endpoints),
+        )
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for the request mix.')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(self.endpoints)
+        if unknown:
+            raise CommandError(f'Unknown endpoints: {", ".join(sorted(unknown))}')
+
+        tokens = list(Token.objects.values_list('key', flat=True)[:options['users']])
+        post_ids = [
+            pk for alias in sharding.each_shard()
+            for pk in sharding.using(Post.objects, alias).values_list('pk', flat=True)[:10000]
+        ]
+        if not tokens or not post_ids:
+            raise CommandError('No users or posts to drive; run "manage.py seed_social" first.')
+
+        self.rng = random.Random(options['seed'])
+        self.tokens = tokens
+        self.post_ids = post_ids
+        self.endpoint_names = endpoints
+
+        # Views run on asgiref's sync thread, which opens its own connections.
+        connection_created.connect(install_query_counter)
+        try:
+            results, elapsed = asyncio.run(self.run(options['requests'], options['concurrency']))
+        finally:
+            connection_created.disconnect(install_query_counter)
+        self.print_report(results, elapsed)
+
+    def build_request(self):
+        name = self.rng.choice(self.endpoint_names)
+        token = self.rng.choice(self.tokens)
+        if name == 'feed':
+            return name, 'GET', '/api/feed/', token
+        if name == 'posts':
+            return name, 'GET', '/api/posts/', token
+        if name == 'like':
+            return name, 'POST', f'/api/posts/{self.rng.choice(self.post_ids)}/like/', token
+        return name, 'GET', '/notifications/', token
+
+    async def call(self, application, method, path, token):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'headers': [
+                (b'host', b'localhost'),
+                (b'authorization', f'Token {token}'.encode()),
+                (b'accept', b'application/json'),
+            ],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        status = None
+        body_sent = False
+        finished = asyncio.Event()
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # Django keeps listening for a disconnect until the response is done
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await application(scope, receive, send)
+        return status
+
+    async def run(self, total, concurrency):
+        application = get_asgi_application()
+        queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(self.build_request())
+        results = defaultdict(list)
+
+        async def worker():
+            while not queue.empty():
+                name, method, path, token = queue.get_nowait()
+                counter = [0]
+                current_query_count.set(counter)
+                started = time.perf_counter()
+                status = await self.call(application, method, path, token)
+                results[name].append((time.perf_counter() - started, counter[0], status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        # Connections opened by the sync view thread are not reused after this.
+        await sync_to_async(connections.close_all)()
+        return results, elapsed
+
+    def print_report(self, results, elapsed):
+        total = sum(len(samples) for samples in results.values())
+        self.stdout.write(f'{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)')
+        self.stdout.write(
+            f'{"endpoint":<15}{"count":>7}{"errors":>8}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}'
+        )
+        for name in self.endpoint_names:
+            samples = results.get(name)
+            if not samples:
+                continue
+            latencies = sorted(latency * 1000 for latency, _, _ in samples)
+            errors = sum(1 for _, _, status in samples if status is None or status >= 500)
+            queries = statistics.mean(count for _, count, _ in samples)
+            self.stdout.write(
+                f'{name:<15}{len(samples):>7}{errors:>8}'
+                f'{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}'
+                f'{percentile(latencies, 99):>9.2f}{queries:>9.1f}'
+            )
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.reaper import reap
+
+
+class Command(BaseCommand):
+    help = (
+        'Hard-delete soft-deleted posts and users together with their comments, '
+        'likes, notifications and follows, in small batched transactions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows deleted per transaction.')
+        parser.add_argument('--limit', type=int, default=None, help='Posts and users handled per run.')
+        parser.add_argument('--loop', action='store_true', help='Keep running, sleeping between runs.')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds to sleep between runs with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            stats = reap(batch_size=options['batch_size'], limit=options['limit'])
+            if stats.total_rows or not options['loop']:
+                self.report(stats)
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def report(self, stats):
+        for label, count in sorted(stats.rows.items()):
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(
+            f'{stats.total_rows} rows in {stats.batches} batches, {stats.elapsed:.2f}s '
+            f'({stats.rows_per_second:.0f} rows/s)'
+        )
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        'Move each author\'s posts, comments and likes to the database shard '
+        'DATABASE_SHARDS assigns them. Run it after changing DATABASE_SHARDS; '
+        'safe to interrupt and rerun.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Posts moved per transaction.')
+        parser.add_argument('--drain', action='append', default=[], metavar='ALIAS',
+                            help='Also move everything off this database (e.g. a retired shard). Repeatable.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the authors to move.')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('DATABASE_SHARDS is empty; there is nothing to rebalance.')
+        unknown = set(options['drain']) - set(connections)
+        if unknown:
+            raise CommandError(f'Unknown databases: {", ".join(sorted(unknown))}')
+
+        started = time.perf_counter()
+        totals = sharding.rebalance(options['drain'], options['batch_size'], options['dry_run'])
+        elapsed = time.perf_counter() - started
+        if options['dry_run']:
+            self.stdout.write(f'{totals["authors"]} authors to move')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {totals["authors"]} authors: {totals["posts"]} posts, {totals["comments"]} comments, '
+            f'{totals["likes"]} likes in {elapsed:.1f}s'
+        ))
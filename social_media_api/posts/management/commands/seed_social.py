@@ -0,0 +1,179 @@
+import itertools
+import random
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from notifications.models import Notification
+from posts import sharding
+from posts.models import Comment, Like, Post, root_path
+
+
+User = get_user_model()
+
+
+def zipf_weights(n, exponent):
+    """
+    Cumulative weights of a Zipf distribution over ranks 1..n.
+    A handful of accounts get most of the follows and likes, like production.
+    """
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users, a power-law follower graph, posts, comments, '
+        'likes and notifications with bulk_create batches.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users to create.')
+        parser.add_argument('--posts-per-user', type=float, default=5, help='Average posts per user.')
+        parser.add_argument('--comments-per-post', type=float, default=2, help='Average comments per post.')
+        parser.add_argument('--likes-per-post', type=float, default=5, help='Average likes per post.')
+        parser.add_argument('--avg-following', type=float, default=20, help='Average accounts followed per user.')
+        parser.add_argument('--exponent', type=float, default=1.1, help='Zipf exponent of account popularity.')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk_create call.')
+        parser.add_argument('--prefix', default='seed', help='Username prefix of generated users.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        n_users = options['users']
+        if n_users < 2:
+            raise CommandError('--users must be at least 2.')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Users with prefix "{prefix}_" already exist; pick another --prefix.')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        users = self.create_users(n_users, prefix)
+        popularity = zipf_weights(n_users, options['exponent'])
+        # Shuffle which users are popular so it does not follow creation order
+        ranked_users = users[:]
+        self.rng.shuffle(ranked_users)
+
+        self.create_follows(users, ranked_users, popularity, options['avg_following'])
+        posts = self.create_posts(users, options['posts_per_user'])
+        self.create_comments(posts, users, options['comments_per_post'])
+        self.create_likes(posts, ranked_users, popularity, options['likes_per_post'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {n_users} users in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def bulk_create(self, model, objs, **kwargs):
+        """
+        Insert `objs` in batches, posts, comments and likes on their shard.
+        """
+        created = []
+        for batch in batched(objs, self.batch_size):
+            sharding.assign_ids(batch)
+            groups = sharding.by_owner_shard(batch) if sharding.is_sharded(model) else {None: batch}
+            with sharding.atomic(*groups):
+                for alias, rows in groups.items():
+                    created.extend(sharding.using(model.objects, alias).bulk_create(rows, **kwargs))
+        return created
+
+    def bulk_update(self, model, objs, fields):
+        for batch in batched(objs, self.batch_size):
+            # Each row where it was loaded or created
+            groups = sharding.by_shard(batch)
+            with sharding.atomic(*groups):
+                for alias, rows in groups.items():
+                    model.objects.using(alias).bulk_update(rows, fields)
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f'{label}: {count} rows in {elapsed:.1f}s ({rate:.0f} rows/s)')
+
+    def create_users(self, n_users, prefix):
+        started = time.perf_counter()
+        # Hashing is deliberately slow, so every seeded user shares one hash.
+        password = make_password('password')
+        users = self.bulk_create(User, (
+            User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@example.com', password=password)
+            for i in range(n_users)
+        ))
+        self.bulk_create(Token, (Token(user=user, key=Token.generate_key()) for user in users))
+        self.report('users', len(users), started)
+        return users
+
+    def create_follows(self, users, ranked_users, popularity, avg_following):
+        started = time.perf_counter()
+        through = User.followers.through
+        rows = []
+        for follower in users:
+            # Out-degree is geometric around the average; targets are Zipf-popular.
+            count = min(int(self.rng.expovariate(1 / avg_following)), len(users) - 1)
+            targets = set(self.rng.choices(ranked_users, cum_weights=popularity, k=count))
+            targets.discard(follower)
+            # followed.followers contains follower, i.e. follower.following contains followed
+            rows.extend(through(from_customuser=followed, to_customuser=follower) for followed in targets)
+        self.bulk_create(through, rows, ignore_conflicts=True)
+        self.report('follows', len(rows), started)
+
+    def create_posts(self, users, posts_per_user):
+        started = time.perf_counter()
+        posts = self.bulk_create(Post, (
+            Post(author=author, title=f'Post {i} by {author.username}', content=f'Seeded post {i}.')
+            for author in users
+            for i in range(int(self.rng.expovariate(1 / posts_per_user)) if posts_per_user else 0)
+        ))
+        self.report('posts', len(posts), started)
+        return posts
+
+    def create_comments(self, posts, users, comments_per_post):
+        started = time.perf_counter()
+        comments = self.bulk_create(Comment, (
+            Comment(post=post, author=self.rng.choice(users), content='Seeded comment.')
+            for post in posts
+            for _ in range(int(self.rng.expovariate(1 / comments_per_post)) if comments_per_post else 0)
+        ))
+        # bulk_create skips Comment.save(); seeded comments are all top level
+        for alias in sharding.each_shard():
+            sharding.using(Comment.objects.filter(path=''), alias).update(path=root_path())
+        self.report('comments', len(comments), started)
+
+    def create_likes(self, posts, ranked_users, popularity, likes_per_post):
+        started = time.perf_counter()
+        likes = []
+        for post in posts:
+            count = int(self.rng.expovariate(1 / likes_per_post)) if likes_per_post else 0
+            likers = set(self.rng.choices(ranked_users, cum_weights=popularity, k=count))
+            likes.extend(Like(user=liker, post=post) for liker in likers)
+        self.bulk_create(Like, likes)
+        likes_per_post = Counter(like.post_id for like in likes)
+        for post in posts:
+            post.likes_count = likes_per_post[post.pk]
+        self.bulk_update(Post, posts, ['likes_count'])
+        self.report('likes', len(likes), started)
+
+        started = time.perf_counter()
+        post_type = ContentType.objects.get_for_model(Post)
+        notifications = self.bulk_create(Notification, (
+            Notification(
+                recipient_id=like.post.author_id,
+                actor_id=like.user_id,
+                verb='liked your post',
+                target_content_type=post_type,
+                target_object_id=like.post_id,
+            )
+            for like in likes
+            if like.user_id != like.post.author_id
+        ))
+        self.report('notifications', len(notifications), started)
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from social_media_api.throttling import rejection_counts, reset_rejection_counts
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the number of requests rejected by each token-bucket throttle '
+        'scope, as counted in the shared cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print one JSON object, for monitoring agents.')
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them.')
+
+    def handle(self, *args, **options):
+        counts = rejection_counts()
+        if options['json']:
+            self.stdout.write(json.dumps(counts))
+        else:
+            for scope, count in counts.items():
+                self.stdout.write(f'{scope}: {count} rejected')
+        if options['reset']:
+            reset_rejection_counts()
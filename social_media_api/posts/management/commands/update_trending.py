@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Add the likes and comments created since the last run to the trending '
+        'scores. Safe to interrupt and rerun.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per transaction (default: TRENDING["BATCH_SIZE"]).')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop each table after this many batches.')
+        parser.add_argument('--loop', action='store_true', help='Keep running, sleeping between runs.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep between runs with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            results = trending.update(options['batch_size'], options['max_batches'])
+            if any(result['rows'] for result in results.values()) or not options['loop']:
+                self.report(results)
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def report(self, results):
+        for event, result in results.items():
+            rate = result['rows'] / result['elapsed_s'] if result['elapsed_s'] else 0
+            self.stdout.write(
+                f'{event}: {result["rows"]} rows in {result["batches"]} batches, '
+                f'{result["elapsed_s"]}s ({rate:.0f} rows/s)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Added {sum(r["rows"] for r in results.values())} rows'))
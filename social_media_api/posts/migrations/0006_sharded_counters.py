@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_likes_count(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    likes = Like.objects.filter(post=models.OuterRef('pk')).order_by().values('post')
+    counts = likes.annotate(n=models.Count('pk')).values('n')[:1]
+    Post.objects.update(likes_count=Coalesce(models.Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_postscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='counter_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PostCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=32)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('value', models.BigIntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counter_shards_set', to='posts.post')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('post', 'field', 'shard'), name='post_counter_shard_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_likes_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_hashtags_and_mentions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='like_post_created_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='like',
+            name='like_post_created_idx',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_database_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['created_at', 'id'], name='like_created_id_idx'),
+        ),
+    ]
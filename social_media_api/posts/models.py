@@ -1,22 +1,87 @@
 from django.db import models
 from django.conf import settings
+from django.db.models.functions import Cast, LPad
+from django.utils import timezone
+
+
+# Characters per materialized path segment: the comment's id, zero-padded so
+# paths sort like the tree (parents before children, siblings oldest first)
+PATH_WIDTH = 12
+
+
+class PostManager(models.Manager):
+    """
+    Hides soft-deleted posts; they stay in the table until the reaper removes them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 
 class Post(models.Model):
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts')
+    # No database constraints on relations that can cross database shards (see posts.sharding)
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='posts', db_constraint=False)
     title = models.CharField(max_length=255)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Likes counted on the row itself; see posts.counters for hot posts
+    likes_count = models.BigIntegerField(default=0)
+    # 0 until the post is promoted to sharded counters, then the number of shards
+    counter_shards = models.PositiveSmallIntegerField(default=0)
+
+    objects = PostManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.title
 
+    def soft_delete(self):
+        """
+        Hide the post now; comments, likes and notifications are removed in
+        batches by the reaper (manage.py reap_deleted).
+        """
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feed and per-author listings: WHERE author_id IN (...) ORDER BY created_at DESC
+            models.Index(fields=['author', '-created_at'], name='post_author_created_idx'),
+            # Global post list ordering
+            models.Index(fields=['-created_at'], name='post_created_idx'),
+            # Reaper work queue
+            models.Index(
+                fields=['deleted_at'],
+                name='post_deleted_idx',
+                condition=models.Q(deleted_at__isnull=False),
+            ),
+        ]
+
+def root_path():
+    """
+    The path of a top-level comment, as a database expression.
+    """
+    return LPad(Cast('pk', models.CharField()), PATH_WIDTH, models.Value('0'))
+
+
+def subtree_range(path):
+    """
+    Lookups matching a comment and all its replies: one range over the
+    (post, path) index. Path segments are digits and ':' sorts after '9'.
+    """
+    return {'path__gte': path, 'path__lt': path + ':'}
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='comments', db_constraint=False)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Ids of the ancestors and of the comment itself, PATH_WIDTH digits each
+    path = models.CharField(max_length=255, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(editable=False, default=0)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -24,18 +89,143 @@ class Comment(models.Model):
     def __str__(self):
         return f'Comment by {self.author.username} on {self.post.title}'
 
+    def build_path(self):
+        # The path ends with our own id, which only exists after the insert
+        self.path = (self.parent.path if self.parent else '') + str(self.pk).zfill(PATH_WIDTH)
+        self.depth = self.parent.depth + 1 if self.parent else 0
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            self.build_path()
+            Comment.objects.using(self._state.db).filter(pk=self.pk).update(path=self.path, depth=self.depth)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Comments of a post, newest first
+            models.Index(fields=['post', '-created_at'], name='comment_post_created_idx'),
+            # Global comment list ordering
+            models.Index(fields=['-created_at'], name='comment_created_idx'),
+            # Whole threads and subtrees of a post, in tree order
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+            # Threads of a post, newest first
+            models.Index(
+                fields=['post', '-created_at'],
+                name='comment_thread_roots_idx',
+                condition=models.Q(parent__isnull=True),
+            ),
+        ]
 
 
 class Like(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='likes')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='likes', db_constraint=False)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('user', 'post')
         ordering = ['-created_at']
+        indexes = [
+            # Likes of a post (counts and the keyset-paginated likers list);
+            # the unique index leads with user
+            models.Index(fields=['post', '-created_at', '-id'], name='like_post_created_id_idx'),
+            # New likes in creation order, for the rollups and trending scores
+            models.Index(fields=['created_at', 'id'], name='like_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} likes {self.post.title}'
+
+class Tag(models.Model):
+    # Lowercase, without the '#'
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return f'#{self.name}'
+
+
+class PostTag(models.Model):
+    """
+    Inverted index from hashtags to the posts that use them; see posts.tagging.
+    """
+    # No single-column indexes: the two below lead with each of them
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='post_tags', db_index=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_tags', db_index=False, db_constraint=False)
+    # The post's created_at, so a tag's timeline is one index range
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Leads with post: reindexing a post reads and deletes its rows
+            models.UniqueConstraint(fields=['post', 'tag'], name='post_tag_unique'),
+        ]
+        indexes = [
+            # Tag timeline: WHERE tag_id = ? ORDER BY created_at DESC, post_id DESC
+            models.Index(fields=['tag', '-created_at', '-post'], name='post_tag_timeline_idx'),
+        ]
+
+
+class Mention(models.Model):
+    """
+    Inverted index from mentioned users to the posts that mention them.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='mentions', db_index=False)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='mentions', db_index=False, db_constraint=False)
+    # The post's created_at, so a user's mentions are one index range
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'user'], name='mention_unique'),
+        ]
+        indexes = [
+            # Mentions timeline: WHERE user_id = ? ORDER BY created_at DESC, post_id DESC
+            models.Index(fields=['user', '-created_at', '-post'], name='mention_timeline_idx'),
+        ]
+
+
+class PostScore(models.Model):
+    """
+    Persisted trending score of a post, in the log form described in posts.trending.
+    """
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name='trending_score', db_constraint=False,
+    )
+    log_score = models.FloatField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.post_id}: {self.log_score}'
+
+
+class PostCounterShard(models.Model):
+    """
+    One slice of a sharded post counter. A counter's value is the post's own
+    column plus the sum of its shards.
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='counter_shards_set', db_constraint=False)
+    field = models.CharField(max_length=32)
+    shard = models.PositiveSmallIntegerField()
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'field', 'shard'], name='post_counter_shard_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.post_id}.{self.field}[{self.shard}] = {self.value}'
+
+
+class IdSequence(models.Model):
+    """
+    The next free id of a model spread over database shards, so rows get
+    the same id on whichever shard they are written or moved to. Kept on
+    the default database; see posts.sharding.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    next_id = models.BigIntegerField()
 
     def __str__(self):
-        return f'{self.user.username} likes {self.post.title}'
\ No newline at end of file
+        return f'{self.name}: {self.next_id}'
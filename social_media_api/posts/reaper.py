@@ -0,0 +1,229 @@
+"""
+Background removal of soft-deleted posts and users.
+
+Deleting a post or user only sets `deleted_at`. The reaper then removes the
+rows that depend on it in small batches, one short transaction per batch, so
+no request waits on a large cascade and no table stays locked for long.
+Posts, comments and likes are deleted on their database shard (see
+posts.sharding).
+"""
+import logging
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F, Q
+
+from accounts.models import Block
+from analytics.models import AuthorDailyStats, PostDailyStats
+from notifications.models import Notification
+
+from . import sharding
+from .models import Comment, Like, Mention, Post, PostCounterShard, PostScore, PostTag, subtree_range
+
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class ReaperStats:
+    """
+    Rows and batches deleted per model during one reaper run.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = Counter()
+        self.batches = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def total_rows(self):
+        return sum(self.rows.values())
+
+    @property
+    def rows_per_second(self):
+        return self.total_rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'rows': dict(self.rows),
+            'total_rows': self.total_rows,
+            'batches': self.batches,
+            'elapsed_s': round(self.elapsed, 3),
+            'rows_per_s': round(self.rows_per_second, 1),
+        }
+
+
+def delete_in_batches(queryset, batch_size, stats, using=None, ordering=('pk',)):
+    """
+    Delete the rows of `queryset`, on database shard `using` when given,
+    `batch_size` primary keys at a time in `ordering`, each batch in its own
+    transaction. Only use it for rows with no cascading dependents left, so
+    every batch is a single DELETE: comments go deepest first (see
+    COMMENT_ORDERING), so their replies are gone before them.
+    """
+    model = queryset.model
+    label = model._meta.label
+    queryset = sharding.using(queryset, using)
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by(*ordering).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        with transaction.atomic(using=using):
+            count, _ = model._base_manager.db_manager(using).filter(pk__in=pks).delete()
+        deleted += count
+        stats.rows[label] += count
+        stats.batches += 1
+
+
+# Replies before the comments they answer
+COMMENT_ORDERING = ('-depth', 'pk')
+
+
+def subtree_ids(comments, batch_size, using=None):
+    """
+    Ids of `comments` and of all the replies below them, whoever wrote
+    them (deleting a comment deletes its replies too), deepest first. One
+    query per `batch_size` comments, each a set of ranges over the
+    (post, path) index.
+    """
+    depths = {}
+    rows = list(sharding.using(comments, using).values_list('pk', 'depth', 'post_id', 'path'))
+    for offset in range(0, len(rows), batch_size):
+        ranges = Q()
+        for pk, depth, post_id, path in rows[offset:offset + batch_size]:
+            depths[pk] = depth
+            # Comments saved before paths existed have no replies to find
+            if path:
+                ranges |= Q(post_id=post_id, **subtree_range(path))
+        if ranges:
+            replies = sharding.using(Comment.objects.filter(ranges), using)
+            depths.update(replies.values_list('pk', 'depth'))
+    return sorted(depths, key=lambda pk: (-depths[pk], pk))
+
+
+def delete_comment_notifications(comment_ids, batch_size, stats):
+    """
+    Delete the notifications about the comments in `comment_ids`, which are
+    on default wherever the comments are.
+    """
+    comment_type = ContentType.objects.get_for_model(Comment)
+    for offset in range(0, len(comment_ids), batch_size):
+        delete_in_batches(
+            Notification.objects.filter(
+                target_content_type=comment_type,
+                target_object_id__in=comment_ids[offset:offset + batch_size],
+            ),
+            batch_size, stats,
+        )
+
+
+def delete_likes(likes, batch_size, stats, using=None):
+    """
+    Delete `likes` like delete_in_batches and take each batch off its posts'
+    likes_count in the same transaction. A user likes a post at most once, so
+    every post in a batch loses one like. Only the column is lowered, also for
+    posts with sharded counters: a counter's value is the column plus its
+    shards (see posts.counters).
+    """
+    label = Like._meta.label
+    likes = sharding.using(likes, using)
+    while True:
+        batch = list(likes.order_by('pk').values_list('pk', 'post_id')[:batch_size])
+        if not batch:
+            return
+        pks, post_ids = zip(*batch)
+        with transaction.atomic(using=using):
+            count, _ = Like._base_manager.db_manager(using).filter(pk__in=pks).delete()
+            sharding.using(Post.all_objects, using).filter(pk__in=post_ids).update(
+                likes_count=F('likes_count') - 1,
+            )
+        stats.rows[label] += count
+        stats.batches += 1
+
+
+def reap_post(post, batch_size, stats):
+    post_type = ContentType.objects.get_for_model(Post)
+    alias = sharding.shard_of(post)
+    comments = Comment.objects.filter(post=post)
+    # Notifications are on default, the comments on the post's shard
+    comment_ids = list(sharding.using(comments, alias).values_list('pk', flat=True))
+
+    delete_comment_notifications(comment_ids, batch_size, stats)
+    delete_in_batches(
+        Notification.objects.filter(target_content_type=post_type, target_object_id=post.pk),
+        batch_size, stats,
+    )
+    delete_in_batches(comments, batch_size, stats, alias, COMMENT_ORDERING)
+    delete_in_batches(Like.objects.filter(post=post), batch_size, stats, alias)
+    delete_in_batches(PostTag.objects.filter(post=post), batch_size, stats)
+    delete_in_batches(Mention.objects.filter(post=post), batch_size, stats)
+    delete_in_batches(PostDailyStats.objects.filter(post=post), batch_size, stats)
+    # On default; deleting a post on another shard does not cascade to them
+    delete_in_batches(PostCounterShard.objects.filter(post=post), batch_size, stats)
+    delete_in_batches(PostScore.objects.filter(post=post), batch_size, stats)
+    with transaction.atomic(using=alias):
+        sharding.using(Post.all_objects, alias).filter(pk=post.pk).delete()
+    stats.rows[Post._meta.label] += 1
+    stats.batches += 1
+
+
+def reap_user(user, batch_size, stats):
+    """
+    Remove what a soft-deleted user owns. Their posts were soft-deleted with
+    them and must be reaped first; returns False while some remain.
+    """
+    if sharding.using(Post.all_objects, sharding.author_shard(user.pk)).filter(author=user).exists():
+        return False
+
+    through = User.followers.through
+    for alias in sharding.each_shard():
+        # The user's comments take the replies of other users below them
+        # along; notifications about all of them go first
+        comment_ids = subtree_ids(Comment.objects.filter(author=user), batch_size, alias)
+        delete_comment_notifications(comment_ids, batch_size, stats)
+        for offset in range(0, len(comment_ids), batch_size):
+            comments = Comment.objects.filter(pk__in=comment_ids[offset:offset + batch_size])
+            delete_in_batches(comments, batch_size, stats, alias, COMMENT_ORDERING)
+        delete_likes(Like.objects.filter(user=user), batch_size, stats, alias)
+    delete_in_batches(Mention.objects.filter(user=user), batch_size, stats)
+    delete_in_batches(Notification.objects.filter(recipient=user), batch_size, stats)
+    delete_in_batches(Notification.objects.filter(actor=user), batch_size, stats)
+    delete_in_batches(through.objects.filter(from_customuser=user), batch_size, stats)
+    delete_in_batches(through.objects.filter(to_customuser=user), batch_size, stats)
+    delete_in_batches(Block.objects.filter(user=user), batch_size, stats)
+    delete_in_batches(Block.objects.filter(target=user), batch_size, stats)
+    delete_in_batches(AuthorDailyStats.objects.filter(author=user), batch_size, stats)
+    # Whatever is left (tokens, group memberships, admin log) is small
+    with transaction.atomic():
+        User.all_objects.filter(pk=user.pk).delete()
+    stats.rows[User._meta.label] += 1
+    stats.batches += 1
+    return True
+
+
+def reap(batch_size=500, limit=None):
+    """
+    Hard-delete soft-deleted posts, then soft-deleted users, oldest first.
+    `limit` caps the posts (per shard) and users handled in this run.
+    """
+    stats = ReaperStats()
+    for alias in sharding.each_shard():
+        posts = sharding.using(Post.all_objects, alias).filter(deleted_at__isnull=False).order_by('deleted_at')
+        for post in posts[:limit].iterator():
+            reap_post(post, batch_size, stats)
+
+    users = User.all_objects.filter(deleted_at__isnull=False).order_by('deleted_at')
+    for user in users[:limit].iterator():
+        reap_user(user, batch_size, stats)
+
+    logger.info('reaper run: %s', stats.as_dict())
+    return stats
@@ -1,40 +1,261 @@
+import logging
+
 # Third-party imports
 from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError
 from django.contrib.auth import get_user_model
 
 # Local app imports
+from accounts import blocks
+from outbox import events
+from . import counters, sharding
 from .models import Post, Comment, Like
 
 
+logger = logging.getLogger(__name__)
+
 User = get_user_model()
 
-class CommentSerializer(serializers.ModelSerializer):
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks ids up in `preloaded` when a bulk create has fetched them all at
+    once, instead of running one query per item. Posts and comments are
+    looked up on their database shard (see posts.sharding).
+    """
+    def __init__(self, **kwargs):
+        self.preloaded = None
+        super().__init__(**kwargs)
+
+    def sharded(self):
+        return sharding.enabled() and sharding.is_sharded(self.get_queryset().model)
+
+    def preload(self, ids):
+        ids = [int(pk) for pk in ids if str(pk).isdigit()]
+        if self.sharded():
+            self.preloaded = sharding.in_bulk(self.get_queryset(), ids)
+        else:
+            self.preloaded = self.get_queryset().in_bulk(ids)
+
+    def to_internal_value(self, data):
+        if self.preloaded is not None and str(data).isdigit() and int(data) in self.preloaded:
+            return self.preloaded[int(data)]
+        if not self.sharded():
+            return super().to_internal_value(data)
+        queryset = self.get_queryset()
+        try:
+            return queryset.using(sharding.locate(queryset.model, data)).get(pk=data)
+        except ObjectDoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+class InvalidItem:
+    def __init__(self, errors):
+        self.errors = errors
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    Creates every valid item of a list in one request. Items are validated
+    independently: invalid ones are reported in `item_errors` instead of
+    rejecting the whole list. Valid ones are inserted with bulk_create,
+    BULK_CREATE_BATCH_SIZE rows per transaction; the child serializer's
+    `bulk_created(objs)` runs inside each batch's transaction. With database
+    shards, a batch is split by shard and inserted in one transaction per
+    shard, nested in one on default, so a failed batch is rolled back on
+    every database.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.preload_related(data)
+        items = super().to_internal_value(data)
+        self.item_errors = {}
+        self.valid_indexes = []
+        valid = []
+        for index, item in enumerate(items):
+            if isinstance(item, InvalidItem):
+                self.item_errors[index] = item.errors
+            else:
+                self.valid_indexes.append(index)
+                valid.append(item)
+        return valid
+
+    def run_child_validation(self, data):
+        try:
+            return super().run_child_validation(data)
+        except serializers.ValidationError as exc:
+            return InvalidItem(exc.detail)
+
+    def preload_related(self, data):
+        # One query per related field (and shard) for the whole list
+        for name, field in self.child.fields.items():
+            if isinstance(field, PreloadedPrimaryKeyRelatedField) and not field.read_only:
+                field.preload({item.get(name) for item in data if isinstance(item, dict)} - {None})
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        batch_size = getattr(settings, 'BULK_CREATE_BATCH_SIZE', 500)
+        objs = [model(**attrs) for attrs in validated_data]
+        self.created_indexes = []
+        created = []
+        for offset in range(0, len(objs), batch_size):
+            batch = objs[offset:offset + batch_size]
+            indexes = self.valid_indexes[offset:offset + batch_size]
+            try:
+                sharding.assign_ids(batch)
+                groups = sharding.by_owner_shard(batch)
+                with sharding.atomic(*groups):
+                    for alias, rows in groups.items():
+                        sharding.using(model.objects, alias).bulk_create(rows)
+                        if hasattr(self.child, 'bulk_created'):
+                            self.child.bulk_created(rows)
+            except DatabaseError:
+                # Only this batch is rolled back. The database error stays in
+                # the log; it can name tables and constraints
+                logger.exception('Bulk create of %d %s rows failed', len(batch), model.__name__)
+                for index in indexes:
+                    self.item_errors[index] = {'non_field_errors': ['Could not be saved.']}
+                continue
+            created.extend(batch)
+            self.created_indexes.extend(indexes)
+        return created
+
+    def results(self):
+        """
+        One entry per submitted item, in request order.
+        """
+        results = [
+            {'index': index, 'status': 201, 'id': obj.pk}
+            for index, obj in zip(self.created_indexes, self.instance)
+        ]
+        results.extend(
+            {'index': index, 'status': 400, 'errors': errors}
+            for index, errors in self.item_errors.items()
+        )
+        return sorted(results, key=lambda result: result['index'])
+
+class ShardedCreateMixin:
+    """
+    Creates the instance with save() rather than Model.objects.create(),
+    which gives the routers no instance, so it lands on its database shard
+    (see posts.sharding).
+    """
+    def create(self, validated_data):
+        instance = self.Meta.model(**validated_data)
+        instance.save()
+        return instance
+
+class CommentSerializer(ShardedCreateMixin, serializers.ModelSerializer):
     author = serializers.StringRelatedField(read_only=True)
     author_id = serializers.ReadOnlyField(source='author.id')
+    post = PreloadedPrimaryKeyRelatedField(queryset=Post.objects.all())
+    parent = PreloadedPrimaryKeyRelatedField(queryset=Comment.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = Comment
-        fields = ['id', 'post', 'author', 'author_id', 'content', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'author', 'author_id', 'created_at', 'updated_at']
+        fields = ['id', 'post', 'parent', 'depth', 'author', 'author_id', 'content', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'depth', 'author', 'author_id', 'created_at', 'updated_at']
+        list_serializer_class = BulkCreateListSerializer
+
+    def bulk_created(self, comments):
+        for comment in comments:
+            comment.build_path()
+        # On the shard the comments were inserted into
+        Comment.objects.using(comments[0]._state.db).bulk_update(comments, ['path', 'depth'])
+
+    def validate(self, attrs):
+        if self.instance is not None:
+            # Moving a comment would leave its replies' paths behind
+            attrs.pop('post', None)
+            attrs.pop('parent', None)
+            return attrs
+        parent = attrs.get('parent')
+        if parent is not None:
+            if parent.post_id != attrs['post'].pk:
+                raise serializers.ValidationError({'parent': 'Replies must be on the same post as their parent.'})
+            max_depth = getattr(settings, 'COMMENT_MAX_DEPTH', 5)
+            if parent.depth >= max_depth:
+                raise serializers.ValidationError({'parent': f'Replies can be nested at most {max_depth} levels deep.'})
+        if self.blocked_by_author(attrs['post']):
+            raise serializers.ValidationError({'post': 'You cannot comment on posts of this user.'})
+        return attrs
+
+    def blocked_by_author(self, post):
+        """
+        Whether the commenter and the post's author blocked one another.
+        Checked once per author in a bulk request.
+        """
+        request = self.context.get('request')
+        if request is None:
+            return False
+        checked = self.context.setdefault('blocked_authors', {})
+        if post.author_id not in checked:
+            checked[post.author_id] = blocks.is_blocked(post.author_id, request.user.pk)
+        return checked[post.author_id]
+
+class ThreadSerializer(CommentSerializer):
+    """
+    A top-level comment with its first replies, in tree order (depth-first,
+    oldest first). `replies` is set by the view.
+    """
+    reply_count = serializers.IntegerField(read_only=True)
+    replies = serializers.SerializerMethodField()
 
-class PostSerializer(serializers.ModelSerializer):
+    class Meta(CommentSerializer.Meta):
+        fields = CommentSerializer.Meta.fields + ['reply_count', 'replies']
+
+    def get_replies(self, obj):
+        return CommentSerializer(obj.first_replies, many=True).data
+
+class PostListSerializer(BulkCreateListSerializer):
+    def to_representation(self, data):
+        # Sum the shards of every sharded post on the page in one query
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        # The async feed preloads them before serializing
+        counters.preload([post for post in posts if not hasattr(post, '_likes_count')], 'likes_count')
+        return super().to_representation(posts)
+
+def publish_created(posts):
+    """
+    Publish 'post.created' for saved `posts`, one event per author. Call it
+    in the transaction that created them.
+    """
+    post_ids = {}
+    for post in posts:
+        post_ids.setdefault(post.author_id, []).append(post.pk)
+    events.publish_many('post.created', [
+        {'author_id': author_id, 'post_ids': ids} for author_id, ids in post_ids.items()
+    ])
+
+class PostSerializer(ShardedCreateMixin, serializers.ModelSerializer):
     author = serializers.StringRelatedField(read_only=True)
     author_id = serializers.ReadOnlyField(source='author.id')
     comments = CommentSerializer(many=True, read_only=True)
     comments_count = serializers.SerializerMethodField()
+    likes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id', 'author', 'author_id', 'title', 'content', 'created_at', 'updated_at', 'comments', 'comments_count']
+        fields = ['id', 'author', 'author_id', 'title', 'content', 'created_at', 'updated_at', 'comments', 'comments_count', 'likes_count']
         read_only_fields = ['id', 'author', 'author_id', 'created_at', 'updated_at']
+        list_serializer_class = PostListSerializer
+
+    def bulk_created(self, posts):
+        publish_created(posts)
 
     def get_comments_count(self, obj):
+        # Counts the prefetched comments when the view prefetched them
         return obj.comments.count()
+
+    def get_likes_count(self, obj):
+        return counters.value(obj, 'likes_count')
     
 class LikeSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
+    user_id = serializers.ReadOnlyField(source='user.id')
 
     class Meta:
         model = Like
-        fields = ['id', 'user', 'post', 'created_at']
-        read_only_fields = ['id', 'user', 'created_at']
\ No newline at end of file
+        fields = ['id', 'user', 'user_id', 'post', 'created_at']
+        read_only_fields = ['id', 'user', 'user_id', 'created_at']
\ No newline at end of file
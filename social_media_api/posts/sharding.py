@@ -0,0 +1,420 @@
+"""
+Sharding of posts, comments and likes across databases, by author.
+
+One database's write capacity caps how many posts, comments and likes the
+service takes. With DATABASE_SHARDS set, an author's posts, and the comments
+and likes on them, live on one of those database aliases, `shard_for(author
+id)`:
+
+- Jump consistent hashing (Lamping and Veach) maps the author id to a shard
+  without a lookup table. Appending an alias to DATABASE_SHARDS moves only
+  the authors that land on the new shard, about 1/N of them; removing or
+  reordering aliases moves most authors.
+- ShardRouter sends a row to its author's shard whenever Django knows the
+  row: saving a Post, Comment or Like instance, and following a relation
+  from one (`post.comments.all()`, `user.posts.create(...)`). Other
+  querysets read and write `default` unless given `.using(alias)`, so
+  lookups go through `shard_of(post)`, `author_shard(author id)` or
+  `locate(model, id)`, which finds the shard of a row from its id alone.
+- Rows keep their id on every shard, so new ids come from one IdSequence per
+  model on `default`, reserved SHARD_ID_BLOCK_SIZE at a time per process,
+  instead of from each database's own sequence. Ids therefore do not rise
+  in creation order: a process can still be handing out its older block
+  after another reserved a newer one. Incremental jobs read these tables
+  in (created_at, id) order (see analytics.rollups.pending_keys).
+- Relations that cross databases have no database constraint: authors and
+  likers stay on `default`, as do the tag and mention indexes, counters and
+  rollups pointing at posts. Queries must not join across them; follow them
+  with prefetch_related, or read ids first and pass them as a list.
+
+Reads that span authors fan out: `fan_out(func)` calls func(alias) for each
+shard and `merge_top_k` merges the per-shard results, already sorted, with a
+heap. feed_view asks each shard for the newest posts of the followed authors
+down to the end of the page, and merges them.
+
+Changing DATABASE_SHARDS leaves rows on their old shard until
+`manage.py rebalance_shards` moves them, author by author (see `rebalance`).
+Reads that fan out to every shard keep seeing them during the move.
+
+With DATABASE_SHARDS empty, the default, nothing is sharded.
+
+Users live on `default`, not next to the rows on the shards, so queries on
+a shard do not join them: `attach_users()` loads the users of a page of rows
+with one query on default.
+
+Settings:
+    DATABASE_ROUTERS     ['posts.sharding.ShardRouter', ...] before ReplicaRouter
+    DATABASE_SHARDS      aliases in DATABASES holding posts, comments and likes
+    SHARD_ID_BLOCK_SIZE  ids a process reserves at a time (default 100)
+"""
+import heapq
+import threading
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.models import Max
+
+
+SHARDED_MODELS = {'posts.post', 'posts.comment', 'posts.like'}
+
+# A row's author never changes, so its shard can be cached for long
+LOCATION_CACHE_SECONDS = 24 * 60 * 60
+
+
+def shard_aliases():
+    return list(getattr(settings, 'DATABASE_SHARDS', ()))
+
+
+def enabled():
+    return bool(shard_aliases())
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def jump_hash(key, buckets):
+    """
+    The bucket in range(`buckets`) of the integer `key`.
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) % 2 ** 64
+        jump = int((bucket + 1) * (2 ** 31 / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for(author_id):
+    aliases = shard_aliases() or [DEFAULT_DB_ALIAS]
+    return aliases[jump_hash(author_id, len(aliases))]
+
+
+def author_shard(author_id):
+    """
+    The shard of the author's posts, or None when nothing is sharded (None
+    lets the routers pick the database).
+    """
+    return shard_for(author_id) if enabled() else None
+
+
+def shard_of(post):
+    return author_shard(post.author_id)
+
+
+def using(queryset, alias):
+    """
+    `queryset` on `alias`, or as it is when `alias` is None.
+    """
+    return queryset if alias is None else queryset.using(alias)
+
+
+def locate(model, pk):
+    """
+    The shard holding the Post, Comment or Like `pk`, or None when nothing
+    is sharded. The author of its post is cached; on a miss every shard is
+    asked. An id found nowhere is looked for on default.
+    """
+    if not enabled():
+        return None
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return DEFAULT_DB_ALIAS
+    key = f'posts:shard:{model._meta.label_lower}:{pk}'
+    author_id = cache.get(key)
+    if author_id is None:
+        column = 'author_id' if model._meta.label_lower == 'posts.post' else 'post__author_id'
+        found = [
+            author_id
+            for rows in fan_out(lambda alias: model._base_manager.using(alias).filter(pk=pk).values_list(column, flat=True))
+            for author_id in rows
+        ]
+        if not found:
+            return DEFAULT_DB_ALIAS
+        author_id = found[0]
+        cache.set(key, author_id, LOCATION_CACHE_SECONDS)
+    return shard_for(author_id)
+
+
+def attach_users(objs, field):
+    """
+    Set the user in `field` of each of `objs`, rows of one or more models,
+    from one query on default. Users already loaded are kept.
+    """
+    pending = [obj for obj in objs if not obj._meta.get_field(field).is_cached(obj)]
+    if not pending:
+        return
+    users = get_user_model()._base_manager.in_bulk({getattr(obj, f'{field}_id') for obj in pending})
+    for obj in pending:
+        obj._meta.get_field(field).set_cached_value(obj, users.get(getattr(obj, f'{field}_id')))
+
+
+def owner_shard(instance):
+    """
+    The shard an unsaved Post, Comment or Like belongs on, from its author or
+    its post; None when neither is known yet.
+    """
+    if instance._meta.label_lower == 'posts.post':
+        return shard_for(instance.author_id) if instance.author_id is not None else None
+    post = instance._state.fields_cache.get('post')
+    if post is None:
+        return None
+    return post._state.db or shard_for(post.author_id)
+
+
+def instance_shard(model, instance):
+    """
+    The shard of a query on `model` hinted with `instance`, or None.
+    """
+    if is_sharded(type(instance)):
+        return instance._state.db or owner_shard(instance)
+    if model._meta.label_lower == 'posts.post' and isinstance(instance, get_user_model()):
+        return shard_for(instance.pk)
+    return None
+
+
+@contextmanager
+def atomic(*aliases):
+    """
+    One transaction on default and one on each of the shards `aliases`
+    (None is default), nested, so an exception rolls them all back.
+    """
+    with ExitStack() as stack:
+        for alias in dict.fromkeys([DEFAULT_DB_ALIAS, *(alias or DEFAULT_DB_ALIAS for alias in aliases)]):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints.get('instance'), router.db_for_read)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model, hints.get('instance'), router.db_for_write)
+
+    def route(self, model, instance, unhinted):
+        if instance is None or not enabled():
+            return None
+        if is_sharded(model):
+            return instance_shard(model, instance)
+        if is_sharded(type(instance)) and instance._state.db not in (None, DEFAULT_DB_ALIAS):
+            # A user or tag reached from a row on a shard lives on default,
+            # or wherever the other routers send it
+            return unhinted(model)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled() and (is_sharded(type(obj1)) or is_sharded(type(obj2))):
+            return True
+        return None
+
+
+def block_size():
+    return getattr(settings, 'SHARD_ID_BLOCK_SIZE', 100)
+
+
+def highest_id(model):
+    return max(
+        model._base_manager.using(alias).aggregate(highest=Max('pk'))['highest'] or 0
+        for alias in {DEFAULT_DB_ALIAS, *shard_aliases()}
+    )
+
+
+def reserve(model, count):
+    """
+    Reserve `count` consecutive ids of `model`. Returns the first.
+    """
+    from .models import IdSequence
+
+    sequences = IdSequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        # Locked until the reservation commits. The first reservation
+        # starts above the ids already used anywhere
+        sequence, _ = sequences.select_for_update().get_or_create(
+            name=model._meta.label_lower, defaults={'next_id': lambda: highest_id(model) + 1},
+        )
+        first = sequence.next_id
+        sequence.next_id += count
+        sequence.save(update_fields=['next_id'])
+    return first
+
+
+class IdAllocator:
+    """
+    Hands out the ids of this process's reserved block of each model.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # {model label: (next id, end of the block)}
+        self.blocks = {}
+
+    def take(self, model, count=1):
+        """
+        `count` unused ids of `model`, ascending.
+        """
+        label = model._meta.label_lower
+        ids = []
+        with self.lock:
+            while len(ids) < count:
+                next_id, end = self.blocks.get(label, (0, 0))
+                if next_id >= end:
+                    size = max(block_size(), count - len(ids))
+                    next_id = reserve(model, size)
+                    end = next_id + size
+                taken = min(end - next_id, count - len(ids))
+                ids.extend(range(next_id, next_id + taken))
+                self.blocks[label] = (next_id + taken, end)
+        return ids
+
+
+allocator = IdAllocator()
+
+
+def assign_ids(objs):
+    """
+    Give unsaved rows of a sharded model their ids before a bulk_create.
+    """
+    missing = [obj for obj in objs if obj.pk is None]
+    if not missing or not enabled() or not is_sharded(type(missing[0])):
+        return
+    for obj, pk in zip(missing, allocator.take(type(missing[0]), len(missing))):
+        obj.pk = pk
+
+
+def assign_id(sender, instance, raw=False, **kwargs):
+    """
+    pre_save receiver: the id of a new Post, Comment or Like.
+    """
+    if instance.pk is None and not raw and enabled():
+        instance.pk = allocator.take(sender)[0]
+
+
+def each_shard():
+    """
+    The shards, or [None] when nothing is sharded (None lets the routers
+    pick the database).
+    """
+    return shard_aliases() or [None]
+
+
+def fan_out(func):
+    """
+    [func(alias) for alias in each_shard()].
+    """
+    return [func(alias) for alias in each_shard()]
+
+
+def in_bulk(queryset, ids):
+    """
+    {id: row} of the Posts, Comments or Likes of `queryset` among `ids`,
+    asked of every shard.
+    """
+    rows = {}
+    for found in fan_out(lambda alias: using(queryset, alias).in_bulk(ids)):
+        rows.update(found)
+    return rows
+
+
+def merge_top_k(results, k, key):
+    """
+    The first `k` items of `results`, lists each sorted by descending `key`,
+    merged with a heap. An item found on two shards while it is moved, so
+    with the same key twice, is kept once.
+    """
+    merged = []
+    for item in heapq.merge(*results, key=key, reverse=True):
+        if merged and key(merged[-1]) == key(item):
+            continue
+        merged.append(item)
+        if len(merged) == k:
+            break
+    return merged
+
+
+def by_owner_shard(objs):
+    """
+    {shard alias: objs} of unsaved Post, Comment or Like rows, or {None:
+    objs} when nothing is sharded.
+    """
+    if not enabled():
+        return {None: list(objs)}
+    groups = {}
+    for obj in objs:
+        groups.setdefault(owner_shard(obj), []).append(obj)
+    return groups
+
+
+def by_shard(objs):
+    """
+    {database alias: objs loaded from it}.
+    """
+    groups = {}
+    for obj in objs:
+        groups.setdefault(obj._state.db, []).append(obj)
+    return groups
+
+
+def misplaced_authors(alias):
+    """
+    Ids of the authors with posts on `alias` that belong on another shard.
+    """
+    from .models import Post
+
+    authors = Post.all_objects.using(alias).order_by('author_id').values_list('author_id', flat=True).distinct()
+    return [author_id for author_id in authors.iterator() if shard_for(author_id) != alias]
+
+
+def move_author(author_id, source, target, batch_size=500):
+    """
+    Move the posts of `author_id`, with their comments and likes, from
+    `source` to `target`, `batch_size` posts at a time. Each batch is
+    copied in one transaction on `target`, then deleted in one on `source`;
+    an interruption in between leaves copies on both, and moving the author
+    again finishes the job. Returns {'posts', 'comments', 'likes'} moved.
+    """
+    from .models import Comment, Like, Post
+
+    moved = Counter()
+    posts = Post.all_objects.using(source).filter(author_id=author_id).order_by('pk')
+    while True:
+        batch = list(posts[:batch_size])
+        if not batch:
+            return moved
+        post_ids = [post.pk for post in batch]
+        comments = list(Comment.objects.using(source).filter(post_id__in=post_ids))
+        likes = list(Like.objects.using(source).filter(post_id__in=post_ids))
+        with transaction.atomic(using=target):
+            for model, rows in ((Post, batch), (Comment, comments), (Like, likes)):
+                model._base_manager.using(target).bulk_create(rows, ignore_conflicts=True)
+        with transaction.atomic(using=source):
+            Like.objects.using(source).filter(post_id__in=post_ids).delete()
+            Comment.objects.using(source).filter(post_id__in=post_ids).delete()
+            # Not delete(): it would cascade to the tag and mention indexes
+            # on default, which follow the post wherever it lives
+            Post.all_objects.using(source).filter(pk__in=post_ids)._raw_delete(source)
+        moved.update(posts=len(batch), comments=len(comments), likes=len(likes))
+
+
+def rebalance(sources=(), batch_size=500, dry_run=False):
+    """
+    Move every author's rows to their shard, from the shards and from the
+    extra `sources` (aliases being retired). Returns {'authors', 'posts',
+    'comments', 'likes'}; with `dry_run`, only the authors to move are
+    counted.
+    """
+    totals = Counter()
+    for source in dict.fromkeys([*shard_aliases(), *sources]):
+        for author_id in misplaced_authors(source):
+            totals['authors'] += 1
+            if not dry_run:
+                totals.update(move_author(author_id, source, shard_for(author_id), batch_size))
+    return {name: totals[name] for name in ('authors', 'posts', 'comments', 'likes')}
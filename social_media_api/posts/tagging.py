@@ -0,0 +1,126 @@
+"""
+Hashtag and mention extraction.
+
+When a post is created or edited, the `#tags` and `@usernames` in its content
+are written to two inverted index tables, PostTag and Mention, each row
+carrying the post's created_at. A tag's or a user's timeline is then one
+range scan of a (tag or user, created_at, post) index, instead of a
+`content__icontains` scan of every post.
+
+Indexing works on batches of posts (bulk creation indexes the whole batch)
+and costs a fixed number of queries per batch. Users mentioned for the first
+time in a post are notified, except the author and users who muted or
+blocked the author.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from accounts import blocks
+from notifications.models import Notification
+
+from .models import Mention, Post, PostTag, Tag
+
+
+User = get_user_model()
+
+# A tag needs one letter, so "#1" is not one; "a#b" and "##b" are not tags
+HASHTAG_PATTERN = re.compile(r'(?<![\w#&])#(\w*[^\W\d]\w*)')
+# Usernames may contain . + - but an address like "a@b.com" is not a mention
+MENTION_PATTERN = re.compile(r'(?<![\w@.])@(\w[\w.+-]*)')
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def extract_hashtags(text):
+    """
+    The distinct hashtags in `text`, lowercase and without the '#'.
+    """
+    return {tag.lower() for tag in HASHTAG_PATTERN.findall(text) if len(tag) <= TAG_MAX_LENGTH}
+
+
+def extract_mentions(text):
+    """
+    The distinct usernames mentioned in `text`, without the '@'. A trailing
+    '.' ends the sentence, not the username.
+    """
+    return {name.rstrip('.') for name in MENTION_PATTERN.findall(text)}
+
+
+def get_or_create_tags(names):
+    """
+    {name: Tag} for `names`, creating the missing ones.
+    """
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = set(names) - set(tags)
+    if missing:
+        # Concurrent posts may create the same tag; read back the winners
+        Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+        tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+    return tags
+
+
+def sync_rows(model, field, wanted, posts, created):
+    """
+    Make `model`'s rows for `posts` exactly `wanted`, a set of
+    (post_id, <field>_id) pairs. Returns the pairs that were added.
+    """
+    existing = {}
+    if not created:
+        rows = model.objects.filter(post_id__in=[post.pk for post in posts]).values_list('pk', 'post_id', f'{field}_id')
+        existing = {(post_id, value): pk for pk, post_id, value in rows}
+    stale = [pk for pair, pk in existing.items() if pair not in wanted]
+    if stale:
+        model.objects.filter(pk__in=stale).delete()
+    added = wanted - set(existing)
+    created_at = {post.pk: post.created_at for post in posts}
+    model.objects.bulk_create(
+        [model(post_id=post_id, created_at=created_at[post_id], **{f'{field}_id': value}) for post_id, value in added],
+        ignore_conflicts=True,
+    )
+    return added
+
+
+def index_posts(posts, created=False, notify=True):
+    """
+    Index the hashtags and mentions of `posts` (saved Post instances),
+    replacing what was indexed for them before; `created` says there was
+    nothing before. Returns the Mention pairs added, as (post_id, user_id).
+    """
+    posts = list(posts)
+    tags_by_post = {post.pk: extract_hashtags(post.content) for post in posts}
+    names_by_post = {post.pk: extract_mentions(post.content) for post in posts}
+    tag_names = set().union(*tags_by_post.values())
+    usernames = set().union(*names_by_post.values())
+    if created and not tag_names and not usernames:
+        return set()
+
+    with transaction.atomic():
+        tags = get_or_create_tags(tag_names)
+        wanted_tags = {(post_id, tags[name].pk) for post_id, names in tags_by_post.items() for name in names}
+        sync_rows(PostTag, 'tag', wanted_tags, posts, created)
+
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        wanted_mentions = {
+            (post_id, user_ids[name]) for post_id, names in names_by_post.items() for name in names if name in user_ids
+        }
+        added = sync_rows(Mention, 'user', wanted_mentions, posts, created)
+
+        if notify and added:
+            authors = {post.pk: post.author_id for post in posts}
+            lists = blocks.get_lists(user_id for _, user_id in added)
+            post_type = ContentType.objects.get_for_model(Post)
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient_id=user_id,
+                    actor_id=authors[post_id],
+                    verb='mentioned you',
+                    target_content_type=post_type,
+                    target_object_id=post_id,
+                )
+                for post_id, user_id in sorted(added)
+                if user_id != authors[post_id] and authors[post_id] not in lists[user_id].hidden
+            ])
+    return added
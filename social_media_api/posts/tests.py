@@ -1,3 +1,1088 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import DatabaseError, models
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from accounts import blocks
+from accounts.models import Block, CustomUser
+from notifications.models import Notification
+from outbox import events
+
+from .management.commands.explain_endpoints import SEQ_SCAN_PATTERNS, SORT_PATTERNS
+from . import counters, feed_cache, sharding, tagging, trending
+from .models import Comment, Like, Mention, Post, PostCounterShard, PostScore, PostTag, subtree_range
+from .reaper import reap
+from .trending import TrendingTracker, tracker
+
+
+class ExplainEndpointsTestCase(TestCase):
+    """
+    Tests for the explain_endpoints management command.
+    """
+
+    def test_endpoint_plans_use_indexes(self):
+        """
+        Every endpoint queryset is served by an index on the test database.
+        """
+        out = StringIO()
+        call_command('explain_endpoints', stdout=out)
+        self.assertNotIn('sequential scan', out.getvalue())
+
+    def test_detects_unindexed_plans(self):
+        """
+        An ORDER BY on an unindexed column is reported as a scan and a sort.
+        """
+        plan = Post.objects.order_by('title')[:10].explain()
+        self.assertTrue(SEQ_SCAN_PATTERNS['sqlite'].search(plan))
+        self.assertTrue(SORT_PATTERNS['sqlite'].search(plan))
+
+
+class SeedSocialTestCase(TestCase):
+    """
+    Tests for the seed_social management command.
+    """
+
+    def test_seed_creates_graph(self):
+        """
+        Seeding creates users with tokens, follows, posts, comments, likes and notifications.
+        """
+        call_command('seed_social', users=30, seed=1, stdout=StringIO())
+
+        self.assertEqual(CustomUser.objects.filter(username__startswith='seed_').count(), 30)
+        self.assertEqual(Token.objects.count(), 30)
+        self.assertTrue(CustomUser.followers.through.objects.exists())
+        self.assertTrue(Post.objects.exists())
+        self.assertTrue(Comment.objects.exists())
+        self.assertTrue(Like.objects.exists())
+        # Self-likes do not notify
+        self.assertEqual(
+            Notification.objects.count(),
+            Like.objects.exclude(user=models.F('post__author')).count(),
+        )
+
+
+class SoftDeleteTestCase(APITestCase):
+    """
+    Tests for soft-deleting posts and users and reaping their dependents.
+    """
+
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.reader = CustomUser.objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Post', content='content')
+        Comment.objects.create(post=self.post, author=self.reader, content='comment')
+        Like.objects.create(post=self.post, user=self.reader)
+        Notification.objects.create(
+            recipient=self.author, actor=self.reader, verb='liked your post',
+            target_content_type=ContentType.objects.get_for_model(Post), target_object_id=self.post.pk,
+        )
+        self.reader.following.add(self.author)
+
+    def test_delete_post_only_hides_it(self):
+        """
+        DELETE flips the flag; dependents stay until the reaper runs.
+        """
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'/api/posts/{self.post.pk}/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertTrue(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(self.client.get('/api/posts/').data['count'], 0)
+
+    def test_reaper_removes_post_dependents(self):
+        self.post.soft_delete()
+
+        stats = reap(batch_size=1)
+
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Like.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(stats.total_rows, 4)
+        self.assertEqual(stats.rows['posts.Post'], 1)
+
+    def test_delete_user_deactivates_and_reaper_removes_everything(self):
+        Token.objects.create(user=self.author)
+        self.client.force_authenticate(self.author)
+        response = self.client.delete('/api/profile/')
+
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(CustomUser.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Token.objects.filter(user=self.author).exists())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(self.reader.following.exists())
+        # The username is free again before the reaper runs
+        CustomUser.objects.create_user(username='author', password='testpass123')
+
+        out = StringIO()
+        call_command('reap_deleted', stdout=out)
+
+        self.assertFalse(CustomUser.all_objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Post.all_objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(CustomUser.followers.through.objects.exists())
+        self.assertIn('rows/s', out.getvalue())
+
+    def test_reaping_a_user_takes_their_likes_off_the_counters(self):
+        hot = Post.objects.create(author=self.author, title='Hot', content='content')
+        counters.promote(hot, shards=2)
+        self.client.force_authenticate(self.reader)
+        self.client.post(f'/api/posts/{hot.pk}/like/')
+        Post.objects.filter(pk=self.post.pk).update(likes_count=1)
+        self.reader.soft_delete()
+
+        reap(batch_size=1)
+
+        cache.clear()
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(counters.value(Post.objects.get(pk=self.post.pk), 'likes_count'), 0)
+        self.assertEqual(counters.value(Post.objects.get(pk=hot.pk), 'likes_count'), 0)
+
+    def test_reaping_a_user_removes_notifications_about_their_comments(self):
+        other = CustomUser.objects.create_user(username='other', password='testpass123')
+        comment = Comment.objects.get(author=self.reader)
+        Notification.objects.create(
+            recipient=self.author, actor=other, verb='replied to a comment',
+            target_content_type=ContentType.objects.get_for_model(Comment), target_object_id=comment.pk,
+        )
+        self.reader.soft_delete()
+
+        stats = reap()
+
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Notification.objects.filter(actor=other).exists())
+        self.assertEqual(stats.rows['notifications.Notification'], 2)
+
+
+    def test_reaping_a_user_removes_replies_below_their_comments(self):
+        other = CustomUser.objects.create_user(username='other', password='testpass123')
+        comment = Comment.objects.get(author=self.reader)
+        reply = Comment.objects.create(post=self.post, parent=comment, author=other, content='reply')
+        nested = Comment.objects.create(post=self.post, parent=reply, author=self.author, content='nested')
+        kept = Comment.objects.create(post=self.post, author=other, content='elsewhere')
+        comment_type = ContentType.objects.get_for_model(Comment)
+        for target in (reply, nested, kept):
+            Notification.objects.create(
+                recipient=self.author, actor=other, verb='replied to a comment',
+                target_content_type=comment_type, target_object_id=target.pk,
+            )
+        self.reader.soft_delete()
+
+        stats = reap(batch_size=1)
+
+        self.assertEqual(list(Comment.objects.all()), [kept])
+        self.assertEqual(
+            list(Notification.objects.filter(target_content_type=comment_type).values_list('target_object_id', flat=True)),
+            [kept.pk],
+        )
+        # Deepest first, one row per batch: nothing cascaded
+        self.assertEqual(stats.rows['posts.Comment'], 3)
+
+class TrendingTestCase(APITestCase):
+    """
+    Tests for incremental trending scores and /api/posts/trending/.
+    """
+
+    def setUp(self):
+        tracker.reset()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.readers = [
+            CustomUser.objects.create_user(username=f'reader{i}', password='testpass123') for i in range(3)
+        ]
+        self.posts = [
+            Post.objects.create(author=self.author, title=f'Post {i}', content='content') for i in range(3)
+        ]
+
+    def tearDown(self):
+        tracker.reset()
+
+    @override_settings(TRENDING={'SETTLE_SECONDS': 0})
+    def test_likes_and_comments_rank_posts(self):
+        """
+        update_trending adds likes and comments to the scores; comments weigh
+        more than likes. Reading the ranking writes nothing.
+        """
+        for reader in self.readers:
+            self.client.force_authenticate(reader)
+            self.client.post(f'/api/posts/{self.posts[1].pk}/like/')
+        self.client.post('/api/comments/', {'post': self.posts[2].pk, 'content': 'hi'})
+        self.client.post('/api/comments/', {'post': self.posts[2].pk, 'content': 'hi again'})
+
+        self.assertEqual(self.client.get('/api/posts/trending/').data['results'], [])
+        self.assertFalse(PostScore.objects.exists())
+
+        out = StringIO()
+        call_command('update_trending', stdout=out)
+        tracker.reset()
+        response = self.client.get('/api/posts/trending/')
+
+        self.assertEqual(response.status_code, 200)
+        titles = [item['title'] for item in response.data['results']]
+        self.assertEqual(titles, ['Post 2', 'Post 1'])
+        self.assertGreater(response.data['results'][0]['trending_score'], 3)
+        self.assertIn('Added 5 rows', out.getvalue())
+
+    def test_update_adds_each_row_once(self):
+        for reader in self.readers:
+            Like.objects.create(post=self.posts[0], user=reader)
+        with override_settings(TRENDING={'SETTLE_SECONDS': 60}):
+            # Too young; left for a later run
+            self.assertEqual(trending.update()['like']['rows'], 0)
+        with override_settings(TRENDING={'SETTLE_SECONDS': 0, 'BATCH_SIZE': 2}):
+            result = trending.update()['like']
+            self.assertEqual((result['rows'], result['batches']), (3, 2))
+            self.assertEqual(trending.update()['like']['rows'], 0)
+
+        score = tracker.ranking()[0][1]
+        self.assertAlmostEqual(score, 3.0, places=3)
+
+    def test_scores_decay_and_persist(self):
+        local = TrendingTracker(half_life_hours=1, like_weight=1, comment_weight=2, size=2, reload_seconds=60)
+        now = timezone.now()
+        # Twelve likes two half-lives ago are worth three likes now
+        events = [(self.posts[0].pk, 'like', now - timedelta(hours=2))] * 12
+        events += [(self.posts[1].pk, 'like', now), (self.posts[2].pk, 'comment', now)]
+        local.store(local.scores(events))
+
+        ranking = local.ranking(now=now)
+        self.assertEqual([post_id for post_id, _ in ranking], [self.posts[0].pk, self.posts[2].pk])
+        self.assertAlmostEqual(ranking[0][1], 3.0)
+        self.assertAlmostEqual(ranking[1][1], 2.0)
+        self.assertEqual(PostScore.objects.count(), 3)
+
+        # Later events are added to the stored scores
+        local.store(local.scores([(self.posts[1].pk, 'comment', now)]))
+        local.reload()
+        self.assertAlmostEqual(dict(local.ranking(now=now))[self.posts[1].pk], 3.0)
+
+
+class ShardedCounterTestCase(APITestCase):
+    """
+    Tests for likes_count and the promotion of hot posts to sharded counters.
+    """
+
+    def setUp(self):
+        cache.clear()
+        counters.write_rate.reset()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.readers = [
+            CustomUser.objects.create_user(username=f'reader{i}', password='testpass123') for i in range(4)
+        ]
+        self.post = Post.objects.create(author=self.author, title='Viral', content='content')
+
+    def like(self, reader):
+        self.client.force_authenticate(reader)
+        return self.client.post(f'/api/posts/{self.post.pk}/like/')
+
+    @override_settings(SHARDED_COUNTERS={'PROMOTE_WRITES_PER_MINUTE': 2, 'SHARDS': 4, 'CACHE_SECONDS': 0})
+    def test_hot_post_is_promoted_and_counts_stay_exact(self):
+        for reader in self.readers:
+            self.like(reader)
+        self.client.post(f'/api/posts/{self.post.pk}/unlike/')
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.counter_shards, 4)
+        self.assertEqual(PostCounterShard.objects.filter(post=self.post, field='likes_count').count(), 4)
+        # The first like went to the row, the rest to shards
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(counters.value(self.post, 'likes_count'), 3)
+
+        response = self.client.get(f'/api/posts/{self.post.pk}/')
+        self.assertEqual(response.data['likes_count'], 3)
+
+    @override_settings(SHARDED_COUNTERS={'CACHE_SECONDS': 60})
+    def test_list_sums_shards_in_one_query(self):
+        """
+        A page of sharded posts costs one shard query, then none while cached.
+        """
+        others = [Post.objects.create(author=self.author, title=f'Hot {i}', content='content') for i in range(2)]
+        for post in [self.post, *others]:
+            counters.promote(post, shards=3)
+            for _ in range(5):
+                counters.increment(post, 'likes_count')
+
+        # posts, count, comments prefetch, shard sums
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/posts/')
+        self.assertEqual([item['likes_count'] for item in response.data['results']], [5, 5, 5])
+
+        with self.assertNumQueries(3):
+            self.client.get('/api/posts/')
+
+    def test_promotion_is_idempotent(self):
+        self.assertEqual(counters.promote(self.post, shards=4), 4)
+        stale = Post.objects.get(pk=self.post.pk)
+        stale.counter_shards = 0
+        self.assertEqual(counters.promote(stale, shards=8), 4)
+        self.assertEqual(PostCounterShard.objects.filter(post=self.post).count(), 4)
+
+
+class CommentThreadTestCase(APITestCase):
+    """
+    Tests for threaded replies and /api/posts/<pk>/comments/.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        self.post = Post.objects.create(author=self.user, title='Post', content='content')
+        self.client.force_authenticate(self.user)
+
+    def reply(self, parent, content):
+        return Comment.objects.create(post=self.post, author=self.user, parent=parent, content=content)
+
+    def test_replies_get_materialized_paths(self):
+        response = self.client.post('/api/comments/', {'post': self.post.pk, 'content': 'root'})
+        root = Comment.objects.get(pk=response.data['id'])
+        response = self.client.post('/api/comments/', {'post': self.post.pk, 'parent': root.pk, 'content': 'reply'})
+        reply = Comment.objects.get(pk=response.data['id'])
+
+        self.assertEqual(response.data['depth'], 1)
+        self.assertEqual(reply.path, str(root.pk).zfill(12) + str(reply.pk).zfill(12))
+        self.assertTrue(reply.path.startswith(root.path))
+
+    @override_settings(COMMENT_MAX_DEPTH=1)
+    def test_reply_validation(self):
+        root = self.reply(None, 'root')
+        child = self.reply(root, 'child')
+        other_post = Post.objects.create(author=self.user, title='Other', content='content')
+
+        too_deep = self.client.post('/api/comments/', {'post': self.post.pk, 'parent': child.pk, 'content': 'x'})
+        wrong_post = self.client.post('/api/comments/', {'post': other_post.pk, 'parent': root.pk, 'content': 'x'})
+
+        self.assertEqual(too_deep.status_code, 400)
+        self.assertEqual(wrong_post.status_code, 400)
+
+    def test_threads_page_in_constant_queries(self):
+        """
+        Top threads come newest first with their first replies in tree order,
+        and the query count does not grow with threads or replies.
+        """
+        first = self.reply(None, 'first')
+        a = self.reply(first, 'a')
+        self.reply(first, 'b')
+        self.reply(a, 'a1')
+        second = self.reply(None, 'second')
+        for i in range(5):
+            self.reply(second, f's{i}')
+        self.reply(None, 'third')
+
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/posts/{self.post.pk}/comments/?replies=3')
+
+        threads = response.data['results']
+        self.assertEqual([thread['content'] for thread in threads], ['third', 'second', 'first'])
+        self.assertEqual([thread['reply_count'] for thread in threads], [0, 5, 3])
+        self.assertEqual([reply['content'] for reply in threads[1]['replies']], ['s0', 's1', 's2'])
+        self.assertEqual([reply['content'] for reply in threads[2]['replies']], ['a', 'a1', 'b'])
+
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/posts/{self.post.pk}/comments/?thread={first.pk}')
+        self.assertEqual([reply['content'] for reply in response.data['results']], ['first', 'a', 'a1', 'b'])
+
+    def test_subtree_fetch_uses_path_index(self):
+        root = self.reply(None, 'root')
+        subtree = Comment.objects.filter(post=self.post, **subtree_range(root.path)).order_by('path')
+
+        plan = subtree.explain()
+
+        self.assertIn('comment_post_path_idx', plan)
+        self.assertNotRegex(plan, SORT_PATTERNS['sqlite'])
+
+
+class BulkCreateTestCase(APITestCase):
+    """
+    Tests for POST /api/posts/bulk/ and /api/comments/bulk/.
+    """
+
+    def setUp(self):
+        tracker.reset()
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        tracker.reset()
+
+    @override_settings(BULK_CREATE_BATCH_SIZE=2)
+    def test_bulk_posts_in_batches(self):
+        items = [{'title': f'Post {i}', 'content': 'content'} for i in range(5)]
+
+        # One savepoint, insert, 'post.created' event and release per batch
+        # of two
+        with self.assertNumQueries(12):
+            response = self.client.post('/api/posts/bulk/', items, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual([result['index'] for result in response.data['results']], list(range(5)))
+        created = Post.objects.filter(pk__in=[result['id'] for result in response.data['results']])
+        self.assertEqual(set(created.values_list('author', flat=True)), {self.user.pk})
+
+    def test_invalid_items_are_reported_per_item(self):
+        post = Post.objects.create(author=self.user, title='Post', content='content')
+        root = Comment.objects.create(post=post, author=self.user, content='root')
+        items = [
+            {'post': post.pk, 'content': 'first'},
+            {'post': post.pk, 'content': ''},
+            {'post': post.pk, 'parent': root.pk, 'content': 'reply'},
+            {'post': 999999, 'content': 'missing post'},
+        ]
+
+        response = self.client.post('/api/comments/bulk/', items, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        statuses = [(result['index'], result['status']) for result in response.data['results']]
+        self.assertEqual(statuses, [(0, 201), (1, 400), (2, 201), (3, 400)])
+        self.assertIn('content', response.data['results'][1]['errors'])
+        self.assertIn('post', response.data['results'][3]['errors'])
+
+        reply = Comment.objects.get(pk=response.data['results'][2]['id'])
+        self.assertEqual(reply.depth, 1)
+        self.assertEqual(reply.path, root.path + str(reply.pk).zfill(12))
+        with override_settings(TRENDING={'SETTLE_SECONDS': 0}):
+            trending.update()
+        self.assertGreater(dict(tracker.ranking())[post.pk], 0)
+
+    def test_related_ids_are_loaded_once(self):
+        posts = [Post.objects.create(author=self.user, title=f'Post {i}', content='content') for i in range(3)]
+        items = [{'post': post.pk, 'content': f'comment {i}'} for post in posts for i in range(10)]
+
+        # posts lookup, savepoint, insert, path update, release
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/comments/bulk/', items, format='json')
+
+        self.assertEqual(response.data['created'], 30)
+
+    def test_failed_batches_report_a_generic_error(self):
+        post = Post.objects.create(author=self.user, title='Post', content='content')
+        items = [{'post': post.pk, 'content': 'first'}]
+        error = DatabaseError('constraint "posts_comment_secret" failed')
+        with mock.patch.object(models.QuerySet, 'bulk_create', side_effect=error), \
+                self.assertLogs('posts.serializers', 'ERROR') as logs:
+            response = self.client.post('/api/comments/bulk/', items, format='json')
+
+        self.assertEqual(response.data['results'][0]['errors'], {'non_field_errors': ['Could not be saved.']})
+        self.assertIn('posts_comment_secret', logs.output[0])
+
+    @override_settings(THROTTLE_BUCKETS={'comment_bulk': {'RATE': '5/min', 'BURST': 5}})
+    def test_bulk_comments_take_one_token_each(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        post = Post.objects.create(author=self.user, title='Post', content='content')
+        items = [{'post': post.pk, 'content': f'comment {i}'} for i in range(3)]
+
+        self.assertEqual(self.client.post('/api/comments/bulk/', items, format='json').status_code, 201)
+        response = self.client.post('/api/comments/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(self.client.post('/api/comments/bulk/', items[:2], format='json').status_code, 201)
+        # More than a full bucket
+        response = self.client.post('/api/comments/bulk/', items * 2, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('Retry-After', response)
+        self.assertEqual(Comment.objects.count(), 5)
+
+    @override_settings(BULK_CREATE_MAX_ITEMS=2)
+    def test_max_items(self):
+        items = [{'title': f'Post {i}', 'content': 'content'} for i in range(3)]
+        response = self.client.post('/api/posts/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Post.objects.exists())
+
+
+class AsyncViewsTestCase(TestCase):
+    """
+    Tests for the async feed, like and notification views.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.viewer = CustomUser.objects.create_user(username='viewer', password='testpass123')
+        self.viewer.following.add(self.author)
+        self.posts = [Post.objects.create(author=self.author, title=f'Post {i}', content='content') for i in range(12)]
+        Comment.objects.create(post=self.posts[-1], author=self.viewer, content='First!')
+        Like.objects.create(user=self.viewer, post=self.posts[-1])
+        Notification.objects.create(recipient=self.viewer, actor=self.author, verb='replied', target=self.posts[0])
+        self.headers = {'Authorization': f'Token {Token.objects.create(user=self.viewer).key}'}
+
+    async def test_feed_matches_sync_feed(self):
+        for query in ['', '?page=2', '?page_size=5&page=2']:
+            sync_response = await sync_to_async(self.client.get)(f'/api/feed/{query}', headers=self.headers)
+            response = await self.async_client.get(f'/api/async/feed/{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            # Same body, apart from the path in the page links
+            body = json.loads(response.content.replace(b'/api/async/feed/', b'/api/feed/'))
+            self.assertEqual(body, sync_response.json())
+
+        response = await self.async_client.get('/api/async/feed/', headers=self.headers)
+        # Page served from the feed cache: token, liked ids, unread count
+        self.assertEqual(response.headers['X-Feed-Cache'], 'hit')
+        self.assertEqual(response.asgi_request.metrics.query_count, 3)
+        data = response.json()
+        self.assertEqual(data['count'], 12)
+        self.assertEqual(data['unread_notifications'], 1)
+        self.assertEqual([post['liked'] for post in data['results'][:2]], [True, False])
+        self.assertEqual(data['results'][0]['comments_count'], 1)
+
+        response = await self.async_client.get('/api/async/feed/?page=3', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_like_and_unlike(self):
+        post = self.posts[0]
+        response = await self.async_client.post(f'/api/async/posts/{post.pk}/like/', headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        response = await self.async_client.post(f'/api/async/posts/{post.pk}/like/', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+        await post.arefresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+        await sync_to_async(events.relay)()
+        self.assertTrue(await Notification.objects.filter(recipient=self.author, verb='liked your post').aexists())
+
+        response = await self.async_client.post(f'/api/async/posts/{post.pk}/unlike/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.post(f'/api/async/posts/{post.pk}/unlike/', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        await post.arefresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+
+        response = await self.async_client.post('/api/async/posts/0/like/', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(f'/api/async/posts/{post.pk}/like/', headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+    @override_settings(THROTTLE_BUCKETS={'like': {'RATE': '1/min', 'BURST': 1}})
+    async def test_like_is_throttled(self):
+        await self.async_client.post(f'/api/async/posts/{self.posts[0].pk}/like/', headers=self.headers)
+        response = await self.async_client.post(f'/api/async/posts/{self.posts[1].pk}/like/', headers=self.headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/async/feed/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.headers['WWW-Authenticate'], 'Token')
+        response = await self.async_client.get('/api/async/feed/', headers={'Authorization': 'Token nope'})
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+    async def test_notifications_match_sync_list(self):
+        sync_response = await sync_to_async(self.client.get)('/notifications/', headers=self.headers)
+        response = await self.async_client.get('/notifications/async/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertEqual(response.json()['results'][0]['target']['title'], 'Post 0')
+
+    async def test_notifications_are_paginated(self):
+        await Notification.objects.acreate(recipient=self.viewer, actor=self.author, verb='replied', target=self.posts[1])
+        sync_response = await sync_to_async(self.client.get)('/notifications/?page_size=1', headers=self.headers)
+        response = await self.async_client.get('/notifications/async/?page_size=1', headers=self.headers)
+        self.assertEqual(response.json()['count'], sync_response.json()['count'])
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNotNone(response.json()['next'])
+        response = await self.async_client.get('/notifications/async/?page=99', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_blocks_apply(self):
+        await sync_to_async(blocks.block)(self.author, self.viewer)
+        response = await self.async_client.post(f'/api/async/posts/{self.posts[0].pk}/like/', headers=self.headers)
+        self.assertEqual(response.status_code, 403)
+
+        await sync_to_async(blocks.unblock)(self.author, self.viewer)
+        # The block ended the follow
+        await self.viewer.following.aadd(self.author)
+        await sync_to_async(blocks.block)(self.viewer, self.author, Block.MUTE)
+        response = await self.async_client.get('/api/async/feed/', headers=self.headers)
+        self.assertEqual(response.json()['count'], 0)
+        response = await self.async_client.get('/notifications/async/', headers=self.headers)
+        self.assertEqual(response.json()['count'], 0)
+
+
+class FeedCacheTestCase(APITestCase):
+    """
+    Tests for the per-user feed page cache.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.viewer = CustomUser.objects.create_user(username='viewer', password='testpass123')
+        self.viewer.following.add(self.author)
+        self.posts = [Post.objects.create(author=self.author, title=f'Post {i}', content='content') for i in range(3)]
+        self.key = feed_cache.page_key(self.viewer, 'http://testserver/api/feed/')
+
+    def feed(self):
+        self.client.force_authenticate(self.viewer)
+        return self.client.get('/api/feed/')
+
+    def test_hit_after_miss(self):
+        # block list (cached after), count, page, comments, the viewer's likes, unread count
+        with self.assertNumQueries(6):
+            response = self.feed()
+        self.assertEqual(response['X-Feed-Cache'], 'miss')
+
+        # Only the viewer's likes and unread count
+        with self.assertNumQueries(2):
+            cached = self.feed()
+        self.assertEqual(cached['X-Feed-Cache'], 'hit')
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(feed_cache.stats(), {'hit': 1, 'miss': 1, 'stale': 0})
+
+    def test_viewer_state_is_not_cached(self):
+        self.feed()
+        Like.objects.create(user=self.viewer, post=self.posts[0])
+        response = self.feed()
+        self.assertEqual(response['X-Feed-Cache'], 'hit')
+        self.assertEqual([post['liked'] for post in response.data['results']], [False, False, True])
+
+    def test_new_post_invalidates_followers_feeds(self):
+        self.feed()
+        self.client.force_authenticate(self.author)
+        self.client.post('/api/posts/', {'title': 'Breaking', 'content': 'content'})
+        events.relay()
+
+        response = self.feed()
+        self.assertEqual(response['X-Feed-Cache'], 'miss')
+        self.assertEqual(response.data['results'][0]['title'], 'Breaking')
+
+    def test_follow_invalidates_own_feed(self):
+        other = CustomUser.objects.create_user(username='other', password='testpass123')
+        Post.objects.create(author=other, title='Other', content='content')
+        self.feed()
+        self.client.post(f'/api/follow/{other.pk}/')
+
+        response = self.feed()
+        self.assertEqual(response['X-Feed-Cache'], 'miss')
+        self.assertEqual(response.data['count'], 4)
+
+    def test_stale_page_is_served_while_another_request_recomputes(self):
+        self.feed()
+        feed_cache.invalidate([self.viewer.pk])
+        cache.add(f'{self.key}:lock', 'other worker')
+
+        with self.assertNumQueries(2):
+            response = self.feed()
+        self.assertEqual(response['X-Feed-Cache'], 'stale')
+        self.assertEqual(response.data['count'], 3)
+
+        cache.delete(f'{self.key}:lock')
+        self.assertEqual(self.feed()['X-Feed-Cache'], 'miss')
+
+    @override_settings(FEED_CACHE={'WAIT': 0})
+    def test_computes_itself_when_the_lock_holder_never_stores(self):
+        cache.add(f'{self.key}:lock', 'crashed worker')
+        response = self.feed()
+        self.assertEqual(response['X-Feed-Cache'], 'miss')
+        self.assertEqual(response.data['count'], 3)
+
+
+class TaggingTestCase(APITestCase):
+    """
+    Tests for hashtag and mention indexing and their timelines.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.alice = CustomUser.objects.create_user(username='alice', password='testpass123')
+        self.bob = CustomUser.objects.create_user(username='bob.smith', password='testpass123')
+        self.client.force_authenticate(self.author)
+
+    def test_extraction(self):
+        text = 'Hi @alice, @bob.smith. #Django #1 a#b ##x &#39; #café mail me at a@b.com'
+        self.assertEqual(tagging.extract_hashtags(text), {'django', 'café'})
+        self.assertEqual(tagging.extract_mentions(text), {'alice', 'bob.smith'})
+
+    def test_new_post_is_indexed_and_mentions_notified(self):
+        response = self.client.post('/api/posts/', {'title': 'Hi', 'content': '#Django tips for @alice and @author @nobody'})
+        post = Post.objects.get(pk=response.data['id'])
+
+        self.assertEqual(list(PostTag.objects.filter(post=post).values_list('tag__name', flat=True)), ['django'])
+        self.assertEqual(set(Mention.objects.filter(post=post).values_list('user__username', flat=True)), {'alice', 'author'})
+        self.assertEqual(PostTag.objects.get(post=post).created_at, post.created_at)
+        # Not the author mentioning themselves
+        notifications = Notification.objects.filter(verb='mentioned you')
+        self.assertEqual([n.recipient for n in notifications], [self.alice])
+        self.assertEqual(notifications[0].target, post)
+
+    def test_edit_reindexes_and_only_notifies_new_mentions(self):
+        response = self.client.post('/api/posts/', {'title': 'Hi', 'content': '#one #two @alice'})
+        post_id = response.data['id']
+        self.client.patch(f'/api/posts/{post_id}/', {'content': '#two #three @alice @bob.smith'})
+
+        self.assertEqual(
+            set(PostTag.objects.filter(post_id=post_id).values_list('tag__name', flat=True)), {'two', 'three'},
+        )
+        self.assertEqual(
+            sorted(Notification.objects.filter(verb='mentioned you').values_list('recipient__username', flat=True)),
+            ['alice', 'bob.smith'],
+        )
+
+    def test_bulk_created_posts_are_indexed(self):
+        items = [{'title': f'Post {i}', 'content': f'#bulk post {i} for @alice'} for i in range(3)]
+        self.client.post('/api/posts/bulk/', items, format='json')
+        self.assertEqual(PostTag.objects.filter(tag__name='bulk').count(), 3)
+        self.assertEqual(Notification.objects.filter(recipient=self.alice, verb='mentioned you').count(), 3)
+
+    def test_tag_timeline_pages_by_keyset(self):
+        base = timezone.now()
+        posts = []
+        for i in range(13):
+            post = Post.objects.create(author=self.author, title=f'Post {i}', content='about #Topic')
+            # Two posts per timestamp, to page through ties
+            Post.objects.filter(pk=post.pk).update(created_at=base - timedelta(minutes=i // 2))
+            posts.append(Post.objects.get(pk=post.pk))
+        tagging.index_posts(posts)
+        posts[0].soft_delete()
+        # The viewer's block lists are cached after their first read
+        blocks.hidden_ids(self.author.pk)
+
+        # tag, index page, posts, comments
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/tags/TOPIC/')
+        first = [post['id'] for post in response.data['results']]
+        response = self.client.get(response.data['next'])
+        second = [post['id'] for post in response.data['results']]
+
+        newest_first = [post.pk for post in sorted(posts[1:], key=lambda p: (p.created_at, p.pk), reverse=True)]
+        self.assertEqual(first + second, newest_first)
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(self.client.get('/api/tags/unknown/').data['results'], [])
+
+    def test_mentions_timeline(self):
+        self.client.post('/api/posts/', {'title': 'One', 'content': 'cc @alice'})
+        self.client.post('/api/posts/', {'title': 'Two', 'content': 'no mention'})
+        self.client.force_authenticate(self.alice)
+        response = self.client.get('/api/mentions/')
+        self.assertEqual([post['title'] for post in response.data['results']], ['One'])
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/mentions/').status_code, 401)
+
+
+class LikersTestCase(APITestCase):
+    """
+    Tests for the keyset-paginated likers list at /api/posts/<pk>/likes/.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', password='testpass123')
+        self.viewer = CustomUser.objects.create_user(username='viewer', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Post', content='content')
+        self.likers = [CustomUser.objects.create_user(username=f'liker{i}', password='testpass123') for i in range(5)]
+        now = timezone.now()
+        for i, liker in enumerate(self.likers):
+            like = Like.objects.create(user=liker, post=self.post)
+            # Two likes share a timestamp, so pages must break ties by id
+            Like.objects.filter(pk=like.pk).update(created_at=now - timedelta(minutes=min(i, 3)))
+        self.viewer.following.add(self.likers[1], self.likers[3])
+
+    def usernames(self, url):
+        """
+        (usernames, followed flags) of every page, following `next` links.
+        """
+        usernames, followed = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            usernames += [like['user'] for like in response.data['results']]
+            followed += [like.get('followed') for like in response.data['results']]
+            url = response.data['next']
+        return usernames, followed
+
+    def test_newest_first_in_pages(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/posts/{self.post.pk}/likes/?page_size=2')
+        self.assertEqual(response.data['results'][0]['user_id'], self.likers[0].pk)
+
+        usernames, _ = self.usernames(f'/api/posts/{self.post.pk}/likes/?page_size=2')
+        self.assertEqual(usernames, ['liker0', 'liker1', 'liker2', 'liker4', 'liker3'])
+
+    def test_following_first(self):
+        self.client.force_authenticate(self.viewer)
+        usernames, followed = self.usernames(f'/api/posts/{self.post.pk}/likes/?following=first&page_size=2')
+        self.assertEqual(usernames, ['liker1', 'liker3', 'liker0', 'liker2', 'liker4'])
+        self.assertEqual(followed, [True, True, False, False, False])
+
+        # Ignored for anonymous viewers
+        self.client.force_authenticate(None)
+        usernames, followed = self.usernames(f'/api/posts/{self.post.pk}/likes/?following=first')
+        self.assertEqual(usernames[0], 'liker0')
+        self.assertEqual(set(followed), {None})
+
+    def test_hidden_and_deleted_likers_are_left_out(self):
+        self.likers[0].soft_delete()
+        blocks.block(self.viewer, self.likers[2], Block.MUTE)
+        self.client.force_authenticate(self.viewer)
+        usernames, _ = self.usernames(f'/api/posts/{self.post.pk}/likes/')
+        self.assertEqual(usernames, ['liker1', 'liker4', 'liker3'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'/api/posts/{self.post.pk}/likes/?cursor=nope')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get('/api/posts/0/likes/').status_code, 404)
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard1', 'shard2'])
+class ShardingTestCase(APITestCase):
+    """
+    Tests for placing posts, comments and likes on database shards by author.
+    """
+    databases = {'default', 'shard1', 'shard2'}
+    shards = ['default', 'shard1', 'shard2']
+
+    def setUp(self):
+        cache.clear()
+        sharding.allocator.reset()
+        self.addCleanup(sharding.allocator.reset)
+        self.viewer = CustomUser.objects.create_user(username='viewer', password='testpass123')
+        # One author on each shard
+        self.authors = {}
+        while len(self.authors) < len(self.shards):
+            author = CustomUser.objects.create_user(username=f'author{len(self.authors)}', password='testpass123')
+            self.authors.setdefault(sharding.shard_for(author.pk), author)
+            self.viewer.following.add(author)
+
+    def on(self, alias, model=Post):
+        return set(model._base_manager.using(alias).values_list('pk', flat=True))
+
+    def test_seeded_rows_are_on_their_shard(self):
+        call_command('seed_social', users=30, seed=1, stdout=StringIO())
+
+        for alias in self.shards:
+            self.assertTrue(self.on(alias))
+            self.assertTrue(self.on(alias, Comment))
+            self.assertTrue(self.on(alias, Like))
+            self.assertEqual(sharding.misplaced_authors(alias), [])
+            self.assertFalse(Comment.objects.using(alias).filter(path='').exists())
+
+        out = StringIO()
+        call_command('explain_endpoints', stdout=out)
+        self.assertIn('post comments @shard1: ok', out.getvalue())
+
+    def test_jump_hash_moves_only_to_the_new_shard(self):
+        before = [sharding.jump_hash(key, 3) for key in range(3000)]
+        after = [sharding.jump_hash(key, 4) for key in range(3000)]
+        moved = [new for old, new in zip(before, after) if old != new]
+        self.assertEqual(set(moved), {3})
+        self.assertAlmostEqual(len(moved) / 3000, 1 / 4, delta=0.05)
+        for bucket in range(3):
+            self.assertAlmostEqual(before.count(bucket) / 3000, 1 / 3, delta=0.05)
+
+    def test_rows_follow_their_author(self):
+        posts = {}
+        for alias, author in self.authors.items():
+            post = author.posts.create(title=f'Post on {alias}', content='content')
+            comment = post.comments.create(author=self.viewer, content='comment')
+            reply = Comment(post=post, parent=comment, author=author, content='reply')
+            reply.save()
+            post.likes.create(user=self.viewer)
+            posts[alias] = post
+
+        for alias, post in posts.items():
+            self.assertEqual(self.on(alias), {post.pk})
+            self.assertEqual(Comment.objects.using(alias).filter(post=post).count(), 2)
+            self.assertEqual(self.on(alias, Like), set(post.likes.values_list('pk', flat=True)))
+            # The path update after the insert reached the shard too
+            self.assertTrue(Comment.objects.using(alias).get(parent__isnull=False).path.startswith(
+                Comment.objects.using(alias).get(parent__isnull=True).path
+            ))
+        # Ids are unique across the shards
+        self.assertEqual(len({post.pk for post in posts.values()}), 3)
+        self.assertEqual(len(set().union(*(self.on(alias, Comment) for alias in self.shards))), 6)
+        # Relations to users are followed on default
+        self.assertEqual(Post.objects.using('shard1').get().author, self.authors['shard1'])
+
+    def test_feed_merges_the_shards(self):
+        now = timezone.now()
+        expected = []
+        for offset, author in enumerate(self.authors.values()):
+            for i in range(4):
+                post = author.posts.create(title=f'{author.username} {i}', content='content')
+                # Interleave the shards: every third post comes from one author
+                created_at = now - timedelta(minutes=3 * i + offset)
+                Post.objects.using(post._state.db).filter(pk=post.pk).update(created_at=created_at)
+                expected.append((created_at, post.pk))
+        muted = self.authors['shard2']
+        muted.posts.create(title='unseen', content='content')
+        liked = Post.objects.using('shard1').order_by('-created_at').first()
+        liked.likes.create(user=self.viewer)
+        self.client.force_authenticate(self.viewer)
+
+        newest_first = [pk for _, pk in sorted(expected, reverse=True)]
+        response = self.client.get('/api/feed/?page_size=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 13)
+        self.assertEqual([post['id'] for post in response.data['results']][1:], newest_first[:4])
+        self.assertEqual(response.data['results'][0]['title'], 'unseen')
+
+        response = self.client.get('/api/feed/?page_size=5&page=2')
+        self.assertEqual([post['id'] for post in response.data['results']], newest_first[4:9])
+        self.assertEqual(
+            [post['id'] for post in response.data['results'] if post['liked']],
+            [liked.pk] if liked.pk in newest_first[4:9] else [],
+        )
+
+        blocks.block(self.viewer, muted, Block.MUTE)
+        response = self.client.get('/api/feed/?page_size=20')
+        self.assertEqual([post['id'] for post in response.data['results']], [
+            pk for pk in newest_first if pk not in self.on('shard2')
+        ])
+        self.assertEqual([post['id'] for post in response.data['results'] if post['liked']], [liked.pk])
+
+    def test_hidden_authors_comments_are_left_out(self):
+        author = self.authors['shard1']
+        muted = self.authors['shard2']
+        post = author.posts.create(title='post', content='content')
+        Comment.objects.using('shard1').create(post=post, author=author, content='Visible')
+        Comment.objects.using('shard1').create(post=post, author=muted, content='Hidden')
+        blocks.block(self.viewer, muted, Block.MUTE)
+        self.client.force_authenticate(self.viewer)
+
+        response = self.client.get(f'/api/posts/{post.pk}/')
+        self.assertEqual([comment['content'] for comment in response.data['comments']], ['Visible'])
+        response = self.client.get('/api/feed/')
+        self.assertEqual([comment['content'] for comment in response.data['results'][0]['comments']], ['Visible'])
+        response = self.client.get('/api/comments/')
+        self.assertEqual([comment['content'] for comment in response.data['results']], ['Visible'])
+
+    async def test_async_feed_merges_the_shards(self):
+        for author in self.authors.values():
+            await sync_to_async(author.posts.create)(title=author.username, content='content')
+        token = await Token.objects.acreate(user=self.viewer)
+        response = await self.async_client.get('/api/async/feed/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({post['author'] for post in response.json()['results']}, {
+            author.username for author in self.authors.values()
+        })
+
+    def test_likes_and_comments_on_the_shards(self):
+        self.client.force_authenticate(self.viewer)
+        for alias, author in self.authors.items():
+            post = author.posts.create(title=f'Post on {alias}', content='content')
+            self.assertEqual(self.client.post(f'/api/posts/{post.pk}/like/').status_code, 201)
+            self.assertEqual(self.client.post(f'/api/posts/{post.pk}/like/').status_code, 400)
+            self.assertEqual(Like.objects.using(alias).get().post_id, post.pk)
+            self.assertEqual(Post.objects.using(alias).get().likes_count, 1)
+
+            response = self.client.post('/api/comments/', {'post': post.pk, 'content': 'comment'})
+            self.assertEqual(response.status_code, 201)
+            comment = Comment.objects.using(alias).get(pk=response.data['id'])
+            response = self.client.post('/api/comments/', {'post': post.pk, 'parent': comment.pk, 'content': 'reply'})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(Comment.objects.using(alias).get(pk=response.data['id']).depth, 1)
+
+            response = self.client.get(f'/api/posts/{post.pk}/')
+            self.assertEqual((response.data['likes_count'], response.data['comments_count']), (1, 2))
+            response = self.client.get(f'/api/posts/{post.pk}/comments/')
+            self.assertEqual(response.data['results'][0]['reply_count'], 1)
+            response = self.client.get(f'/api/posts/{post.pk}/likes/?following=first')
+            self.assertEqual(response.data['results'][0]['user'], 'viewer')
+
+            response = self.client.patch(f'/api/comments/{comment.pk}/', {'content': 'edited'})
+            self.assertEqual(response.data['content'], 'edited')
+            self.assertEqual(self.client.post(f'/api/posts/{post.pk}/unlike/').status_code, 200)
+            self.assertEqual(self.on(alias, Like), set())
+            self.assertEqual(Post.objects.using(alias).get().likes_count, 0)
+        # Nothing landed on a shard that does not own it
+        for alias in self.shards:
+            self.assertEqual(self.on(alias), set(self.authors[alias].posts.values_list('pk', flat=True)))
+
+        response = self.client.get('/api/comments/?page_size=4')
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(len(response.data['results']), 4)
+        # Trending scores add the comments of every shard, each with its own watermark
+        with override_settings(TRENDING={'SETTLE_SECONDS': 0}):
+            self.assertEqual(trending.update()['comment']['rows'], 6)
+
+        # Notifications on default point at posts on the shards
+        events.relay()
+        for alias, author in self.authors.items():
+            self.client.force_authenticate(author)
+            response = self.client.get('/notifications/')
+            self.assertEqual(response.data['results'][0]['target']['title'], f'Post on {alias}')
+
+    def test_posts_are_created_and_deleted_on_their_shard(self):
+        for alias, author in self.authors.items():
+            self.client.force_authenticate(author)
+            response = self.client.post('/api/posts/', {'title': alias, 'content': 'content'})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.on(alias), {response.data['id']})
+            response = self.client.patch(f'/api/posts/{response.data["id"]}/', {'title': 'edited'})
+            self.assertEqual(response.data['title'], 'edited')
+            self.assertEqual(self.client.delete(f'/api/posts/{response.data["id"]}/').status_code, 204)
+            self.assertIsNotNone(Post.all_objects.using(alias).get().deleted_at)
+        self.assertEqual(reap().rows['posts.Post'], 3)
+        self.assertEqual(set().union(*(self.on(alias) for alias in self.shards)), set())
+
+    def test_bulk_create_on_the_shards(self):
+        for alias, author in self.authors.items():
+            self.client.force_authenticate(author)
+            response = self.client.post('/api/posts/bulk/', [
+                {'title': f'{alias} {i}', 'content': 'content'} for i in range(2)
+            ], format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.on(alias), {result['id'] for result in response.data['results']})
+
+        roots = {post.pk: Comment.objects.using(alias).create(post=post, author=self.viewer, content='root')
+                 for alias in self.shards for post in [Post.objects.using(alias).first()]}
+        self.client.force_authenticate(self.viewer)
+        items = [{'post': post_id, 'content': 'comment'} for alias in self.shards for post_id in self.on(alias)]
+        items += [{'post': post_id, 'parent': root.pk, 'content': 'reply'} for post_id, root in roots.items()]
+        response = self.client.post('/api/comments/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 9)
+        for alias in self.shards:
+            comments = Comment.objects.using(alias)
+            self.assertEqual(set(comments.values_list('post_id', flat=True)), self.on(alias))
+            reply = comments.get(parent__isnull=False)
+            self.assertEqual(reply.path, reply.parent.path + str(reply.pk).zfill(12))
+
+        response = self.client.get('/api/posts/?page_size=4&page=2')
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual([post['title'] for post in response.data['results']], [
+            post.title for post in sorted(
+                (post for alias in self.shards for post in Post.objects.using(alias)),
+                key=lambda post: (post.created_at, post.pk), reverse=True,
+            )[4:]
+        ])
+
+    def test_rebalance_moves_authors_to_their_shard(self):
+        with override_settings(DATABASE_SHARDS=[]):
+            for author in self.authors.values():
+                post = Post.objects.create(author=author, title='#moving', content='#moving')
+                tagging.index_posts([post], created=True)
+                reply_to = Comment.objects.create(post=post, author=self.viewer, content='comment')
+                Comment.objects.create(post=post, parent=reply_to, author=author, content='reply')
+                Like.objects.create(post=post, user=self.viewer)
+        self.assertEqual(len(self.on('default')), 3)
+
+        out = StringIO()
+        call_command('rebalance_shards', '--dry-run', stdout=out)
+        self.assertIn('2 authors to move', out.getvalue())
+        call_command('rebalance_shards', '--batch-size', '1', stdout=out)
+        self.assertIn('Moved 2 authors: 2 posts, 4 comments, 2 likes', out.getvalue())
+
+        for alias, author in self.authors.items():
+            post_ids = set(author.posts.values_list('pk', flat=True))
+            self.assertEqual(len(post_ids), 1)
+            self.assertEqual(self.on(alias), post_ids)
+            self.assertEqual(set(Like.objects.using(alias).values_list('post_id', flat=True)), post_ids)
+            self.assertEqual(Comment.objects.using(alias).filter(parent__isnull=False).count(), 1)
+        # The tag index stays on default and still finds every post
+        self.assertEqual(PostTag.objects.count(), 3)
+
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('Moved 0 authors', out.getvalue())
@@ -0,0 +1,213 @@
+"""
+Trending posts: time-decayed engagement scores, updated by a periodic job.
+
+A post's score is the sum of its likes and comments, each weighted and decayed
+exponentially with its age: sum(weight * exp(-rate * (now - event_time))).
+Multiplying every term by exp(rate * (now - EPOCH)) does not change the order,
+so we store log(sum(weight * exp(rate * (event_time - EPOCH)))) instead. It
+never has to be decayed, and adding an event is one logaddexp.
+
+Scores are stored in the PostScore table by `manage.py update_trending`, run
+every few seconds. Like the analytics rollups, it keeps a watermark per
+table, the highest like or comment id already added, and adds the next
+BATCH_SIZE rows to their posts' scores in the transaction that moves it.
+Rows younger than SETTLE_SECONDS are left for the next run, so a late
+commit below the watermark is not skipped. With database shards (see
+posts.sharding) each shard has its own watermark,
+`trending-<table>@<alias>`, and rows are taken in (created_at, id) order
+because their ids are not (see analytics.rollups.pending_keys).
+rebalance_shards copies rows with their ids and timestamps, so a row moved
+past its new shard's watermark is added a second time.
+
+Each process keeps the top K in memory and reloads it from PostScore every
+RELOAD_SECONDS. Reading the ranking never writes.
+
+Settings (TRENDING dict): HALF_LIFE_HOURS, LIKE_WEIGHT, COMMENT_WEIGHT, SIZE,
+RELOAD_SECONDS, BATCH_SIZE, SETTLE_SECONDS.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.utils import timezone
+
+from . import sharding
+
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+DEFAULTS = {
+    'HALF_LIFE_HOURS': 24,
+    'LIKE_WEIGHT': 1.0,
+    'COMMENT_WEIGHT': 2.0,
+    'SIZE': 100,
+    'RELOAD_SECONDS': 10,
+    'BATCH_SIZE': 5000,
+    'SETTLE_SECONDS': 5,
+}
+
+
+def options():
+    return {**DEFAULTS, **getattr(settings, 'TRENDING', {})}
+
+
+def logaddexp(a, b):
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+class TrendingTracker:
+    """
+    In-memory top K of the stored post scores.
+    """
+
+    def __init__(self, half_life_hours, like_weight, comment_weight, size, reload_seconds):
+        self.rate = math.log(2) / (half_life_hours * 3600)
+        self.weights = {'like': like_weight, 'comment': comment_weight}
+        self.size = size
+        self.reload_seconds = reload_seconds
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.top = []
+            self.loaded_at = None
+
+    def log_weight(self, event, when):
+        return math.log(self.weights[event]) + self.rate * (when - EPOCH).total_seconds()
+
+    def scores(self, events):
+        """
+        {post_id: log score} of (post_id, 'like' or 'comment', time) events.
+        """
+        scores = {}
+        for post_id, event, when in events:
+            scores[post_id] = logaddexp(scores.get(post_id), self.log_weight(event, when))
+        return scores
+
+    def ranking(self, limit=None, now=None):
+        """
+        [(post_id, decayed score)] best first. Reloads when due; never writes.
+        """
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.reload_seconds:
+            self.reload()
+        shift = self.rate * ((now or timezone.now()) - EPOCH).total_seconds()
+        with self.lock:
+            ranked = self.top[:limit or self.size]
+        return [(post_id, math.exp(score - shift)) for post_id, score in ranked]
+
+    def reload(self):
+        """
+        Load the top K from PostScore.
+        """
+        from .models import PostScore
+
+        rows = list(PostScore.objects.order_by('-log_score').values_list('post_id', 'log_score')[:self.size])
+        with self.lock:
+            self.top = rows
+            self.loaded_at = time.monotonic()
+
+    def store(self, scores):
+        """
+        Add `scores`, {post_id: log score}, to the stored scores. Call it in a
+        transaction; a concurrent store creating the same row fails it with
+        IntegrityError.
+        """
+        from .models import PostScore
+
+        stored = {
+            row.post_id: row
+            for row in PostScore.objects.select_for_update().filter(post_id__in=scores)
+        }
+        now = timezone.now()
+        for row in stored.values():
+            row.log_score = logaddexp(row.log_score, scores[row.post_id])
+            row.updated_at = now
+        PostScore.objects.bulk_update(stored.values(), ['log_score', 'updated_at'])
+        PostScore.objects.bulk_create([
+            PostScore(post_id=post_id, log_score=score)
+            for post_id, score in scores.items() if post_id not in stored
+        ])
+
+
+def build_tracker():
+    config = options()
+    return TrendingTracker(
+        half_life_hours=config['HALF_LIFE_HOURS'],
+        like_weight=config['LIKE_WEIGHT'],
+        comment_weight=config['COMMENT_WEIGHT'],
+        size=config['SIZE'],
+        reload_seconds=config['RELOAD_SECONDS'],
+    )
+
+
+tracker = build_tracker()
+
+
+SOURCES = ('like', 'comment')
+
+
+def source_model(event):
+    from .models import Comment, Like
+
+    return {'like': Like, 'comment': Comment}[event]
+
+
+def update_batch(event, batch_size=None, alias=None):
+    """
+    Add the next batch of `event` rows ('like' or 'comment'), on database
+    shard `alias`, to their posts' scores. Returns the number of rows added,
+    0 once caught up.
+    """
+    from analytics.models import Watermark
+    from analytics.rollups import pending_keys
+
+    batch_size = batch_size or options()['BATCH_SIZE']
+    queryset = sharding.using(source_model(event).objects.all(), alias)
+    watermark = f'trending-{event}' if alias in (None, DEFAULT_DB_ALIAS) else f'trending-{event}@{alias}'
+    settled = timezone.now() - timedelta(seconds=options()['SETTLE_SECONDS'])
+    with transaction.atomic():
+        Watermark.objects.get_or_create(source=watermark)
+        # Concurrent runs take turns per table
+        mark = Watermark.objects.select_for_update().get(source=watermark)
+        keys = pending_keys(queryset, mark, 'created_at', batch_size, settled, fields=['post_id'])
+        if not keys:
+            return 0
+
+        tracker.store(tracker.scores((post_id, event, created_at) for _, created_at, post_id in keys))
+        mark.last_id, mark.last_created_at = keys[-1][:2]
+        mark.save(update_fields=['last_id', 'last_created_at', 'updated_at'])
+    return len(keys)
+
+
+def update(batch_size=None, max_batches=None):
+    """
+    Add every new like and comment to the scores, batch after batch, until
+    caught up or `max_batches` per table and shard. Returns {event: {'rows',
+    'batches', 'elapsed_s'}}.
+    """
+    results = {}
+    for event in SOURCES:
+        started = time.perf_counter()
+        rows = batches = 0
+        for alias in sharding.each_shard():
+            shard_batches = 0
+            while max_batches is None or shard_batches < max_batches:
+                try:
+                    added = update_batch(event, batch_size, alias)
+                except IntegrityError:
+                    # Lost a race to create a score row; the batch rolled back
+                    added = update_batch(event, batch_size, alias)
+                if not added:
+                    break
+                rows += added
+                shard_batches += 1
+            batches += shard_batches
+        results[event] = {'rows': rows, 'batches': batches, 'elapsed_s': round(time.perf_counter() - started, 3)}
+    return results
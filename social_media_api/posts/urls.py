@@ -1,7 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import PostViewSet, CommentViewSet, feed_view, like_post, unlike_post
+from .views import (
+    PostViewSet, CommentViewSet, feed_view, like_post, unlike_post,
+    feed_view_async, like_post_async, unlike_post_async,
+    mentions_timeline, tag_timeline,
+)
 
 router = DefaultRouter()
 router.register(r'posts', PostViewSet, basename='post')
@@ -12,5 +16,11 @@ urlpatterns = [
     path('feed/', feed_view, name='feed'),
     path('posts/<int:pk>/like/', like_post, name='like-post'),
     path('posts/<int:pk>/unlike/', unlike_post, name='unlike-post'),
+    path('tags/<str:tag>/', tag_timeline, name='tag-timeline'),
+    path('mentions/', mentions_timeline, name='mentions'),
+    # The same endpoints as async views, for ASGI deployments
+    path('async/feed/', feed_view_async, name='feed-async'),
+    path('async/posts/<int:pk>/like/', like_post_async, name='like-post-async'),
+    path('async/posts/<int:pk>/unlike/', unlike_post_async, name='unlike-post-async'),
 
 ]
\ No newline at end of file
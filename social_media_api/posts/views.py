@@ -1,15 +1,50 @@
+import base64
+import json
+from datetime import datetime
+
 # Third-party imports
-from rest_framework import viewsets, permissions, filters
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.decorators import api_view, permission_classes
+from asgiref.sync import sync_to_async
+from rest_framework import filters, generics, permissions, status, viewsets
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
+from rest_framework.exceptions import NotFound, PermissionDenied
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.contrib.contenttypes.models import ContentType
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber, Substr
 
 # Local app imports
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer
+from . import counters, feed_cache, sharding, tagging
+from .models import PATH_WIDTH, Post, Comment, Like, Mention, PostTag, Tag, subtree_range
+from .serializers import PostSerializer, CommentSerializer, LikeSerializer, ThreadSerializer, publish_created
+from .trending import tracker as trending_tracker
+from accounts import blocks
+from outbox import events
 from notifications.models import Notification
+from social_media_api.async_api import async_api_view, json_response, page_bounds, paginated
+from social_media_api.throttling import TokenBucketThrottle
+from shared.middleware import n_plus_one_exempt
+
+User = get_user_model()
+
+def bulk_response(serializer):
+    """
+    Per-item results of a bulk create: 201 when every item was created,
+    207 when only some were, 400 when none were.
+    """
+    results = serializer.results()
+    created = sum(1 for result in results if result['status'] == 201)
+    if created == len(results):
+        code = status.HTTP_201_CREATED
+    elif created:
+        code = status.HTTP_207_MULTI_STATUS
+    else:
+        code = status.HTTP_400_BAD_REQUEST
+    return Response({'created': created, 'failed': len(results) - created, 'results': results}, status=code)
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
     """
@@ -27,64 +62,576 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+class TimelinePagination(CursorPagination):
+    """
+    Keyset pagination over a PostTag or Mention index: newest first, each
+    page one range scan of the (tag or user, created_at, post) index.
+    """
+    ordering = ('-created_at', '-post_id')
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+class LikePagination(BasePagination):
+    """
+    Keyset pagination over a post's likes, newest first, in one or more
+    segments read one after the other (e.g. likes by users the viewer
+    follows, then the others). The cursor holds the segment and the
+    (created_at, id) of the last like of the page, so a page is a range
+    scan of the (post, -created_at) index however deep it is.
+    Forward only: pages have a `next` link.
+    """
+    ordering = ('-created_at', '-pk')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def decode_cursor(self, request, names):
+        """
+        (index of the segment to start in, (created_at, id) to start after
+        or None).
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 0, None
+        try:
+            name, created_at, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return names.index(name), (datetime.fromisoformat(created_at), int(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, like):
+        position = [like.segment, like.created_at.isoformat(), like.pk]
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def paginate_segments(self, segments, request):
+        """
+        The page of likes after the cursor, from `segments`, a list of
+        (name, queryset in `ordering`). Each like gets its
+        segment's name as `segment`. Reads one extra like to know whether
+        there is a next page.
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        start, after = self.decode_cursor(request, [name for name, _ in segments])
+        page = []
+        for name, likes in segments[start:]:
+            if after is not None:
+                created_at, pk = after
+                # The `lte` bound lets the index seek to the cursor
+                likes = likes.filter(Q(created_at__lt=created_at) | Q(pk__lt=pk), created_at__lte=created_at)
+                after = None
+            for like in likes[:size + 1 - len(page)]:
+                like.segment = name
+                page.append(like)
+            if len(page) > size:
+                break
+        self.next_cursor = self.encode_cursor(page[size - 1]) if len(page) > size else None
+        return page[:size]
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor is not None:
+            next_url = replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+        return Response({'next': next_url, 'results': data})
+
+def hidden_authors(user):
+    """
+    Ids of the users `user` muted or blocked (see accounts.blocks); none for
+    anonymous users.
+    """
+    return blocks.hidden_ids(user.pk) if user.is_authenticated else ()
+
+def visible_comments(hidden, queryset=None):
+    """
+    Prefetch of posts' comments leaving out those by the authors in `hidden`.
+    """
+    comments = Comment.objects.select_related('author') if queryset is None else queryset
+    if hidden:
+        comments = comments.exclude(author_id__in=list(hidden))
+    return Prefetch('comments', queryset=comments)
+
+def load_related(rows, hidden=()):
+    """
+    Load what serializing `rows`, posts or comments, reads and was not
+    loaded yet: the posts' comments, less those by the authors in `hidden`,
+    with one query per shard, and every author with one query. Returns the
+    rows.
+    """
+    comments = []
+    if rows and isinstance(rows[0], Post):
+        for group in sharding.by_shard(rows).values():
+            prefetch_related_objects(group, visible_comments(hidden, Comment.objects.all()))
+        comments = [comment for post in rows for comment in post.comments.all()]
+    sharding.attach_users([*rows, *comments], 'author')
+    return rows
+
+class ShardedViewSetMixin:
+    """
+    For viewsets of posts or comments when posts are sharded (see
+    posts.sharding): a detail lookup reads the row's shard and the list
+    merges every shard's newest rows. Related rows are loaded with
+    load_related(), since users are not on the shards.
+    """
+    def get_queryset(self):
+        if not sharding.enabled():
+            return super().get_queryset()
+        queryset = self.queryset.model.objects.all()
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if pk is None:
+            return queryset
+        return queryset.using(sharding.locate(queryset.model, pk))
+
+    def get_object(self):
+        obj = super().get_object()
+        if sharding.enabled():
+            load_related([obj], hidden_authors(self.request.user))
+        return obj
+
+    def list(self, request, *args, **kwargs):
+        if not sharding.enabled():
+            return super().list(request, *args, **kwargs)
+        rows = self.filter_queryset(self.get_queryset())
+        return Response(get_sharded_page(request, self.paginator, rows, hidden_authors(request.user)))
+
+class PostViewSet(ShardedViewSetMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.select_related('author')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     pagination_class = StandardResultsSetPagination
     filter_backends = [filters.SearchFilter]
     search_fields = ['title', 'content']
 
+    def get_queryset(self):
+        posts = super().get_queryset()
+        if sharding.enabled():
+            # load_related() leaves the hidden comments out
+            return posts
+        # Comments by users the viewer muted or blocked are left out
+        return posts.prefetch_related(visible_comments(hidden_authors(self.request.user)))
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            post = serializer.save(author=self.request.user)
+            publish_created([post])
+        tagging.index_posts([post], created=True)
+
+    def perform_update(self, serializer):
+        post = serializer.save()
+        tagging.index_posts([post])
+
+    def perform_destroy(self, instance):
+        # Dependents are removed later by the reaper
+        instance.soft_delete()
+
+    # One INSERT per batch of BULK_CREATE_BATCH_SIZE rows, not per row
+    @n_plus_one_exempt
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request):
+        """
+        Create a list of posts in one request, authored by the current user.
+        """
+        serializer = self.get_serializer(
+            data=request.data, many=True, max_length=getattr(settings, 'BULK_CREATE_MAX_ITEMS', 1000),
+        )
+        serializer.is_valid(raise_exception=True)
+        # Each batch publishes its 'post.created' event (PostSerializer.bulk_created)
+        posts = serializer.save(author=request.user)
+        if posts:
+            tagging.index_posts(posts, created=True)
+        return bulk_response(serializer)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
+    def trending(self, request):
+        """
+        Posts with the highest time-decayed like and comment activity.
+        Served from the in-memory top K of the scores update_trending
+        stores; `limit` caps the number returned.
+        """
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 20)), 100))
+        except ValueError:
+            limit = 20
+        ranking = trending_tracker.ranking(limit)
+        posts = sharding.in_bulk(self.get_queryset(), [post_id for post_id, _ in ranking])
+        load_related(list(posts.values()), hidden_authors(request.user))
+        counters.preload(list(posts.values()), 'likes_count')
+        results = []
+        for post_id, score in ranking:
+            if post_id in posts:
+                data = self.get_serializer(posts[post_id]).data
+                data['trending_score'] = round(score, 4)
+                results.append(data)
+        return Response({'results': results})
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all()
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
+    def comments(self, request, pk=None):
+        """
+        Comment threads of the post, newest first, each with its first
+        `replies` replies (default 3) in tree order and its reply count.
+        With `thread=<comment id>`, pages through that comment's whole
+        subtree instead. Either way a page costs four queries (with sharded
+        posts, the authors are one more, on default).
+        Comments by users the viewer muted or blocked are left out.
+        """
+        alias = sharding.locate(Post, pk)
+        post = generics.get_object_or_404(sharding.using(Post.objects.only('pk'), alias), pk=pk)
+        paginator = StandardResultsSetPagination()
+        comments = sharding.using(Comment.objects.filter(post=post), alias)
+        if alias is None:
+            comments = comments.select_related('author')
+        hidden = hidden_authors(request.user)
+        if hidden:
+            comments = comments.exclude(author_id__in=list(hidden))
+
+        thread_id = request.query_params.get('thread')
+        if thread_id:
+            root = generics.get_object_or_404(
+                sharding.using(Comment.objects.filter(post=post), alias).only('path'), pk=thread_id,
+            )
+            subtree = comments.filter(**subtree_range(root.path)).order_by('path')
+            page = load_related(paginator.paginate_queryset(subtree, request))
+            return paginator.get_paginated_response(CommentSerializer(page, many=True).data)
+
+        try:
+            per_thread = max(0, min(int(request.query_params.get('replies', 3)), 50))
+        except ValueError:
+            per_thread = 3
+        roots = comments.filter(parent__isnull=True).order_by('-created_at')
+        page = paginator.paginate_queryset(roots, request)
+        replies = {}
+        if page:
+            # Replies share their root's path prefix; one windowed query
+            # numbers and counts them per thread.
+            paths = [root.path for root in page]
+            thread = Substr('path', 1, PATH_WIDTH)
+            ranked = (
+                comments.filter(path__gt=min(paths), path__lt=max(paths) + ':', depth__gt=0)
+                .annotate(
+                    thread=thread,
+                    position=Window(RowNumber(), partition_by=[thread], order_by=F('path').asc()),
+                    thread_size=Window(Count('pk'), partition_by=[thread]),
+                )
+                .filter(thread__in=paths, position__lte=max(per_thread, 1))
+                .order_by('path')
+            )
+            for reply in ranked:
+                replies.setdefault(reply.thread, []).append(reply)
+        # Sharded, the authors were not joined
+        load_related([*page, *(reply for thread_replies in replies.values() for reply in thread_replies)])
+        for root in page:
+            thread_replies = replies.get(root.path, [])
+            root.reply_count = thread_replies[0].thread_size if thread_replies else 0
+            root.first_replies = thread_replies[:per_thread]
+        return paginator.get_paginated_response(ThreadSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.AllowAny])
+    def likes(self, request, pk=None):
+        """
+        Users who liked the post, newest first (see LikePagination).
+        With `following=first`, the users the viewer follows come first,
+        found with one join against the follow table; each like then says
+        whether the viewer follows its user. With sharded posts, users and
+        follows are on another database than the likes and are matched by
+        id lists instead.
+        """
+        alias = sharding.locate(Post, pk)
+        post = generics.get_object_or_404(sharding.using(Post.objects.only('pk'), alias), pk=pk)
+        likes = sharding.using(Like.objects.filter(post=post), alias).order_by(*LikePagination.ordering)
+        viewer = request.user
+        following_first = request.query_params.get('following') == 'first' and viewer.is_authenticated
+        if alias is None:
+            likes = (
+                likes.filter(user__deleted_at__isnull=True)
+                .select_related('user')
+                .only('pk', 'post_id', 'created_at', 'user__id', 'user__username')
+            )
+            following = Q(user__followers=viewer)
+        else:
+            # Soft-deleted users only wait for the reaper, so they are few
+            deleted = User.all_objects.filter(deleted_at__isnull=False).values_list('pk', flat=True)
+            likes = likes.exclude(user_id__in=list(deleted)).only('pk', 'post_id', 'created_at', 'user_id')
+            if following_first:
+                following = Q(user_id__in=list(viewer.following.values_list('pk', flat=True)))
+        if viewer.is_authenticated:
+            hidden = blocks.hidden_ids(viewer.pk)
+            if hidden:
+                likes = likes.exclude(user_id__in=list(hidden))
+        if following_first:
+            segments = [
+                ('following', likes.filter(following)),
+                # Unsharded, an anti-join probing the follow table's unique index
+                ('others', likes.exclude(following)),
+            ]
+        else:
+            segments = [('all', likes)]
+
+        paginator = LikePagination()
+        page = paginator.paginate_segments(segments, request)
+        if alias is not None:
+            sharding.attach_users(page, 'user')
+        data = LikeSerializer(page, many=True).data
+        if following_first:
+            data = [{**row, 'followed': like.segment == 'following'} for row, like in zip(data, page)]
+        return paginator.get_paginated_response(data)
+
+class LikeThrottle(TokenBucketThrottle):
+    scope = 'like'
+
+class BulkCommentThrottle(TokenBucketThrottle):
+    """
+    One token per comment in the request.
+    """
+    scope = 'comment_bulk'
+
+    def get_cost(self, request, view):
+        return len(request.data) if isinstance(request.data, list) else 1
+
+class CommentViewSet(ShardedViewSetMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     pagination_class = StandardResultsSetPagination
+    throttle_scope = 'comment'
+
+    def get_throttles(self):
+        # Only posting comments is throttled
+        if self.action == 'create':
+            return [TokenBucketThrottle()]
+        if self.action == 'bulk':
+            return [BulkCommentThrottle()]
+        return super().get_throttles()
+
+    def get_queryset(self):
+        # Comments by users the viewer muted or blocked are left out
+        comments = super().get_queryset()
+        hidden = hidden_authors(self.request.user)
+        if hidden:
+            comments = comments.exclude(author_id__in=list(hidden))
+        return comments
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    # One INSERT per batch of BULK_CREATE_BATCH_SIZE rows, not per row
+    @n_plus_one_exempt
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request):
+        """
+        Create a list of comments and replies in one request, authored by the
+        current user.
+        """
+        serializer = self.get_serializer(
+            data=request.data, many=True, max_length=getattr(settings, 'BULK_CREATE_MAX_ITEMS', 1000),
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save(author=request.user)
+        return bulk_response(serializer)
+
+def get_feed_queryset(user, hidden=()):
+    """
+    Posts written by the users that `user` follows, newest first, leaving
+    out the authors in `hidden` (see accounts.blocks), and their comments.
+    Served by the (author, -created_at) index on Post.
+    """
+    following_users = user.following.all()
+    posts = Post.objects.filter(author__in=following_users)
+    if hidden:
+        posts = posts.exclude(author_id__in=list(hidden))
+    return (
+        posts.select_related('author')
+        .prefetch_related(visible_comments(hidden))
+        .order_by('-created_at')
+    )
+
+def get_liked_ids_queryset(user, post_ids):
+    return Like.objects.filter(user=user, post__in=post_ids).values_list('post_id', flat=True).order_by()
+
+def get_liked_ids(user, post_ids):
+    """
+    Ids of the posts among `post_ids` that `user` liked. Likes live on the
+    shards of the posts' authors, so every shard is asked.
+    """
+    return set().union(*sharding.fan_out(
+        lambda alias: get_liked_ids_queryset(user, post_ids).using(alias)
+    ))
+
+def get_sharded_page(request, pagination, rows, hidden=()):
+    """
+    The body of a page of `rows`, a Post or Comment queryset, newest first,
+    when posts are sharded, leaving out the comments of the authors in
+    `hidden`. Each shard returns its count and its newest rows
+    down to the end of the page; the lists are merged with a heap (see
+    posts.sharding).
+    """
+    page, size = page_bounds(request, pagination)
+
+    def newest(alias):
+        on_shard = rows.using(alias).order_by('-created_at', '-pk')
+        return on_shard.count(), list(on_shard[:page * size])
+
+    results = sharding.fan_out(newest)
+    count = sum(shard_count for shard_count, _ in results)
+    newest_rows = sharding.merge_top_k(
+        [shard_rows for _, shard_rows in results], page * size, key=lambda row: (row.created_at, row.pk),
+    )
+    page_rows = load_related(newest_rows[(page - 1) * size:], hidden)
+    serializer = CommentSerializer if rows.model is Comment else PostSerializer
+    return paginated(request, pagination, page, size, count, serializer(page_rows, many=True).data)
+
+def get_sharded_feed_page(request, pagination, hidden):
+    """
+    The body of a feed page when posts are sharded: the newest posts of the
+    followed authors on every shard, merged (see get_sharded_page).
+    """
+    # An id list: the follow table is not on the shards
+    following = list(request.user.following.values_list('pk', flat=True))
+    posts = Post.objects.filter(author_id__in=following)
+    if hidden:
+        posts = posts.exclude(author_id__in=list(hidden))
+    return get_sharded_page(request, pagination, posts, hidden)
+
+def get_unread_queryset(user):
+    return Notification.objects.filter(recipient=user, read=False)
+
+def with_viewer_state(page, liked_ids, unread):
+    """
+    A cached feed page with the viewer's own state added: whether they
+    liked each post, and their unread notification count.
+    """
+    results = [{**post, 'liked': post['id'] in liked_ids} for post in page['results']]
+    return {**page, 'results': results, 'unread_notifications': unread}
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def feed_view(request):
     """
     Returns posts from users that the current user follows,
-    ordered by creation date (most recent first).
+    ordered by creation date (most recent first), with whether
+    the user liked each one and their unread notification count.
+    Posts by users they muted or blocked are left out.
+    Pages are cached per user (see posts.feed_cache). With sharded posts,
+    a page merges every shard's newest posts.
     """
-    following_users = request.user.following.all()
-    posts = Post.objects.filter(author__in=following_users).order_by('-created_at')
-    
-    paginator = StandardResultsSetPagination()
-    paginated_posts = paginator.paginate_queryset(posts, request)
-    serializer = PostSerializer(paginated_posts, many=True)
-    
-    return paginator.get_paginated_response(serializer.data)
+    def compute():
+        hidden = blocks.hidden_ids(request.user.pk)
+        paginator = StandardResultsSetPagination()
+        if sharding.enabled():
+            return get_sharded_feed_page(request, paginator, hidden)
+        posts = get_feed_queryset(request.user, hidden)
+        paginated_posts = paginator.paginate_queryset(posts, request)
+        serializer = PostSerializer(paginated_posts, many=True)
+        return paginator.get_paginated_response(serializer.data).data
+
+    key = feed_cache.page_key(request.user, request.build_absolute_uri())
+    page, outcome = feed_cache.get_or_compute(key, request.user, compute)
+    liked_ids = get_liked_ids(request.user, [post['id'] for post in page['results']])
+    unread = get_unread_queryset(request.user).count()
+    return Response(with_viewer_state(page, liked_ids, unread), headers={'X-Feed-Cache': outcome})
+
+@async_api_view(['GET'])
+async def feed_view_async(request):
+    """
+    feed_view on the async ORM. The async ORM runs a request's queries one
+    at a time in a single thread, so they are awaited one after another.
+    """
+    async def compute():
+        pagination = StandardResultsSetPagination()
+        hidden = await blocks.ahidden_ids(request.user.pk)
+        if sharding.enabled():
+            return await sync_to_async(get_sharded_feed_page)(request, pagination, hidden)
+        page, size = page_bounds(request, pagination)
+        feed = get_feed_queryset(request.user, hidden)
+        # Iterating runs the prefetches too
+        count = await feed.acount()
+        posts = await alist(feed[(page - 1) * size:page * size])
+        await sync_to_async(counters.preload)(posts, 'likes_count')
+        # Everything is loaded; serializing does not touch the database
+        return paginated(request, pagination, page, size, count, PostSerializer(posts, many=True).data)
+
+    key = feed_cache.page_key(request.user, request.build_absolute_uri())
+    page, outcome = await feed_cache.aget_or_compute(key, request.user, compute)
+    post_ids = [post['id'] for post in page['results']]
+    if sharding.enabled():
+        liked_ids = await sync_to_async(get_liked_ids)(request.user, post_ids)
+    else:
+        liked_ids = await alist(get_liked_ids_queryset(request.user, post_ids))
+    unread = await get_unread_queryset(request.user).acount()
+    return json_response(with_viewer_state(page, set(liked_ids), unread), headers={'X-Feed-Cache': outcome})
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+def timeline_response(request, index):
+    """
+    A page of the posts in `index` (a PostTag or Mention queryset), in
+    index order. Soft-deleted posts are left out of their page, and comments
+    by users the viewer muted or blocked are left out of their post.
+    """
+    paginator = TimelinePagination()
+    entries = paginator.paginate_queryset(index.values('post_id', 'created_at'), request)
+    hidden = hidden_authors(request.user)
+    posts = Post.objects.all()
+    if not sharding.enabled():
+        posts = posts.select_related('author').prefetch_related(visible_comments(hidden))
+    posts = sharding.in_bulk(posts, [entry['post_id'] for entry in entries])
+    load_related(list(posts.values()), hidden)
+    page = [posts[entry['post_id']] for entry in entries if entry['post_id'] in posts]
+    return paginator.get_paginated_response(PostSerializer(page, many=True).data)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticatedOrReadOnly])
+def tag_timeline(request, tag):
+    """
+    Posts using #tag, newest first.
+    """
+    tag = Tag.objects.filter(name=tag.lower()).first()
+    return timeline_response(request, PostTag.objects.filter(tag=tag) if tag else PostTag.objects.none())
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def mentions_timeline(request):
+    """
+    Posts mentioning the current user, newest first.
+    """
+    return timeline_response(request, Mention.objects.filter(user=request.user))
+
+def create_like(user, post):
+    """
+    Like `post` as `user`, publishing 'post.liked' in the same transaction.
+    Returns whether the like is new.
+    """
+    # The like on the post's shard, the event on default
+    with sharding.atomic(sharding.shard_of(post)):
+        _, created = post.likes.get_or_create(user=user)
+        if created:
+            events.publish('post.liked', {'post_id': post.pk, 'user_id': user.pk, 'author_id': post.author_id})
+    return created
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([LikeThrottle])
 def like_post(request, pk):
     """
-    Like a post and generate a notification for the post author.
+    Like a post. The post author is notified through the outbox.
     """
-    post = generics.get_object_or_404(Post, pk=pk)
+    post = generics.get_object_or_404(sharding.using(Post.objects, sharding.locate(Post, pk)), pk=pk)
+    if blocks.is_blocked(post.author_id, request.user.pk):
+        raise PermissionDenied('You cannot like posts of this user.')
     
-    # Check if already liked
-    like, created = Like.objects.get_or_create(user=request.user, post=post)
-    
-    if not created:
+    if not create_like(request.user, post):
         return Response({'message': 'You already liked this post'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Create notification for post author (don't notify yourself)
-    if post.author != request.user:
-        Notification.objects.create(
-            recipient=post.author,
-            actor=request.user,
-            verb='liked your post',
-            target=post
-        )
+
+    counters.increment(post, 'likes_count')
     
     return Response({'message': 'Post liked successfully'}, status=status.HTTP_201_CREATED)
 
@@ -94,11 +641,46 @@ def unlike_post(request, pk):
     """
     Unlike a post.
     """
-    post = generics.get_object_or_404(Post, pk=pk)
+    post = generics.get_object_or_404(sharding.using(Post.objects, sharding.locate(Post, pk)), pk=pk)
     
     try:
-        like = Like.objects.get(user=request.user, post=post)
+        like = post.likes.get(user=request.user)
         like.delete()
+        counters.increment(post, 'likes_count', -1)
         return Response({'message': 'Post unliked successfully'}, status=status.HTTP_200_OK)
     except Like.DoesNotExist:
-        return Response({'error': 'You have not liked this post'}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response({'error': 'You have not liked this post'}, status=status.HTTP_400_BAD_REQUEST)
+
+@async_api_view(['POST'], throttle_classes=[LikeThrottle])
+async def like_post_async(request, pk):
+    """
+    like_post on the async ORM.
+    """
+    post = await aget_post_or_404(pk)
+    if await blocks.ais_blocked(post.author_id, request.user.pk):
+        raise PermissionDenied('You cannot like posts of this user.')
+    if not await sync_to_async(create_like)(request.user, post):
+        return json_response({'message': 'You already liked this post'}, status=status.HTTP_400_BAD_REQUEST)
+
+    await sync_to_async(counters.increment)(post, 'likes_count')
+
+    return json_response({'message': 'Post liked successfully'}, status=status.HTTP_201_CREATED)
+
+@async_api_view(['POST'])
+async def unlike_post_async(request, pk):
+    """
+    unlike_post on the async ORM.
+    """
+    post = await aget_post_or_404(pk)
+    deleted, _ = await post.likes.filter(user=request.user).adelete()
+    if not deleted:
+        return json_response({'error': 'You have not liked this post'}, status=status.HTTP_400_BAD_REQUEST)
+    await sync_to_async(counters.increment)(post, 'likes_count', -1)
+    return json_response({'message': 'Post unliked successfully'}, status=status.HTTP_200_OK)
+
+async def aget_post_or_404(pk):
+    alias = await sync_to_async(sharding.locate)(Post, pk)
+    try:
+        return await sharding.using(Post.objects, alias).aget(pk=pk)
+    except Post.DoesNotExist:
+        raise NotFound('No Post matches the given query.')
@@ -0,0 +1,121 @@
+"""
+Helpers for the async API views.
+
+DRF's APIView is synchronous, so the async views are plain Django views that
+do the parts of APIView they need: token authentication, throttling, DRF's
+error bodies, page-number pagination links and rendering with the API's JSON
+renderer. Their responses match those of the sync views they mirror.
+"""
+import functools
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from shared.renderers import ORJSONRenderer
+
+
+renderer = ORJSONRenderer()
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(renderer.render(data), status=status, content_type='application/json', headers=headers)
+
+
+async def authenticate(request):
+    """
+    The user of the request's `Authorization: Token <key>` header, checked
+    like DRF's TokenAuthentication.
+    """
+    auth = get_authorization_header(request).split()
+    if not auth or auth[0].lower() != b'token':
+        raise exceptions.NotAuthenticated()
+    if len(auth) != 2:
+        raise exceptions.AuthenticationFailed('Invalid token header.')
+    try:
+        token = await Token.objects.select_related('user').aget(key=auth[1].decode())
+    except (Token.DoesNotExist, UnicodeError):
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed('User inactive or deleted.')
+    return token.user
+
+
+def async_api_view(methods, throttle_classes=()):
+    """
+    Decorate an async view: allow `methods`, require a token-authenticated
+    user (set as request.user), apply the throttles, and render DRF
+    exceptions raised by the view as DRF would.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            try:
+                if request.method not in methods:
+                    raise exceptions.MethodNotAllowed(request.method)
+                request.user = await authenticate(request)
+                for throttle_class in throttle_classes:
+                    throttle = throttle_class()
+                    # Cache round trips; off the event loop for networked caches
+                    if not await sync_to_async(throttle.allow_request)(request, None):
+                        raise exceptions.Throttled(throttle.wait())
+                return await view(request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                headers = {}
+                if exc.status_code == 401:
+                    headers['WWW-Authenticate'] = 'Token'
+                if getattr(exc, 'wait', None) is not None:
+                    headers['Retry-After'] = str(math.ceil(exc.wait))
+                return json_response({'detail': exc.detail}, status=exc.status_code, headers=headers)
+        return wrapped
+    return decorator
+
+
+def page_bounds(request, pagination):
+    """
+    (page number, page size) requested, with the limits of `pagination`
+    (a PageNumberPagination) applied.
+    """
+    try:
+        page = int(request.GET.get(pagination.page_query_param, 1))
+    except ValueError:
+        raise exceptions.NotFound('Invalid page.')
+    if page < 1:
+        raise exceptions.NotFound('Invalid page.')
+    size = pagination.page_size
+    if pagination.page_size_query_param:
+        try:
+            requested = int(request.GET[pagination.page_size_query_param])
+        except (KeyError, ValueError):
+            requested = 0
+        if requested > 0:
+            size = min(requested, pagination.max_page_size or requested)
+    return page, size
+
+
+def paginated(request, pagination, page, size, count, results):
+    """
+    The body PageNumberPagination.get_paginated_response() would return.
+    Raises NotFound for a page past the last, as DRF does.
+    """
+    if page > max(1, math.ceil(count / size)):
+        raise exceptions.NotFound('Invalid page.')
+    url = request.build_absolute_uri()
+    param = pagination.page_query_param
+    if page * size >= count:
+        next_url = None
+    else:
+        next_url = replace_query_param(url, param, page + 1)
+    if page == 1:
+        previous_url = None
+    elif page == 2:
+        previous_url = remove_query_param(url, param)
+    else:
+        previous_url = replace_query_param(url, param, page - 1)
+    return {'count': count, 'next': next_url, 'previous': previous_url, 'results': results}
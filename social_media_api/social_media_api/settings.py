@@ -10,11 +10,17 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# The repository root holds shared/, the modules every project uses
+REPO_DIR = BASE_DIR.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.append(str(REPO_DIR))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -37,14 +43,19 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'shared',
     'rest_framework',
     'rest_framework.authtoken',
     'accounts',
     'posts',
     'notifications',
+    'analytics',
+    'outbox',
 ]
 
 MIDDLEWARE = [
+    'shared.middleware.RequestMetricsMiddleware',
+    'shared.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +95,16 @@ DATABASES = {
     }
 }
 
+# Read replicas (shared.replicas): list their aliases here, e.g.
+# DATABASES['replica1'] = {...} and DATABASE_REPLICAS = ['replica1']
+DATABASE_ROUTERS = ['posts.sharding.ShardRouter', 'shared.replicas.ReplicaRouter']
+DATABASE_REPLICAS = []
+# Safe requests read from default for this long after the client writes
+REPLICA_PIN_SECONDS = 5
+# Database shards for posts, comments and likes (posts.sharding), e.g.
+# ['default', 'shard1']; append only, then run manage.py rebalance_shards
+DATABASE_SHARDS = []
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -134,4 +155,64 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
-}
\ No newline at end of file
+    # orjson when installed, DRF's stdlib JSON otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'shared.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'shared.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}
+
+# Request metrics
+# RequestMetricsMiddleware samples REQUEST_METRICS_SAMPLE_RATE of requests
+# (default: all of them with DEBUG, 1% otherwise) and logs one JSON line each.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'request_metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Query shapes the N+1 guard never reports. Tagging reads the tags it
+# created back once, after inserting them. Editing a post reads the block
+# lists of the viewer and then of the users the post mentions, one query each
+REQUEST_METRICS_N_PLUS_ONE_ALLOWLIST = [
+    'FROM "posts_tag" WHERE "posts_tag"."name" IN',
+    'FROM "accounts_block" WHERE "accounts_block"."user_id" IN',
+]
+
+# Notification retention
+# Read notifications older than this move from the hot table to monthly buckets
+NOTIFICATIONS_HOT_DAYS = 30
+# Buckets older than this are archived (archive_notifications) or dropped
+NOTIFICATIONS_RETENTION_DAYS = 365
+
+# Token-bucket throttling of write endpoints (social_media_api.throttling)
+# Buckets live in the default cache; use a shared one (Redis, Memcached) in production
+THROTTLE_BUCKETS = {
+    'like': {'RATE': '60/min', 'BURST': 20},
+    'follow': {'RATE': '30/min', 'BURST': 10},
+    'comment': {'RATE': '30/min', 'BURST': 10},
+    # One token per comment; larger requests are always rejected
+    'comment_bulk': {'RATE': '600/h', 'BURST': 200},
+    # Per IP: failed logins cost a password hash each
+    'login': {'RATE': '10/min', 'BURST': 5, 'KEY': 'ip'},
+}
+
+# Startup profile (manage.py startup_profile): modules a new worker must not
+# import while it boots; `startup_profile --check` fails when one is
+STARTUP_LAZY_MODULES = ['PIL']
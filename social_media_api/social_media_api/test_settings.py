@@ -0,0 +1,24 @@
+"""
+Settings for the test suite.
+
+`manage.py test` uses them unless DJANGO_SETTINGS_MODULE says otherwise.
+Other runners need DJANGO_SETTINGS_MODULE=social_media_api.test_settings
+(with pytest-django, in pytest.ini).
+"""
+from .settings import *
+
+
+# Fail the test when a view repeats the same query per row (N+1)
+REQUEST_METRICS_N_PLUS_ONE = 'raise'
+
+# A separate, unreplicated database standing in for a lagging replica
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': BASE_DIR / 'db_replica.sqlite3',
+}
+# Database shards for the sharding tests, which enable DATABASE_SHARDS
+for alias in ('shard1', 'shard2'):
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_{alias}.sqlite3',
+    }
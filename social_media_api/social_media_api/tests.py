@@ -0,0 +1,424 @@
+import io
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.http import JsonResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.translation import gettext_lazy
+from django.urls import path
+from rest_framework import generics, serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from posts.models import Comment, Post
+from shared import startup
+from shared.fields import LazyImageField
+from shared.middleware import NPlusOneError, fingerprint, n_plus_one_exempt
+from shared.renderers import ORJSONParser, ORJSONRenderer, orjson
+from shared.replicas import ReplicaRouter, Route, current_route, pin_key, use_primary
+
+from .throttling import TokenBucketThrottle, rejection_counts
+
+
+class CommentAuthorSerializer(serializers.ModelSerializer):
+    # Touches comment.author without select_related: one query per row
+    author = serializers.StringRelatedField()
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'author']
+
+
+class NPlusOneCommentList(generics.ListAPIView):
+    queryset = Comment.objects.all()
+    serializer_class = CommentAuthorSerializer
+    authentication_classes = []
+
+
+def comment_authors(request):
+    # Not a list view: the guard still covers it
+    return JsonResponse({'authors': [str(comment.author) for comment in Comment.objects.all()]})
+
+
+@n_plus_one_exempt
+def exempt_comment_authors(request):
+    return comment_authors(request)
+
+
+@n_plus_one_exempt
+class ExemptCommentList(NPlusOneCommentList):
+    pass
+
+
+urlpatterns = [
+    path('n-plus-one/', NPlusOneCommentList.as_view(), name='n-plus-one'),
+    path('n-plus-one/authors/', comment_authors, name='n-plus-one-authors'),
+    path('n-plus-one/exempt-authors/', exempt_comment_authors, name='n-plus-one-exempt-authors'),
+    path('n-plus-one/exempt/', ExemptCommentList.as_view(), name='n-plus-one-exempt'),
+]
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+class RequestMetricsMiddlewareTestCase(TestCase):
+    """
+    Tests for the per-request query and timing instrumentation.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(3):
+            author = CustomUser.objects.create_user(username=f'author{i}', password='testpass123')
+            post = Post.objects.create(author=author, title=f'Post {i}', content='content')
+            Comment.objects.create(post=post, author=author, content='comment')
+
+    def test_server_timing_header(self):
+        """
+        Sampled responses carry db, serialize, render and total timings.
+        """
+        with self.assertLogs('request_metrics', level='INFO'):
+            response = self.client.get('/api/posts/')
+
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertGreater(response.wsgi_request.metrics.query_count, 0)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0.0, REQUEST_METRICS_N_PLUS_ONE=None)
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get('/api/posts/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_fingerprint_ignores_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a'"),
+            fingerprint("SELECT * FROM t WHERE id = 22 AND name = 'b'"),
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+        )
+
+
+@override_settings(ROOT_URLCONF=__name__, REQUEST_METRICS_N_PLUS_ONE='raise', REQUEST_METRICS_SAMPLE_RATE=1.0)
+class NPlusOneGuardTestCase(TestCase):
+    """
+    Tests for the N+1 guard.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(3):
+            author = CustomUser.objects.create_user(username=f'author{i}', password='testpass123')
+            post = Post.objects.create(author=author, title=f'Post {i}', content='content')
+            Comment.objects.create(post=post, author=author, content='comment')
+
+    def test_raise_mode_fails_with_call_stack(self):
+        """
+        The error names the repeated query and the project frame that issued it.
+        """
+        with self.assertLogs('request_metrics', level='INFO'):
+            with self.assertRaises(NPlusOneError) as cm:
+                self.client.get('/n-plus-one/')
+
+        message = str(cm.exception)
+        self.assertIn('3x SELECT', message)
+        self.assertIn('accounts_customuser', message)
+        # The test frame that made the request and the DRF field that looped
+        self.assertIn('tests.py', message)
+        self.assertIn('relations.py', message)
+
+    @override_settings(REQUEST_METRICS_N_PLUS_ONE='report')
+    def test_report_mode_logs_warning(self):
+        with self.assertLogs('request_metrics', level='WARNING') as logs:
+            response = self.client.get('/n-plus-one/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('repeated queries' in line for line in logs.output))
+
+    def test_function_view_is_guarded(self):
+        with self.assertLogs('request_metrics', level='INFO'):
+            with self.assertRaises(NPlusOneError):
+                self.client.get('/n-plus-one/authors/')
+
+    def test_exempt_views_are_ignored(self):
+        for url in ('/n-plus-one/exempt/', '/n-plus-one/exempt-authors/'):
+            with self.subTest(url=url), self.assertLogs('request_metrics', level='INFO'):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+    @override_settings(REQUEST_METRICS_N_PLUS_ONE_ALLOWLIST=['n-plus-one'])
+    def test_allowlisted_view_is_ignored(self):
+        with self.assertLogs('request_metrics', level='INFO'):
+            response = self.client.get('/n-plus-one/')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(REQUEST_METRICS_N_PLUS_ONE_ALLOWLIST=['FROM "accounts_customuser"'])
+    def test_allowlisted_query_is_ignored(self):
+        with self.assertLogs('request_metrics', level='INFO'):
+            response = self.client.get('/n-plus-one/')
+        self.assertEqual(response.status_code, 200)
+
+
+@skipIf(orjson is None, 'orjson is not installed')
+class ORJSONRendererTestCase(SimpleTestCase):
+    """
+    Tests for the orjson renderer and parser.
+    """
+
+    def test_matches_json_renderer(self):
+        data = {
+            'results': [{'id': 1, 'title': 'Caf\u00e9 \u2028 line', 'price': Decimal('1.50'), 'label': gettext_lazy('Post')}],
+            'key': uuid.UUID(int=1),
+            3: None,
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_datetimes_are_native(self):
+        moment = datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+        self.assertEqual(ORJSONRenderer().render({'at': moment}), b'{"at":"2026-01-02T03:04:05Z"}')
+
+    def test_indent_falls_back(self):
+        rendered = ORJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(rendered, JSONRenderer().render({'a': 1}, 'application/json; indent=2'))
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO('{"title": "\u00e9"}'.encode())), {'title': '\u00e9'})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"value": NaN}'))
+
+    def test_api_uses_orjson(self):
+        client = APIClient()
+        response = client.post('/api/login/', b'{not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@override_settings(THROTTLE_BUCKETS={
+    'like': {'RATE': '6/min', 'BURST': 3},
+    'login': {'RATE': '60/min', 'BURST': 2, 'KEY': 'ip'},
+})
+class TokenBucketThrottleTestCase(TestCase):
+    """
+    Tests for the cache-backed token-bucket throttle.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.clock = Clock()
+        TokenBucketThrottle.timer = self.clock
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        self.posts = [Post.objects.create(author=self.user, title=f'Post {i}', content='content') for i in range(6)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        TokenBucketThrottle.timer = time.time
+        cache.clear()
+
+    def like(self, index):
+        return self.client.post(f'/api/posts/{self.posts[index].pk}/like/')
+
+    def test_burst_then_refill(self):
+        statuses = [self.like(index).status_code for index in range(4)]
+        self.assertEqual(statuses, [201, 201, 201, 429])
+
+        # One token every 10 seconds
+        self.clock.now += 5
+        response = self.like(3)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '5')
+
+        self.clock.now += 5
+        self.assertEqual(self.like(3).status_code, 201)
+        self.assertEqual(self.like(4).status_code, 429)
+
+        # A long pause refills the bucket but never beyond its burst
+        self.clock.now += 600
+        statuses = [self.like(index).status_code for index in (4, 5, 0)]
+        self.assertEqual(statuses, [201, 201, 400])
+        self.assertEqual(rejection_counts(['like']), {'like': 3})
+
+    def test_buckets_are_per_user(self):
+        for index in range(3):
+            self.like(index)
+        other = CustomUser.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.like(0).status_code, 201)
+
+    def test_login_is_throttled_per_ip(self):
+        client = APIClient()
+        credentials = {'username': 'user', 'password': 'wrong'}
+        statuses = [client.post('/api/login/', credentials, REMOTE_ADDR='10.0.0.1').status_code for _ in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+        self.assertEqual(client.post('/api/login/', credentials, REMOTE_ADDR='10.0.0.2').status_code, 401)
+
+    def test_decision_is_one_cache_round_trip(self):
+        self.like(0)
+        calls = []
+        original = cache.incr
+
+        def counting_incr(*args, **kwargs):
+            calls.append(args)
+            return original(*args, **kwargs)
+
+        with mock.patch.object(TokenBucketThrottle.cache, 'incr', counting_incr):
+            self.like(1)
+        self.assertEqual(len(calls), 1)
+
+    def test_redis_decision_is_one_script_call(self):
+        client = mock.Mock()
+        client.eval.side_effect = [0, 2500]
+        backend = mock.Mock()
+        backend._cache.get_client.return_value = client
+        backend.make_and_validate_key.side_effect = lambda key: f':1:{key}'
+        with mock.patch.object(TokenBucketThrottle, 'cache', backend):
+            self.assertEqual(self.like(0).status_code, 201)
+            response = self.like(1)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(client.eval.call_count, 2)
+        self.assertEqual(client.eval.call_args.args[2:4], (
+            f':1:throttle:like:user:{self.user.pk}', ':1:throttle:rejected:like',
+        ))
+        backend.incr.assert_not_called()
+
+    @override_settings(THROTTLE_BUCKETS={'like': {'RATE': '2000/s'}})
+    def test_rates_finer_than_a_millisecond_are_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.like(0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TestCase):
+    """
+    Tests for read replica routing. The `replica` test database is not
+    replicated, so it behaves like a replica lagging behind forever.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='user', password='testpass123')
+        Post.objects.create(author=self.user, title='Only on the primary', content='content')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_safe_requests_read_from_replica(self):
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_writes_pin_the_client_to_primary(self):
+        response = self.client.post('/api/posts/', {'title': 'New', 'content': 'content'})
+        self.assertEqual(response.status_code, 201)
+
+        # Read your writes despite the lagging replica
+        self.assertEqual(self.client.get('/api/posts/').data['count'], 2)
+
+        # Other clients are not pinned, even behind the same IP
+        other = APIClient()
+        self.assertEqual(other.get('/api/posts/').data['count'], 0)
+
+        # Once the window is over the client reads from the replica again
+        cache.clear()
+        self.assertEqual(self.client.get('/api/posts/').data['count'], 0)
+
+    def test_pin_follows_the_user_to_other_clients(self):
+        self.client.post('/api/posts/', {'title': 'New', 'content': 'content'})
+
+        laptop = APIClient(REMOTE_ADDR='10.0.0.9')
+        laptop.force_authenticate(self.user)
+        self.assertEqual(laptop.get('/api/posts/').data['count'], 2)
+
+    def test_register_then_read_with_the_new_token(self):
+        client = APIClient()
+        response = client.post('/api/register/', {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password': 'testpass123',
+        })
+        self.assertEqual(response.status_code, 201)
+
+        # The token is only on the primary; registering pinned it
+        client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+        response = client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['username'], 'newcomer')
+
+    def test_login_pins_the_token_it_returns(self):
+        client = APIClient()
+        response = client.post('/api/login/', {'username': 'user', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(cache.get(pin_key(f"Token {response.data['token']}")))
+
+    def test_router_outside_requests(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))
+
+        token = current_route.set(Route('replica'))
+        try:
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            with use_primary():
+                self.assertIsNone(router.db_for_read(Post))
+            # A write sends the rest of the request's reads to default
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertIsNone(router.db_for_read(Post))
+        finally:
+            current_route.reset(token)
+
+
+
+class StartupProfileTestCase(SimpleTestCase):
+    """
+    Tests for the startup profile and the modules kept out of boot.
+    """
+
+    def test_profile(self):
+        profile = startup.profile(settings.SETTINGS_MODULE, settings.BASE_DIR)
+
+        self.assertEqual(set(profile['phases']), set(startup.PHASES))
+        self.assertIn('posts', profile['apps'])
+        self.assertEqual(profile['modules']['posts.views']['imported_by'], 'posts.urls')
+        self.assertGreater(profile['modules']['posts.urls']['cumulative_ms'], profile['modules']['posts.urls']['self_ms'])
+        # A regression here costs every new worker, and every manage.py command
+        self.assertEqual(startup.imported_lazy_modules(profile['modules'], settings.STARTUP_LAZY_MODULES), {})
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('startup_profile', '--repeat', '1', '--json', '--check', '--budget', '60000', stdout=out)
+        profile = json.loads(out.getvalue())
+        self.assertEqual(profile['imported_lazy_modules'], {})
+        self.assertEqual(len(profile['runs']['boot_ms']), 1)
+
+    def test_image_field_check_without_pillow(self):
+        field = CustomUser._meta.get_field('profile_picture')
+        self.assertIsInstance(field, LazyImageField)
+        self.assertEqual(field.deconstruct()[1], 'django.db.models.ImageField')
+        self.assertEqual(field.check(), [])
+
+        with mock.patch('shared.fields.find_spec', return_value=None):
+            with mock.patch.dict(sys.modules, {'PIL': None}):
+                errors = field.check()
+        self.assertEqual([error.id for error in errors], ['fields.E210'])
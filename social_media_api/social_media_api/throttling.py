@@ -0,0 +1,190 @@
+"""
+Token-bucket throttling backed by the Django cache.
+
+Each (scope, client) pair has a bucket of BURST tokens that refills at RATE.
+The bucket is stored as a single integer, its "theoretical arrival time"
+(GCRA): the time in milliseconds at which the bucket would be full again.
+Taking a token adds one emission interval (period / rate) to it, and the
+request is allowed if the result is at most BURST intervals ahead of now.
+
+With Django's Redis cache backend the whole decision runs on the server as
+one Lua script (GCRA_SCRIPT): read the bucket, clamp it to now if it has
+refilled, then either store the new arrival time or count the rejection. That
+is one round trip whatever the outcome, and atomic across processes.
+
+Other backends use `cache.incr` to add the interval, which needs no lock
+across processes either but writes again on the uncommon paths: the first
+request and the first after the bucket filled up (re-anchoring it at now),
+and a rejection, which refunds the token so rejected requests do not drain
+the bucket further, and counts it. Memcached works this way; the default
+LocMemCache only within one process, e.g. in tests.
+
+A request can cost more than one token (see `get_cost`), e.g. one per item
+of a bulk request. One that costs more than BURST tokens is always rejected.
+
+Settings (THROTTLE_BUCKETS), per scope:
+    RATE   'requests/period', with period one of s, m, h, d
+    BURST  bucket size (default: the number of requests in RATE)
+    KEY    'user' (the user id, or the IP for anonymous requests) or 'ip'
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Buckets outlive the time they take to refill, so a client sitting at the
+# limit keeps its state instead of getting a fresh burst when the key expires
+MIN_TIMEOUT = 3600
+
+# KEYS: the bucket, the scope's rejection counter. ARGV: now, the request's
+# cost and the burst (all in ms), the bucket's timeout (ms). Returns 0 when
+# the request is allowed, else the ms to wait.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local arrival = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now) + tonumber(ARGV[2])
+local wait = arrival - tonumber(ARGV[3]) - now
+if wait > 0 then
+    redis.call('INCR', KEYS[2])
+    return wait
+end
+redis.call('SET', KEYS[1], string.format('%d', arrival), 'PX', ARGV[4])
+return 0
+"""
+
+
+def parse_rate(rate):
+    """
+    '30/min' -> (30, 60): requests per period in seconds.
+    """
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+def redis_client(backend):
+    """
+    The redis-py client behind Django's Redis cache backend; None for other
+    backends.
+    """
+    get_client = getattr(getattr(backend, '_cache', None), 'get_client', None)
+    return get_client(write=True) if get_client else None
+
+
+def rejections_key(scope):
+    return f'throttle:rejected:{scope}'
+
+
+def rejection_counts(scopes=None):
+    """
+    {scope: rejected requests} across every process sharing the cache.
+    """
+    scopes = list(getattr(settings, 'THROTTLE_BUCKETS', {})) if scopes is None else scopes
+    counts = cache.get_many([rejections_key(scope) for scope in scopes])
+    return {scope: counts.get(rejections_key(scope), 0) for scope in scopes}
+
+
+def reset_rejection_counts(scopes=None):
+    scopes = list(getattr(settings, 'THROTTLE_BUCKETS', {})) if scopes is None else scopes
+    cache.delete_many([rejections_key(scope) for scope in scopes])
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles by `scope`, or by the view's `throttle_scope` when the class
+    does not set one. Scopes missing from THROTTLE_BUCKETS are not throttled.
+    """
+    scope = None
+    cache = cache
+    timer = time.time
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_config(self, view):
+        scope = self.scope or getattr(view, 'throttle_scope', None)
+        config = getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope)
+        if config is None:
+            return None, None
+        num_requests, period = parse_rate(config['RATE'])
+        if num_requests < 1 or period * 1000 < num_requests:
+            # Buckets count in whole milliseconds per token
+            raise ImproperlyConfigured(
+                f"THROTTLE_BUCKETS['{scope}']: RATE {config['RATE']!r} must allow 1 to "
+                f"{period * 1000} requests per {period}s."
+            )
+        return scope, {
+            'interval': period * 1000 // num_requests,
+            'burst': config.get('BURST', num_requests),
+            'key': config.get('KEY', 'user'),
+        }
+
+    def get_cost(self, request, view):
+        """
+        Tokens the request takes.
+        """
+        return 1
+
+    def get_cache_key(self, request, scope, config):
+        if config['key'] == 'user' and request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{scope}:{ident}'
+
+    def allow_request(self, request, view):
+        scope, config = self.get_config(view)
+        if scope is None:
+            return True
+
+        key = self.get_cache_key(request, scope, config)
+        interval, burst = config['interval'], config['burst']
+        cost = self.get_cost(request, view)
+        now = int(self.timer() * 1000)
+        timeout = max(MIN_TIMEOUT, 2 * burst * interval // 1000)
+        if cost > burst:
+            # Would not fit in a full bucket either: no point waiting
+            self.count_rejection(scope)
+            return False
+
+        client = redis_client(self.cache)
+        if client is not None:
+            wait = client.eval(
+                GCRA_SCRIPT, 2,
+                self.cache.make_and_validate_key(key), self.cache.make_and_validate_key(rejections_key(scope)),
+                now, cost * interval, burst * interval, timeout * 1000,
+            )
+            if wait:
+                self.retry_after = wait / 1000
+            return not wait
+
+        try:
+            arrival = self.cache.incr(key, cost * interval)
+        except ValueError:
+            # First request from this client: its bucket starts full
+            self.cache.add(key, now + cost * interval, timeout)
+            return True
+
+        if arrival <= now + cost * interval:
+            # The bucket had refilled completely; anchor it at now
+            self.cache.set(key, now + cost * interval, timeout)
+            return True
+        if arrival <= now + burst * interval:
+            return True
+
+        self.cache.decr(key, cost * interval)
+        self.retry_after = (arrival - burst * interval - now) / 1000
+        self.count_rejection(scope)
+        return False
+
+    def count_rejection(self, scope):
+        try:
+            self.cache.incr(rejections_key(scope))
+        except ValueError:
+            self.cache.add(rejections_key(scope), 1, None)
+
+    def wait(self):
+        return self.retry_after
@@ -5,5 +5,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('accounts.urls')),
     path('api/', include('posts.urls')),
+    path('api/analytics/', include('analytics.urls')),
     path('notifications/', include('notifications.urls')),
 ]
\ No newline at end of file